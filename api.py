@@ -1,7 +1,7 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional, Dict, Any
 import asyncio
 import threading
@@ -9,15 +9,28 @@ from contextlib import asynccontextmanager
 from datetime import datetime
 import pandas as pd
 import numpy as np
-import io
+import time
 
 from src.pipeline import MarketDataPipeline
-from src.storage import DataStore
+from src.storage import get_data_store, close_data_stores, RetentionPolicy
+from src.data_ingestion import collector_registry
+from src.cache import AnalyticsCache
+from src.broadcast import AnalyticsBroadcaster
+from src.analytics import PairsAnalytics, ONLINE_ESTIMATORS
+from src.archive import HAS_PYARROW
+from src.upload import UploadJob, ingest_ohlc_file
+from src.export import estimate_hedge_ratio, estimate_online_hedge_ratio, iter_spread_frames, split_frame, iter_csv, iter_parquet
+from src.screener import run_screener
+from src.compute import get_compute_pool, close_compute_pool
 
 class PipelineConfig(BaseModel):
     symbol_a: str
     symbol_b: str
     timeframes: List[str] = ['1s', '1m', '5m']
+    z_score_window: int = 20
+    z_score_threshold: Optional[float] = 2.0
+    regression_type: str = 'ols'
+    hedge_window: int = 200
 
 class AnalyticsRequest(BaseModel):
     symbol_a: str
@@ -28,18 +41,65 @@ class AnalyticsRequest(BaseModel):
     z_score_threshold: float = 2.0
     regression_type: str = 'ols'
 
+class ExportRequest(AnalyticsRequest):
+    format: str = 'csv'
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    chunk_size: int = 50000
+
+class ScreenerRequest(BaseModel):
+    symbols: List[str]
+    timeframe: str = '1m'
+    limit: int = 1000
+    min_correlation: float = 0.7
+    max_candidates: int = 200
+    window: int = 20
+    top: int = 20
+
+DB_PATH = "market_data.db"
+# Raw ticks 24h, 1s bars 3 days (rolled up to 1m first), 1m and coarser bars forever
+RETENTION_POLICY = RetentionPolicy()
+RETENTION_INTERVAL = 900
+# Huber fits and large ADF batches run in this many worker processes (None: one per core, less one)
+COMPUTE_WORKERS = None
+COMPUTE_MAX_PENDING = 64
+
 pipelines: Dict[str, MarketDataPipeline] = {}
+# Computes analytics for pairs without a live pipeline, reading the shared store
+analysis_pipeline: Optional[MarketDataPipeline] = None
 pipeline_lock = asyncio.Lock()
+analytics_cache = AnalyticsCache(max_entries=256)
+upload_jobs: Dict[str, UploadJob] = {}
+
+def on_bars_written(timeframe: str, symbols: List[str], closed: bool):
+    for symbol in symbols:
+        analytics_cache.invalidate(symbol, timeframe)
+    analytics_broadcaster.notify(timeframe, symbols, closed)
+
+async def run_retention_periodically():
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL)
+        try:
+            await asyncio.to_thread(get_data_store(DB_PATH).apply_retention, RETENTION_POLICY)
+        except Exception as e:
+            print(f"Error in retention job: {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Starting up FastAPI backend...")
+    # Tables and the read pool are set up once here instead of on every request
+    get_data_store(DB_PATH)
+    get_compute_pool(COMPUTE_WORKERS, COMPUTE_MAX_PENDING).warm_up()
+    retention_task = asyncio.create_task(run_retention_periodically())
     yield
     print("Shutting down...")
+    retention_task.cancel()
     global pipelines
     for key, p in pipelines.items():
         if p and p.running:
             await p.stop()
+    close_data_stores()
+    close_compute_pool()
 
 app = FastAPI(title="Gemscap API", lifespan=lifespan)
 print("--------------------------------------------------")
@@ -70,11 +130,20 @@ async def start_pipeline(config: PipelineConfig, background_tasks: BackgroundTas
     async with pipeline_lock:
         if key in pipelines and pipelines[key].running:
              return {"status": "already_running", "message": f"Pipeline for {key} is already running"}
-            
-        p = MarketDataPipeline(
-            symbols=[config.symbol_a.lower(), config.symbol_b.lower()],
-            db_path="market_data.db"
-        )
+        
+        try:
+            p = MarketDataPipeline(
+                symbols=[config.symbol_a.lower(), config.symbol_b.lower()],
+                data_store=get_data_store(DB_PATH),
+                compute_pool=get_compute_pool(),
+                z_score_window=config.z_score_window,
+                z_score_threshold=config.z_score_threshold,
+                regression_type=config.regression_type,
+                hedge_window=config.hedge_window
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        p.add_bar_listener(on_bars_written)
         pipelines[key] = p
         
         background_tasks.add_task(p.start, config.timeframes)
@@ -110,117 +179,170 @@ async def get_status():
         if p.running:
             active_pairs.append({
                 "key": key,
-                "symbols": p.symbols
+                "symbols": p.symbols,
+                "persistence": p.get_persist_stats(),
+                "spread": recursive_sanitize({tf: serialize_state(state) for tf, state in p.get_spread_states().items()})
             })
     return {
         "running": len(active_pairs) > 0,
-        "active_pairs": active_pairs
+        "active_pairs": active_pairs,
+        "collectors": collector_registry.get_status(),
+        "compute": get_compute_pool().get_stats(),
+        "retention": {
+            "policy": RETENTION_POLICY.to_dict(),
+            "last_run": get_data_store(DB_PATH).last_retention
+        }
     }
 
-@app.post("/analytics")
-async def get_analytics(req: AnalyticsRequest):
-    global pipelines
+def serialize_series(series):
+    return series.where(pd.notnull(series), None).tolist() if hasattr(series, 'tolist') else []
+
+def serialize_ohlcv(df):
+    if df is None or df.empty: return []
+    df = df.reset_index()
+    return df.apply(lambda x: {
+        'time': x['timestamp'].isoformat() if hasattr(x['timestamp'], 'isoformat') else str(x['timestamp']),
+        'open': x['open'],
+        'high': x['high'],
+        'low': x['low'],
+        'close': x['close'],
+        'volume': x['volume']
+    }, axis=1).tolist()
+
+def recursive_sanitize(obj):
+    if isinstance(obj, (bool, np.bool_)):
+        return bool(obj)
+    elif isinstance(obj, (float, np.floating)):
+        if pd.isna(obj) or np.isnan(obj) or np.isinf(obj):
+            return None
+        return float(obj)
+    elif isinstance(obj, (int, np.integer)):
+        return int(obj)
+    elif isinstance(obj, dict):
+        return {k: recursive_sanitize(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [recursive_sanitize(v) for v in obj]
+    elif isinstance(obj, np.ndarray):
+        return [recursive_sanitize(v) for v in obj.tolist()]
+    return obj
+
+def serialize_state(state: Optional[dict]) -> Optional[dict]:
+    if state is None:
+        return None
+    state = dict(state)
+    if hasattr(state.get('timestamp'), 'isoformat'):
+        state['timestamp'] = state['timestamp'].isoformat()
+    return state
+
+def build_analytics_result(analytics: dict) -> dict:
+    live_spread = analytics.get('live_spread') or {}
+    result = {
+        "hedge_ratio": analytics.get('hedge_ratio'),
+        "timestamps": [t.isoformat() for t in analytics.get('timestamps', [])],
+        "spread": serialize_series(analytics.get('spread')),
+        "z_score": serialize_series(analytics.get('z_score')),
+        "rolling_adf": serialize_series(analytics.get('rolling_adf')),
+        "rolling_adf_p_value": serialize_series(analytics.get('rolling_adf_p_value')),
+        "rolling_half_life": serialize_series(analytics.get('rolling_half_life')),
+        "price_a": serialize_series(analytics.get('price_a')),
+        "price_b": serialize_series(analytics.get('price_b')),
+        "correlation": analytics.get('correlation'),
+        "ohlcv_a": serialize_ohlcv(analytics.get('ohlcv_a')),
+        "ohlcv_b": serialize_ohlcv(analytics.get('ohlcv_b')),
+        "metrics": {
+            "current_z_score": live_spread.get('z_score'),
+            "spread_mean": live_spread.get('mean'),
+            "spread_std": live_spread.get('std'),
+            "half_life": analytics.get('half_life')
+        }
+    }
     
-    key = f"{req.symbol_a.lower()}-{req.symbol_b.lower()}"
-    req_pipeline = pipelines.get(key)
-    created_temp = False
+    result['stats_a'] = analytics.get('stats_a')
+    result['stats_b'] = analytics.get('stats_b')
     
-    if not req_pipeline:
-        req_pipeline = MarketDataPipeline(
-            symbols=[req.symbol_a.lower(), req.symbol_b.lower()],
-            db_path="market_data.db"
+    result['online'] = serialize_state(analytics.get('online'))
+    result['live_spread'] = serialize_state(analytics.get('live_spread'))
+    
+    return recursive_sanitize(result)
+
+def get_analytics_pipeline(symbol_a: str, symbol_b: str) -> MarketDataPipeline:
+    global analysis_pipeline
+    
+    # A live pipeline also carries online hedge ratio state for its pair
+    req_pipeline = pipelines.get(f"{symbol_a.lower()}-{symbol_b.lower()}")
+    if req_pipeline:
+        return req_pipeline
+    
+    if analysis_pipeline is None:
+        analysis_pipeline = MarketDataPipeline(
+            symbols=[],
+            buffer_size=1,
+            data_store=get_data_store(DB_PATH),
+            compute_pool=get_compute_pool()
         )
-        created_temp = True
+    return analysis_pipeline
+
+async def get_cached_analytics(req: AnalyticsRequest) -> Optional[dict]:
+    cache_key = AnalyticsCache.make_key(req.symbol_a, req.symbol_b, req.timeframe, req.window, req.limit, req.regression_type)
+    result = analytics_cache.get(cache_key)
+    if result is not None:
+        return result
+    
+    generation = analytics_cache.generation(cache_key)
+    started = time.perf_counter()
+    
+    req_pipeline = get_analytics_pipeline(req.symbol_a, req.symbol_b)
+    analytics = await asyncio.to_thread(
+        req_pipeline.calculate_pairs_analytics,
+        req.symbol_a.lower(),
+        req.symbol_b.lower(),
+        req.timeframe,
+        req.window,
+        req.limit,
+        req.regression_type
+    )
     
+    if not analytics:
+        return None
+    
+    result = await asyncio.to_thread(build_analytics_result, analytics)
+    
+    analytics_cache.put(cache_key, result, time.perf_counter() - started, generation)
+    return result
+
+def load_recent_alerts(limit: int = 5) -> List[dict]:
     try:
-        analytics = await asyncio.to_thread(
-            req_pipeline.calculate_pairs_analytics,
-            req.symbol_a.lower(),
-            req.symbol_b.lower(),
-            req.timeframe,
-            req.window,
-            req.limit,
-            req.regression_type
-        )
-        
-        if not analytics:
-            return {"status": "no_data", "message": "Not enough data for analytics"}
-            
-        def serialize_series(series):
-            return series.where(pd.notnull(series), None).tolist() if hasattr(series, 'tolist') else []
-
-        def serialize_ohlcv(df):
-            if df is None or df.empty: return []
-            df = df.reset_index()
-            return df.apply(lambda x: {
-                'time': x['timestamp'].isoformat() if hasattr(x['timestamp'], 'isoformat') else str(x['timestamp']),
-                'open': x['open'],
-                'high': x['high'],
-                'low': x['low'],
-                'close': x['close'],
-                'volume': x['volume']
-            }, axis=1).tolist()
+        alerts_df = get_data_store(DB_PATH).get_alerts(limit=limit)
+        if not alerts_df.empty:
+            alerts_df['timestamp'] = alerts_df['timestamp'].apply(lambda x: x.isoformat() if pd.notnull(x) else str(x))
+            return alerts_df.to_dict(orient='records')
+        return []
+    except:
+        return []
 
-        def recursive_sanitize(obj):
-            if isinstance(obj, (float, np.floating)):
-                if pd.isna(obj) or np.isnan(obj) or np.isinf(obj):
-                    return None
-                return float(obj)
-            elif isinstance(obj, (int, np.integer)):
-                return int(obj)
-            elif isinstance(obj, dict):
-                return {k: recursive_sanitize(v) for k, v in obj.items()}
-            elif isinstance(obj, (list, tuple)):
-                return [recursive_sanitize(v) for v in obj]
-            elif isinstance(obj, np.ndarray):
-                return [recursive_sanitize(v) for v in obj.tolist()]
-            return obj
+async def compute_push_payload(req: AnalyticsRequest) -> Optional[dict]:
+    cached = await get_cached_analytics(req)
+    if not cached:
+        return None
+    
+    payload = dict(cached)
+    payload['alerts'] = await asyncio.to_thread(load_recent_alerts)
+    return recursive_sanitize(payload)
 
-        result = {
-            "hedge_ratio": analytics.get('hedge_ratio'),
-            "timestamps": [t.isoformat() for t in analytics.get('timestamps', [])],
-            "spread": serialize_series(analytics.get('spread')),
-            "z_score": serialize_series(analytics.get('z_score')),
-            "price_a": serialize_series(analytics.get('price_a')),
-            "price_b": serialize_series(analytics.get('price_b')),
-            "correlation": analytics.get('correlation'),
-            "ohlcv_a": serialize_ohlcv(analytics.get('ohlcv_a')),
-            "ohlcv_b": serialize_ohlcv(analytics.get('ohlcv_b')),
-            "metrics": {
-                "current_z_score": analytics.get('z_score').iloc[-1] if analytics.get('z_score') is not None and len(analytics.get('z_score')) > 0 else None,
-                "half_life": analytics.get('half_life')
-            }
-        }
+analytics_broadcaster = AnalyticsBroadcaster(compute_push_payload)
+
+@app.post("/analytics")
+async def get_analytics(req: AnalyticsRequest):
+    try:
+        cached = await get_cached_analytics(req)
         
-        result['stats_a'] = analytics.get('stats_a')
-        result['stats_b'] = analytics.get('stats_b')
+        if not cached:
+            return {"status": "no_data", "message": "Not enough data for analytics"}
         
-        current_z = result['metrics']['current_z_score']
-        if current_z is not None and abs(current_z) > req.z_score_threshold:
-            ds = DataStore("market_data.db")
-            try:
-                msg = f"Z-Score Alert: {req.symbol_a}/{req.symbol_b} z-score = {current_z:.2f} (threshold: {req.z_score_threshold})"
-                ds.insert_alert(
-                    timestamp=datetime.now(),
-                    symbol=f"{req.symbol_a}-{req.symbol_b}",
-                    alert_type="Z-SCORE",
-                    message=msg
-                )
-            finally:
-                ds.close()
-
-        ds = DataStore("market_data.db")
-        try:
-            alerts_df = ds.get_alerts(limit=5)
-            if not alerts_df.empty:
-                alerts_df['timestamp'] = alerts_df['timestamp'].apply(lambda x: x.isoformat() if pd.notnull(x) else str(x))
-                result['alerts'] = alerts_df.to_dict(orient='records')
-            else:
-                result['alerts'] = []
-        except:
-            result['alerts'] = []
-        finally:
-            ds.close()
+        # Cached results are shared between requests; alerts are added to a copy
+        result = dict(cached)
+        
+        result['alerts'] = load_recent_alerts()
         
         return recursive_sanitize(result)
         
@@ -234,73 +356,124 @@ async def get_analytics(req: AnalyticsRequest):
         print(f"Error in /analytics: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/cache")
+async def get_cache_stats():
+    return analytics_cache.get_stats()
+
+@app.websocket("/ws/analytics")
+async def analytics_ws(websocket: WebSocket):
+    # The client sends an AnalyticsRequest as JSON to subscribe (and again to change it);
+    # the server replies with a snapshot, then pushes deltas at every bar close
+    await websocket.accept()
+    subscription = None
+    receiver = None
+    
+    try:
+        req = AnalyticsRequest(**(await websocket.receive_json()))
+        subscription = await analytics_broadcaster.subscribe(req)
+        receiver = asyncio.create_task(websocket.receive_json())
+        
+        while True:
+            sender = asyncio.create_task(subscription[1].get())
+            done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            
+            if sender in done:
+                await websocket.send_json(sender.result())
+            else:
+                sender.cancel()
+            
+            if receiver in done:
+                req = AnalyticsRequest(**receiver.result())
+                analytics_broadcaster.unsubscribe(*subscription)
+                subscription = await analytics_broadcaster.subscribe(req)
+                receiver = asyncio.create_task(websocket.receive_json())
+    
+    except WebSocketDisconnect:
+        pass
+    except ValidationError as e:
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close(code=1008)
     finally:
-        if created_temp and req_pipeline:
-            req_pipeline.close()
+        if receiver and not receiver.done():
+            receiver.cancel()
+        if subscription:
+            analytics_broadcaster.unsubscribe(*subscription)
+
+@app.get("/ws/analytics/stats")
+async def get_push_stats():
+    return analytics_broadcaster.get_stats()
 
 @app.post("/analytics/export")
-async def export_analytics(request: AnalyticsRequest):
-    global pipelines
+async def export_analytics(request: ExportRequest):
+    if request.format not in ('csv', 'parquet'):
+        raise HTTPException(status_code=400, detail="Unsupported export format. Use csv or parquet.")
+    if request.format == 'parquet' and not HAS_PYARROW:
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow")
     
-    key = f"{request.symbol_a.lower()}-{request.symbol_b.lower()}"
-    req_pipeline = pipelines.get(key)
-    created_temp = False
+    symbol_a, symbol_b = request.symbol_a.lower(), request.symbol_b.lower()
     
-    if not req_pipeline:
-        req_pipeline = MarketDataPipeline(
-            symbols=[request.symbol_a.lower(), request.symbol_b.lower()],
-            db_path="market_data.db"
-        )
-        created_temp = True
-        
     try:
-        data = await asyncio.to_thread(
-            req_pipeline.calculate_pairs_analytics,
-            request.symbol_a.lower(),
-            request.symbol_b.lower(),
-            request.timeframe,
-            request.window,
-            request.limit,
-            request.regression_type
-        )
-        
-        if not data:
-             raise HTTPException(status_code=404, detail="No data available")
-
-        df = pd.DataFrame({
-            'timestamp': data['timestamps'],
-            'price_a': data['price_a'],
-            'price_b': data['price_b'],
-            'spread': data['spread'],
-            'z_score': data['z_score']
-        })
+        if request.start_time or request.end_time:
+            # Date ranges are streamed from storage chunk by chunk; the hedge ratio is fitted
+            # over the whole range in a first streaming pass. OLS and the online estimators
+            # run in constant memory, Huber needs every bar at once and is refused
+            if request.regression_type == 'huber':
+                raise HTTPException(status_code=400, detail="Huber regression is not supported for date range exports. Use ols, kalman or rls.")
+            data_store = get_data_store(DB_PATH)
+            range_args = (symbol_a, symbol_b, request.timeframe, request.start_time, request.end_time, request.chunk_size)
+            chunks = data_store.iter_pair_bars(*range_args)
+            if request.regression_type in ONLINE_ESTIMATORS:
+                beta, alpha, rows = await asyncio.to_thread(estimate_online_hedge_ratio, chunks, request.regression_type)
+            else:
+                beta, alpha, rows = await asyncio.to_thread(estimate_hedge_ratio, chunks)
+            if rows == 0:
+                raise HTTPException(status_code=404, detail="No data available")
+            
+            frames = iter_spread_frames(data_store.iter_pair_bars(*range_args), beta, request.window, PairsAnalytics())
+        else:
+            req_pipeline = get_analytics_pipeline(request.symbol_a, request.symbol_b)
+            data = await asyncio.to_thread(
+                req_pipeline.calculate_pairs_analytics,
+                symbol_a,
+                symbol_b,
+                request.timeframe,
+                request.window,
+                request.limit,
+                request.regression_type
+            )
+            
+            if not data:
+                 raise HTTPException(status_code=404, detail="No data available")
+            
+            df = pd.DataFrame({
+                'timestamp': data['timestamps'],
+                'price_a': data['price_a'].values,
+                'price_b': data['price_b'].values,
+                'spread': data['spread'].values,
+                'z_score': data['z_score'].values
+            })
+            frames = split_frame(df, request.chunk_size)
         
-        stream = io.StringIO()
-        df.to_csv(stream, index=True)
-        response = StreamingResponse(iter([stream.getvalue()]), media_type="text/csv")
-        response.headers["Content-Disposition"] = f"attachment; filename=pairs_analytics_{request.symbol_a}_{request.symbol_b}.csv"
+        # Sync generators are consumed in the threadpool, one chunk at a time
+        if request.format == 'parquet':
+            response = StreamingResponse(iter_parquet(frames), media_type="application/vnd.apache.parquet")
+        else:
+            response = StreamingResponse(iter_csv(frames), media_type="text/csv")
+        response.headers["Content-Disposition"] = f"attachment; filename=pairs_analytics_{request.symbol_a}_{request.symbol_b}.{request.format}"
         return response
-
+    
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-        if created_temp and req_pipeline:
-            req_pipeline.close()
 
 @app.post("/analytics/adf")
 async def run_adf_test(req: AnalyticsRequest):
     global pipelines
     
-    key = f"{req.symbol_a.lower()}-{req.symbol_b.lower()}"
-    req_pipeline = pipelines.get(key)
-    created_temp = False
-
     try:
-        if not req_pipeline:
-            req_pipeline = MarketDataPipeline(
-                symbols=[req.symbol_a.lower(), req.symbol_b.lower()],
-                db_path="market_data.db"
-            )
-            created_temp = True
+        req_pipeline = get_analytics_pipeline(req.symbol_a, req.symbol_b)
     
         # Calculate analytics to get spread
         analytics = await asyncio.to_thread(
@@ -351,60 +524,80 @@ async def run_adf_test(req: AnalyticsRequest):
             traceback.print_exc(file=f)
             f.write("\n")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if created_temp and req_pipeline:
-            req_pipeline.close()
+
+@app.post("/screener")
+async def screen_pairs(req: ScreenerRequest):
+    symbols = [s.lower() for s in req.symbols]
+    if len(set(symbols)) < 2:
+        raise HTTPException(status_code=400, detail="At least two symbols are required")
+    
+    try:
+        # One load of the whole universe, then a ranked scan of every pair
+        result = await asyncio.to_thread(
+            run_screener,
+            get_data_store(DB_PATH),
+            symbols,
+            req.timeframe,
+            req.limit,
+            req.min_correlation,
+            req.max_candidates,
+            req.window,
+            req.top,
+            PairsAnalytics(get_compute_pool())
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if len(result['symbols']) < 2:
+        return {"status": "no_data", "message": "Not enough aligned bars for at least two symbols"}
+    
+    return recursive_sanitize(result)
 
 @app.post("/pipeline/upload")
 async def upload_ohlc(file: UploadFile = File(...), symbol: str = Form(...), timeframe: str = Form(...)):
     if not symbol or not timeframe:
         raise HTTPException(status_code=400, detail="Symbol and timeframe are required")
     
+    # The multipart body is already spooled to a temp file; it is parsed and written in
+    # chunks from a worker thread instead of being read into memory on the event loop
+    job = UploadJob(file.filename, symbol.lower(), timeframe, total_bytes=file.size)
+    upload_jobs[job.job_id] = job
+    while len(upload_jobs) > 20:
+        upload_jobs.pop(next(iter(upload_jobs)))
+    
     try:
-        content = await file.read()
-        
-        df = None
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(content))
-        elif file.filename.endswith('.json') or file.filename.endswith('.ndjson'):
-            df = pd.read_json(io.BytesIO(content), orient='records' if file.filename.endswith('.json') else 'records', lines=file.filename.endswith('.ndjson'))
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file format. Use CSV or JSON.")
-        
-        # Validate columns
-        required_cols = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
-        if not all(col in df.columns for col in required_cols):
-             # Try case-insensitive mapping
-             df.columns = [c.lower() for c in df.columns]
-             if not all(col in df.columns for col in required_cols):
-                 raise HTTPException(status_code=400, detail=f"Missing required columns: {required_cols}")
-        
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['symbol'] = symbol.lower()
-        # Ensure timeframe matches the target bucket if needed, or just trust user input for now
-        
-        ds = DataStore("market_data.db")
-        try:
-             ds.insert_resampled(df, timeframe)
-        finally:
-             ds.close()
-             
-        return {"status": "success", "rows_inserted": len(df), "symbol": symbol, "timeframe": timeframe}
-
+        await asyncio.to_thread(ingest_ohlc_file, get_data_store(DB_PATH), file.file, job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Uploaded bars are complete, so push subscribers as if they had just closed
+        if job.rows_inserted:
+            on_bars_written(timeframe, [symbol.lower()], closed=True)
+    
+    return {
+        "status": "success",
+        "job_id": job.job_id,
+        "rows_inserted": job.rows_inserted,
+        "rows_rejected": job.rows_rejected,
+        "rows_per_sec": round(job.rows_per_sec),
+        "symbol": symbol,
+        "timeframe": timeframe
+    }
+
+@app.get("/pipeline/upload/jobs")
+async def get_upload_jobs():
+    # Progress of running uploads and results of recent ones, newest first
+    return [job.to_dict() for job in reversed(list(upload_jobs.values()))]
         
 @app.get("/alerts")
 async def get_alerts(limit: int = 50):
-    ds = DataStore("market_data.db")
-    try:
-        df = ds.get_alerts(limit=limit)
-        if df.empty:
-            return []
-        
-        df['timestamp'] = df['timestamp'].apply(lambda x: x.isoformat() if pd.notnull(x) else str(x))
-        return df.to_dict(orient='records')
-    finally:
-        ds.close()
+    df = await asyncio.to_thread(get_data_store(DB_PATH).get_alerts, limit)
+    if df.empty:
+        return []
+    
+    df['timestamp'] = df['timestamp'].apply(lambda x: x.isoformat() if pd.notnull(x) else str(x))
+    return df.to_dict(orient='records')
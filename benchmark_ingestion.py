@@ -0,0 +1,111 @@
+"""
+Ingestion throughput benchmark
+Replays synthetic combined-stream trade frames through the collector decode path
+into a TickBuffer, comparing a copy of the original path (json + datetime + locked
+list buffer) with fast decode + batched delivery into the NumPy TickBuffer
+"""
+import sys
+import json
+import time
+import asyncio
+import random
+from datetime import datetime
+from typing import Any, Dict
+
+from src.data_ingestion import BinanceCombinedStreamCollector, TickBuffer
+
+N_TICKS = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+SYMBOLS = ['btcusdt', 'ethusdt', 'solusdt', 'bnbusdt']
+
+
+def make_frames(n):
+    frames = []
+    trade_time = 1704067200000
+    for i in range(n):
+        symbol = SYMBOLS[i % len(SYMBOLS)]
+        trade_time += random.randint(0, 3)
+        frames.append(json.dumps({
+            'stream': f'{symbol}@trade',
+            'data': {
+                'e': 'trade', 'E': trade_time + 1, 'T': trade_time, 's': symbol.upper(), 't': i,
+                'p': f"{43000 + random.random() * 100:.2f}", 'q': f"{random.random():.3f}",
+                'X': 'MARKET', 'm': random.random() < 0.5
+            }
+        }))
+    return frames
+
+
+class BaselineTickBuffer:
+    # The tick buffer as it was before the NumPy ring: a list behind an asyncio lock
+    
+    def __init__(self, max_size: int = 100000):
+        self.buffer = []
+        self.max_size = max_size
+        self.lock = asyncio.Lock()
+    
+    async def add(self, tick: Dict[str, Any]):
+        async with self.lock:
+            self.buffer.append(tick)
+            
+            if len(self.buffer) > self.max_size:
+                self.buffer = self.buffer[-self.max_size:]
+    
+    async def size(self) -> int:
+        async with self.lock:
+            return len(self.buffer)
+
+
+def baseline_normalize_tick(raw_data: Dict[str, Any]) -> Dict[str, Any]:
+    timestamp = datetime.fromtimestamp(raw_data['T'] / 1000.0)
+    
+    return {
+        'timestamp': timestamp,
+        'symbol': raw_data['s'].lower(),
+        'price': float(raw_data['p']),
+        'size': float(raw_data['q']),
+        'is_buyer_maker': raw_data['m']
+    }
+
+
+async def run_baseline(frames):
+    buffer = BaselineTickBuffer(max_size=len(frames))
+    
+    start = time.perf_counter()
+    for frame in frames:
+        data = json.loads(frame)['data']
+        if data.get('e') == 'trade':
+            await buffer.add(baseline_normalize_tick(data))
+    elapsed = time.perf_counter() - start
+    
+    assert await buffer.size() == len(frames)
+    return len(frames) / elapsed
+
+
+async def run_fast(frames):
+    buffer = TickBuffer(max_size=len(frames))
+    collector = BinanceCombinedStreamCollector(SYMBOLS, buffer.add_batch, fast_decode=True, batch_size=256)
+    
+    start = time.perf_counter()
+    for frame in frames:
+        await collector._handle_message(frame)
+    await collector._flush_batch()
+    elapsed = time.perf_counter() - start
+    
+    assert await buffer.size() == len(frames)
+    return len(frames) / elapsed
+
+
+if __name__ == "__main__":
+    frames = make_frames(N_TICKS)
+    
+    print("=" * 60)
+    print(f"Ingestion benchmark: {N_TICKS} trade frames, {len(SYMBOLS)} symbols")
+    print("=" * 60)
+    
+    baseline = asyncio.run(run_baseline(frames))
+    print(f"baseline json + datetime + locked list: {baseline:>12,.0f} ticks/sec")
+    
+    fast = asyncio.run(run_fast(frames))
+    print(f"orjson + epoch ms + batched NumPy ring: {fast:>12,.0f} ticks/sec")
+    
+    print(f"Speedup: {fast / baseline:.2f}x")
@@ -13,6 +13,29 @@ function cn(...inputs) {
 }
 
 const API_URL = 'http://localhost:8000'
+const WS_URL = API_URL.replace(/^http/, 'ws')
+
+const SERIES_KEYS = ['timestamps', 'spread', 'z_score', 'rolling_adf', 'rolling_adf_p_value', 'rolling_half_life', 'price_a', 'price_b']
+const BAR_KEYS = ['ohlcv_a', 'ohlcv_b']
+
+// Merge a pushed delta (points from `since` onwards plus latest metrics) into the current data
+const applyDelta = (prev, delta, limit) => {
+  if (!prev || !prev.timestamps) return prev
+  const cut = prev.timestamps.findIndex(t => t >= delta.since)
+  const keep = cut === -1 ? prev.timestamps.length : cut
+  const next = { ...prev }
+  for (const [key, value] of Object.entries(delta)) {
+    if (key === 'type' || key === 'since') continue
+    if (SERIES_KEYS.includes(key)) {
+      next[key] = (prev[key] || []).slice(0, keep).concat(value).slice(-limit)
+    } else if (BAR_KEYS.includes(key)) {
+      next[key] = (prev[key] || []).filter(bar => bar.time < delta.since).concat(value).slice(-limit)
+    } else {
+      next[key] = value
+    }
+  }
+  return next
+}
 
 const CustomTooltip = ({ active, payload, label }) => {
   if (active && payload && payload.length) {
@@ -55,10 +78,53 @@ function App() {
   
   useEffect(() => {
     checkStatus()
-    const interval = setInterval(fetchData, 2000)
-    return () => clearInterval(interval)
+    const request = analyticsRequest()
+    let ws = null
+    let interval = null
+    let disposed = false
+
+    // Polling is only a fallback for when the push socket is unavailable
+    const startPolling = () => {
+      if (interval || disposed) return
+      fetchData()
+      interval = setInterval(fetchData, 2000)
+    }
+
+    try {
+      ws = new WebSocket(`${WS_URL}/ws/analytics`)
+      ws.onopen = () => ws.send(JSON.stringify(request))
+      ws.onmessage = (event) => {
+        const msg = JSON.parse(event.data)
+        if (msg.type === 'snapshot') {
+          setData(msg.data)
+        } else if (msg.type === 'delta') {
+          setData(prev => applyDelta(prev, msg, request.limit))
+        } else if (msg.type === 'no_data') {
+          setData({ status: 'no_data', message: msg.message })
+        }
+      }
+      ws.onclose = () => startPolling()
+    } catch (err) {
+      startPolling()
+    }
+
+    return () => {
+      disposed = true
+      if (ws) ws.close()
+      if (interval) clearInterval(interval)
+    }
   }, [config])
 
+  const analyticsRequest = () => ({
+    symbol_a: config.symbol_a,
+    symbol_b: config.symbol_b,
+    timeframe: config.timeframe, 
+    window: parseInt(config.window),
+    limit: parseInt(config.limit),
+    z_score_threshold: parseFloat(config.threshold),
+    regression_type: config.regression_type || 'ols'
+  })
+
   const checkStatus = async () => {
     try {
       const res = await axios.get(`${API_URL}/pipeline/status`)
@@ -70,14 +136,7 @@ function App() {
 
   const fetchData = async () => {
     try {
-      const res = await axios.post(`${API_URL}/analytics`, {
-        symbol_a: config.symbol_a,
-        symbol_b: config.symbol_b,
-        timeframe: config.timeframe, 
-        window: parseInt(config.window),
-        limit: parseInt(config.limit),
-        z_score_threshold: parseFloat(config.threshold)
-      })
+      const res = await axios.post(`${API_URL}/analytics`, analyticsRequest())
       setData(res.data)
       // Only clear error if it was a fetch error, preserve ADF errors
       if (error && error !== "ADF Test Failed" && !error.includes("ADF")) {
@@ -90,7 +149,13 @@ function App() {
   const handleStart = async () => {
     setLoading(true)
     try {
-      await axios.post(`${API_URL}/pipeline/start`, config)
+      await axios.post(`${API_URL}/pipeline/start`, {
+        ...config,
+        z_score_window: parseInt(config.window),
+        z_score_threshold: parseFloat(config.threshold),
+        regression_type: config.regression_type || 'ols',
+        hedge_window: parseInt(config.limit)
+      })
       checkStatus()
     } catch (err) {
       setError(err.response?.data?.detail || "Failed to start")
@@ -189,7 +254,10 @@ function App() {
   const mainChartData = data?.timestamps?.map((t, i) => ({
     time: new Date(t).toLocaleTimeString([], { hour: '2-digit', minute:'2-digit', second:'2-digit' }),
     z_score: data.z_score[i],
-    spread: data.spread[i]
+    spread: data.spread[i],
+    rolling_adf: data.rolling_adf?.[i],
+    rolling_adf_p_value: data.rolling_adf_p_value?.[i],
+    rolling_half_life: data.rolling_half_life?.[i]
   })) || []
 
   const formatCandle = (ohlcv) => {
@@ -297,6 +365,8 @@ function App() {
                        >
                           <option value="ols">OLS (Ordinary Least Squares)</option>
                           <option value="huber">Robust (Huber Regression)</option>
+                          <option value="kalman">Online (Kalman Filter)</option>
+                          <option value="rls">Online (Recursive Least Squares)</option>
                        </select>
                     </div>
 
@@ -517,6 +587,34 @@ function App() {
               </div>
            </div>
 
+           <div className="bg-slate-900 border border-slate-800 rounded-xl p-4 shadow-xl">
+              <div className="flex justify-between items-center mb-4">
+                 <h3 className="font-semibold text-slate-300 flex items-center gap-2">
+                    <BarChart2 className="text-violet-400" size={16} /> Rolling Stationarity
+                 </h3>
+                 <span className="text-xs font-mono text-slate-500">ADF statistic vs half-life</span>
+              </div>
+              <div className="h-[250px] w-full pt-2">
+                 <ResponsiveContainer width="100%" height="100%">
+                    <LineChart data={mainChartData} margin={{ top: 5, right: 10, left: 15, bottom: 20 }}>
+                       <CartesianGrid strokeDasharray="3 3" stroke="#1e293b" vertical={false} />
+                       <XAxis dataKey="time" stroke="#475569" fontSize={10} minTickGap={30} tickMargin={10}>
+                          <Label value="Time" offset={0} position="insideBottom" dy={10} fill="#64748b" fontSize={10} />
+                       </XAxis>
+                       <YAxis yAxisId="adf" domain={['auto', 'auto']} stroke="#475569" fontSize={10} width={40}>
+                          <Label value="ADF" angle={-90} position="insideLeft" dx={-10} style={{ textAnchor: 'middle' }} fill="#64748b" fontSize={10} />
+                       </YAxis>
+                       <YAxis yAxisId="half_life" orientation="right" domain={['auto', 'auto']} stroke="#475569" fontSize={10} width={40} />
+                       <Tooltip content={<CustomTooltip />} />
+                       {/* 5% critical value for the constant-only ADF regression */}
+                       <ReferenceLine yAxisId="adf" y={-2.86} stroke="#10b981" strokeDasharray="3 3" strokeOpacity={0.8} />
+                       <Line yAxisId="adf" type="monotone" dataKey="rolling_adf" stroke="#a78bfa" strokeWidth={1.5} dot={false} connectNulls />
+                       <Line yAxisId="half_life" type="monotone" dataKey="rolling_half_life" stroke="#f59e0b" strokeWidth={1.5} dot={false} connectNulls />
+                    </LineChart>
+                 </ResponsiveContainer>
+              </div>
+           </div>
+
            <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
               
               <div className="bg-slate-900 border border-slate-800 rounded-xl p-4 shadow-xl">
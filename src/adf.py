@@ -0,0 +1,140 @@
+import numpy as np
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+from scipy.special import ndtr
+
+# MacKinnon (1994) response surfaces for the ADF tau statistic with a constant and one
+# series: below TAU_STAR the small-p polynomial applies, above it the large-p one
+TAU_MAX = 2.74
+TAU_MIN = -18.83
+TAU_STAR = -1.61
+TAU_SMALLP = np.array([2.1659, 1.4412, 3.8269e-2])
+TAU_LARGEP = np.array([1.7339, 9.3202e-1, -1.2745e-1, -1.0368e-2])
+
+# MacKinnon (2010) finite-sample critical values: c0 + c1/n + c2/n^2 + c3/n^3
+TAU_CRIT = {
+    '1%': np.array([-3.43035, -6.5393, -16.786, -79.433]),
+    '5%': np.array([-2.86154, -2.8903, -4.234, -40.040]),
+    '10%': np.array([-2.56677, -1.5384, -2.809, 0.0])
+}
+
+LOG_2PI = np.log(2 * np.pi)
+
+def mackinnon_p_value(stat):
+    # Accepts a single statistic or an array of them; NaN statistics give NaN p-values
+    stat = np.asarray(stat, dtype=np.float64)
+    small = ndtr(np.polyval(TAU_SMALLP[::-1], stat))
+    large = ndtr(np.polyval(TAU_LARGEP[::-1], stat))
+    p_value = np.where(stat <= TAU_STAR, small, large)
+    return np.where(stat > TAU_MAX, 1.0, np.where(stat < TAU_MIN, 0.0, p_value))
+
+@lru_cache(maxsize=1024)
+def mackinnon_critical_values(nobs: int) -> Tuple[float, float, float]:
+    # Depends only on the sample size, so repeated tests of equal-length series are free
+    return tuple(float(np.polyval(coef[::-1], 1.0 / nobs)) for coef in TAU_CRIT.values())
+
+def default_max_lag(nobs: int) -> int:
+    # Schwert's rule as used by statsmodels, capped so the regression keeps enough rows
+    max_lag = min(nobs // 2 - 2, int(np.ceil(12.0 * np.power(nobs / 100.0, 0.25))))
+    if max_lag < 0:
+        raise ValueError("sample size is too short to use selected regression component")
+    return max_lag
+
+def _design(x: np.ndarray, dx: np.ndarray, lags: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Regressors for dx_t on [1, x_{t-1}, dx_{t-1} .. dx_{t-lags}], rows where every lag exists
+    n = len(dx)
+    nobs = n - lags
+    X = np.empty((nobs, lags + 2))
+    X[:, 0] = 1.0
+    X[:, 1] = x[lags:n]
+    for j in range(1, lags + 1):
+        X[:, j + 1] = dx[lags - j:n - j]
+    return X, dx[lags:]
+
+def _select_lag(x: np.ndarray, dx: np.ndarray, max_lag: int) -> Tuple[int, float]:
+    # Every candidate model is a leading block of columns of the max-lag design, so one QR
+    # gives all their residual sums of squares: the projection on the first k columns of Q
+    X, y = _design(x, dx, max_lag)
+    nobs = len(y)
+    Q, R = np.linalg.qr(X)
+    z = Q.T @ y
+    resid = y - Q @ z
+    tail = np.cumsum((z * z)[::-1])[::-1]
+    
+    k = np.arange(2, max_lag + 3)
+    ssr = resid @ resid + np.append(tail, 0.0)[k]
+    aic = nobs * (LOG_2PI + np.log(ssr / nobs) + 1) + 2 * k
+    best = int(np.argmin(aic))
+    return best, float(aic[best])
+
+def _tau(x: np.ndarray, dx: np.ndarray, lags: int) -> Tuple[float, int]:
+    X, y = _design(x, dx, lags)
+    nobs, k = X.shape
+    Q, R = np.linalg.qr(X)
+    coef = np.linalg.solve(R, Q.T @ y)
+    resid = y - X @ coef
+    scale = resid @ resid / (nobs - k)
+    # Variance of the level coefficient is scale times the [1, 1] entry of (X'X)^-1 = R^-1 R^-T
+    r_inv = np.linalg.solve(R, np.eye(k))
+    return float(coef[1] / np.sqrt(scale * (r_inv[1] @ r_inv[1]))), nobs
+
+def adf(series: np.ndarray, max_lag: Optional[int] = None, autolag: bool = True) -> Dict[str, Any]:
+    # Augmented Dickey-Fuller test with a constant, matching statsmodels' adfuller with
+    # regression='c'. With autolag=False the regression uses max_lag lags directly
+    x = np.asarray(series, dtype=np.float64)
+    if x.max() == x.min():
+        raise ValueError("Invalid input, x is constant")
+    
+    if max_lag is None:
+        max_lag = default_max_lag(len(x))
+    elif max_lag > len(x) // 2 - 2:
+        raise ValueError("max_lag must be less than (nobs/2 - 2)")
+    
+    dx = np.diff(x)
+    ic_best = None
+    lags = max_lag
+    if autolag:
+        lags, ic_best = _select_lag(x, dx, max_lag)
+    
+    stat, nobs = _tau(x, dx, lags)
+    return {
+        'adf_statistic': stat,
+        'p_value': float(mackinnon_p_value(stat)),
+        'used_lag': lags,
+        'nobs': nobs,
+        'critical_values': dict(zip(TAU_CRIT, mackinnon_critical_values(nobs))),
+        'ic_best': ic_best
+    }
+
+def rolling_adf(series: np.ndarray, window: int, lags: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    # Fixed-lag ADF statistic and p-value of every `window` points, aligned to the last point
+    # of the window. A window only needs the cross products of its regression rows, taken as
+    # differences of running sums, and one small solve
+    x = np.asarray(series, dtype=np.float64)
+    stat = np.full(len(x), np.nan)
+    k = lags + 2
+    rows = window - 1 - lags
+    if lags < 0 or rows <= k or len(x) < window:
+        return stat, stat.copy()
+    
+    # The constant absorbs any shift of the level, so centering keeps the running sums small for free
+    x = x - x.mean()
+    X, y = _design(x, np.diff(x), lags)
+    Z = np.column_stack((X, y))
+    sums = np.cumsum(Z[:, :, np.newaxis] * Z[:, np.newaxis, :], axis=0)
+    sums = np.concatenate((np.zeros((1, k + 1, k + 1)), sums))
+    cross = sums[rows:] - sums[:-rows]
+    XtX, Xty, yty = cross[:, :k, :k], cross[:, :k, k], cross[:, k, k]
+    
+    # Windows where the level does not move have no statistic
+    level_ss = XtX[:, 1, 1] - XtX[:, 0, 1] ** 2 / rows
+    valid = level_ss > 1e-12 * np.maximum(XtX[:, 1, 1], 1e-300)
+    XtX[~valid] = np.eye(k)
+    
+    XtX_inv = np.linalg.inv(XtX)
+    coef = np.einsum('wij,wj->wi', XtX_inv, Xty)
+    ssr = yty - np.einsum('wi,wi->w', Xty, coef)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = coef[:, 1] / np.sqrt(ssr / (rows - k) * XtX_inv[:, 1, 1])
+    stat[window - 1:] = np.where(valid & (ssr > 0), tau, np.nan)
+    return stat, mackinnon_p_value(stat)
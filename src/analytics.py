@@ -1,19 +1,32 @@
 import pandas as pd
 import numpy as np
-from typing import Tuple, Dict, Optional
+from typing import Tuple, Dict, List, Optional, Any
 from scipy import stats
 import logging
+from abc import ABC, abstractmethod
+
+from src.adf import adf, rolling_adf
 
 logger = logging.getLogger(__name__)
 
+# Fewest ADF tests worth spreading over the compute pool
+ADF_POOL_MIN_BATCH = 32
+
+# Fewest spread points a half-life is fitted on, for the scalar and the rolling estimate
+HALF_LIFE_MIN_POINTS = 10
+
 class PairsAnalytics:
     
-    def __init__(self):
-        pass
+    def __init__(self, compute_pool=None):
+        # ADF tests and Huber fits go to this process pool when set, so they run on
+        # other cores instead of holding the GIL of the server process
+        self.compute_pool = compute_pool
     
     def calculate_hedge_ratio(self, price_a: pd.Series, price_b: pd.Series, method: str = 'ols') -> Tuple[float, float, float]:
         if method == 'huber':
             return self.calculate_hedge_ratio_huber(price_a, price_b)
+        if method in ONLINE_ESTIMATORS:
+            return self.calculate_hedge_ratio_online(price_a, price_b, method)
         return self.calculate_hedge_ratio_ols(price_a, price_b)
 
     def calculate_hedge_ratio_ols(self, price_a: pd.Series, price_b: pd.Series) -> Tuple[float, float, float]:
@@ -37,6 +50,15 @@ class PairsAnalytics:
         return float(beta), float(alpha), float(r_squared)
     
     def calculate_hedge_ratio_huber(self, price_a: pd.Series, price_b: pd.Series) -> Tuple[float, float, float]:
+        if self.compute_pool is not None:
+            df = pd.DataFrame({'a': price_a, 'b': price_b}).dropna()
+            try:
+                return self.compute_pool.run('huber', df['a'].to_numpy(np.float64), df['b'].to_numpy(np.float64))
+            except Exception as e:
+                logger.error(f"Huber regression in compute pool failed, running locally: {e}")
+        return self._fit_huber(price_a, price_b)
+    
+    def _fit_huber(self, price_a: pd.Series, price_b: pd.Series) -> Tuple[float, float, float]:
         try:
             import statsmodels.api as sm
             
@@ -65,28 +87,68 @@ class PairsAnalytics:
             logger.error(f"Huber regression failed: {e}")
             return self.calculate_hedge_ratio_ols(price_a, price_b)
     
-    def calculate_rolling_hedge_ratio(self, price_a: pd.Series, price_b: pd.Series, window: int) -> pd.DataFrame:
+    def calculate_hedge_ratio_online(self, price_a: pd.Series, price_b: pd.Series, method: str = 'kalman') -> Tuple[float, float, float]:
+        df = pd.DataFrame({'a': price_a, 'b': price_b}).dropna()
+        
+        if len(df) < 2:
+            return 0.0, 0.0, 0.0
+        
+        estimator = create_online_estimator(method)
+        for y, x in zip(df['a'].values, df['b'].values):
+            estimator.update(y, x)
+        
+        beta, alpha = estimator.beta, estimator.alpha
+        r_squared = self.calculate_r_squared(df['a'], df['b'], beta, alpha)
+        
+        return float(beta), float(alpha), float(r_squared)
+    
+    def calculate_r_squared(self, price_a: pd.Series, price_b: pd.Series, beta: float, alpha: float) -> float:
+        y = np.asarray(price_a, dtype=float)
+        y_pred = beta * np.asarray(price_b, dtype=float) + alpha
+        ss_res = np.sum((y - y_pred) ** 2)
+        ss_tot = np.sum((y - np.mean(y)) ** 2)
+        return float(1 - (ss_res / ss_tot)) if ss_tot > 0 else 0.0
+    
+    def calculate_rolling_hedge_ratio(self, price_a: pd.Series, price_b: pd.Series, window: int, halflife: Optional[float] = None) -> pd.DataFrame:
         df = pd.DataFrame({'a': price_a, 'b': price_b}).dropna()
         
         if len(df) < window:
             return pd.DataFrame()
         
-        rolling_beta = []
-        rolling_alpha = []
-        rolling_r2 = []
-        
-        for i in range(window, len(df) + 1):
-            window_data = df.iloc[i-window:i]
-            beta, alpha, r2 = self.calculate_hedge_ratio_ols(window_data['a'], window_data['b'])
-            rolling_beta.append(beta)
-            rolling_alpha.append(alpha)
-            rolling_r2.append(r2)
+        # Center both series so the windowed sums below do not lose precision to large price levels
+        mean_x = df['b'].mean()
+        mean_y = df['a'].mean()
+        x = df['b'] - mean_x
+        y = df['a'] - mean_y
+        
+        if halflife is not None:
+            ewm = lambda s: s.ewm(halflife=halflife, min_periods=window).mean().values[window - 1:]
+            ex, ey = ewm(x), ewm(y)
+            cov_xy = ewm(x * y) - ex * ey
+            var_x = ewm(x * x) - ex * ex
+            var_y = ewm(y * y) - ey * ey
+        else:
+            def window_sum(v: np.ndarray) -> np.ndarray:
+                c = np.concatenate(([0.0], np.cumsum(v)))
+                return c[window:] - c[:-window]
+            
+            xv, yv = x.values, y.values
+            ex = window_sum(xv) / window
+            ey = window_sum(yv) / window
+            cov_xy = window_sum(xv * yv) / window - ex * ey
+            var_x = window_sum(xv * xv) / window - ex * ex
+            var_y = window_sum(yv * yv) / window - ey * ey
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            beta = np.where(var_x > 0, cov_xy / var_x, np.nan)
+            alpha = ey - beta * ex + mean_y - beta * mean_x
+            r_squared = np.where((var_x > 0) & (var_y > 0), cov_xy ** 2 / (var_x * var_y), 0.0)
         
         result = pd.DataFrame({
-            'beta': rolling_beta,
-            'alpha': rolling_alpha,
-            'r_squared': rolling_r2
-        }, index=df.index[window:])
+            'beta': beta,
+            'alpha': alpha,
+            'r_squared': r_squared
+        }, index=df.index[window - 1:])
         
         return result
     
@@ -104,20 +166,18 @@ class PairsAnalytics:
         return spread
     
     def calculate_z_score(self, spread: pd.Series, window: int) -> pd.Series:
-        rolling_mean = spread.rolling(window=window).mean()
-        rolling_std = spread.rolling(window=window).std()
-        
-        z_score = (spread - rolling_mean) / rolling_std
-        
-        return z_score
+        rolling_mean, rolling_std = self._rolling_mean_std(spread, window)
+        return (spread - rolling_mean) / rolling_std
+    
+    def _rolling_mean_std(self, spread: pd.Series, window: int) -> Tuple[pd.Series, pd.Series]:
+        rolling = spread.rolling(window=window)
+        return rolling.mean(), rolling.std()
     
     def calculate_rolling_z_score(self, price_a: pd.Series, price_b: pd.Series, window: int) -> pd.DataFrame:
         beta, alpha, r2 = self.calculate_hedge_ratio_ols(price_a, price_b)
         spread = self.calculate_spread(price_a, price_b, beta)
-        z_score = self.calculate_z_score(spread, window)
-        
-        rolling_mean = spread.rolling(window=window).mean()
-        rolling_std = spread.rolling(window=window).std()
+        rolling_mean, rolling_std = self._rolling_mean_std(spread, window)
+        z_score = (spread - rolling_mean) / rolling_std
         
         result = pd.DataFrame({
             'spread': spread,
@@ -131,10 +191,38 @@ class PairsAnalytics:
         
         return result
     
-    def adf_test(self, series: pd.Series) -> Dict[str, float]:
+    def adf_test(self, series: pd.Series, max_lag: Optional[int] = None, autolag: bool = True) -> Dict[str, float]:
+        # A single NumPy ADF test is cheaper than the round trip to a worker process
+        return self._adf_test(series, max_lag, autolag)
+    
+    def adf_test_many(self, series_list: List[pd.Series]) -> List[Dict[str, float]]:
+        # Large batches are submitted to the pool before any result is awaited, so they run in
+        # parallel; smaller ones would spend more on the round trips than they save
+        pool = self.compute_pool
+        if pool is None or pool.max_workers < 2 or len(series_list) < ADF_POOL_MIN_BATCH:
+            return [self._adf_test(series) for series in series_list]
+        
+        futures = []
+        for series in series_list:
+            try:
+                futures.append(self.compute_pool.submit('adf', series.to_numpy(np.float64)))
+            except Exception as e:
+                futures.append(None)
+                logger.error(f"Could not submit ADF test to compute pool: {e}")
+        
+        results = []
+        for series, future in zip(series_list, futures):
+            try:
+                if future is None:
+                    raise RuntimeError("not submitted")
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"ADF test in compute pool failed, running locally: {e}")
+                results.append(self._adf_test(series))
+        return results
+    
+    def _adf_test(self, series: pd.Series, max_lag: Optional[int] = None, autolag: bool = True) -> Dict[str, float]:
         try:
-            from statsmodels.tsa.stattools import adfuller
-            
             series_clean = series.dropna()
             
             if len(series_clean) < 10:
@@ -145,23 +233,15 @@ class PairsAnalytics:
                     'critical_values': {}
                 }
             
-            result = adfuller(series_clean, autolag='AIC')
-            
-            adf_statistic = result[0]
-            p_value = result[1]
-            critical_values = result[4]
-            
-            is_stationary = p_value < 0.05
+            result = adf(series_clean.to_numpy(np.float64), max_lag, autolag)
             
             return {
-                'adf_statistic': float(adf_statistic),
-                'p_value': float(p_value),
-                'is_stationary': is_stationary,
-                'critical_values': {
-                    '1%': float(critical_values['1%']),
-                    '5%': float(critical_values['5%']),
-                    '10%': float(critical_values['10%'])
-                }
+                'adf_statistic': result['adf_statistic'],
+                'p_value': result['p_value'],
+                'is_stationary': result['p_value'] < 0.05,
+                'critical_values': result['critical_values'],
+                'used_lag': result['used_lag'],
+                'nobs': result['nobs']
             }
         except Exception as e:
             logger.error(f"ADF test failed: {e}")
@@ -214,7 +294,7 @@ class PairsAnalytics:
     def calculate_half_life(self, spread: pd.Series) -> float:
         spread_clean = spread.dropna()
         
-        if len(spread_clean) < 10:
+        if len(spread_clean) < HALF_LIFE_MIN_POINTS:
             return np.nan
         
         spread_lag = spread_clean.shift(1).dropna()
@@ -240,3 +320,314 @@ class PairsAnalytics:
                 return np.nan
         except:
             return np.nan
+    
+    def calculate_rolling_half_life(self, spread: pd.Series, window: int) -> pd.Series:
+        # calculate_half_life over every window of `window` points: its no-intercept fit
+        # only needs two sums, kept as running totals
+        spread_clean = spread.dropna()
+        result = pd.Series(np.nan, index=spread_clean.index)
+        
+        if window < HALF_LIFE_MIN_POINTS or len(spread_clean) < window:
+            return result
+        
+        values = spread_clean.to_numpy(np.float64)
+        lagged = values[:-1]
+        diff = np.diff(values)
+        
+        def window_sum(v: np.ndarray) -> np.ndarray:
+            c = np.concatenate(([0.0], np.cumsum(v)))
+            return c[window - 1:] - c[:-(window - 1)]
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lambda_param = window_sum(lagged * diff) / window_sum(lagged * lagged)
+            half_life = -np.log(2) / lambda_param
+        result.iloc[window - 1:] = np.where(lambda_param < 0, half_life, np.nan)
+        
+        return result
+    
+    def calculate_rolling_adf(self, spread: pd.Series, window: int, lags: int = 1) -> pd.DataFrame:
+        # Fixed-lag ADF per window; a lag search on every window would cost a full test each
+        spread_clean = spread.dropna()
+        adf_statistic, p_value = rolling_adf(spread_clean.to_numpy(np.float64), window, lags)
+        
+        return pd.DataFrame({
+            'adf_statistic': adf_statistic,
+            'p_value': p_value
+        }, index=spread_clean.index)
+
+
+class RollingMoments:
+    
+    def __init__(self, window: int = 20):
+        # Mean and sample variance of the last `window` values, updated in O(1) per value
+        # with Welford's add/remove; matches pandas rolling(window).mean() / .std()
+        self.window = window
+        self._values = np.zeros(window)
+        self._next = 0
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._replaced = 0
+        self.last = np.nan
+        self.last_timestamp = None
+    
+    @property
+    def std(self) -> float:
+        if self.count < 2:
+            return np.nan
+        return float(np.sqrt(max(self._m2, 0.0) / (self.count - 1)))
+    
+    @property
+    def z_score(self) -> float:
+        # Undefined until the window is full, like the rolling z-score
+        std = self.std
+        if self.count < self.window or not std > 0:
+            return np.nan
+        return float((self.last - self.mean) / std)
+    
+    def update(self, value: float, timestamp=None) -> Dict[str, Any]:
+        value = float(value)
+        if self.count < self.window:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (value - self.mean)
+        else:
+            # Replacing the oldest value is a remove and an add in one step
+            old = self._values[self._next]
+            delta = value - old
+            old_mean = self.mean
+            self.mean += delta / self.window
+            self._m2 += delta * (value - self.mean + old - old_mean)
+            self._replaced += 1
+        
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.window
+        self.last = value
+        self.last_timestamp = timestamp
+        
+        # Rounding accumulates over long runs; an exact pass once per window keeps it bounded
+        if self._replaced >= self.window:
+            self._replaced = 0
+            self.mean = float(self._values.mean())
+            self._m2 = float(((self._values - self.mean) ** 2).sum())
+        
+        return self.get_state()
+    
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'spread': float(self.last),
+            'mean': float(self.mean) if self.count else np.nan,
+            'std': self.std,
+            'z_score': self.z_score,
+            'count': self.count,
+            'timestamp': self.last_timestamp
+        }
+
+
+class RollingPairMoments:
+    
+    def __init__(self, window: int = 20):
+        # Means and co-moments of the last `window` (a, b) closes, updated in O(1) per bar.
+        # The spread a - beta * b is linear in the pair, so its rolling mean, std and z-score
+        # follow for any hedge ratio without a pass over the window
+        self.window = window
+        self._values = np.zeros((window, 2))
+        self._next = 0
+        self.count = 0
+        self.mean = np.zeros(2)
+        self._m2 = np.zeros((2, 2))
+        self._replaced = 0
+        self.last = np.full(2, np.nan)
+        self.last_timestamp = None
+    
+    def _push(self, value: np.ndarray) -> Tuple[int, np.ndarray, np.ndarray]:
+        # Moments after adding `value` (replacing the oldest once full), without changing state
+        count, mean, m2 = self.count, self.mean, self._m2
+        if count == self.window:
+            # Remove the oldest pair first, then add the new one
+            old = self._values[self._next]
+            removed = mean - (old - mean) / (count - 1)
+            m2 = m2 - np.outer(old - removed, old - mean)
+            count, mean = count - 1, removed
+        count += 1
+        new_mean = mean + (value - mean) / count
+        m2 = m2 + np.outer(value - mean, value - new_mean)
+        return count, new_mean, m2
+    
+    def update(self, a: float, b: float, timestamp=None):
+        value = np.array([a, b], dtype=np.float64)
+        if self.count == self.window:
+            self._replaced += 1
+        self.count, self.mean, self._m2 = self._push(value)
+        
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.window
+        self.last = value
+        self.last_timestamp = timestamp
+        
+        # Same bounded-drift resync as RollingMoments
+        if self._replaced >= self.window:
+            self._replaced = 0
+            self.mean = self._values.mean(axis=0)
+            centered = self._values - self.mean
+            self._m2 = centered.T @ centered
+    
+    def values(self) -> np.ndarray:
+        # Window contents, oldest first
+        if self.count < self.window:
+            return self._values[:self.count].copy()
+        return np.roll(self._values, -self._next, axis=0)
+    
+    @property
+    def beta(self) -> float:
+        # OLS hedge ratio of a on b over the window
+        if self.count < 2 or not self._m2[1, 1] > 0:
+            return np.nan
+        return float(self._m2[0, 1] / self._m2[1, 1])
+    
+    def spread_state(self, beta: float, latest: Optional[Tuple[float, float]] = None, timestamp=None) -> Dict[str, Any]:
+        # `latest` is a newer, still open bar: reported as if it had closed
+        count, mean, m2, last = self.count, self.mean, self._m2, self.last
+        if latest is not None:
+            last = np.array(latest, dtype=np.float64)
+            count, mean, m2 = self._push(last)
+        else:
+            timestamp = self.last_timestamp
+        
+        weights = np.array([1.0, -beta])
+        spread = float(weights @ last)
+        spread_mean = float(weights @ mean) if count else np.nan
+        std = np.nan
+        if count >= 2:
+            std = float(np.sqrt(max(weights @ m2 @ weights, 0.0) / (count - 1)))
+        # Undefined until the window is full, like the rolling z-score
+        z_score = np.nan
+        if count == self.window and std > 0:
+            z_score = (spread - spread_mean) / std
+        
+        return {
+            'spread': spread,
+            'mean': spread_mean,
+            'std': std,
+            'z_score': z_score,
+            'count': count,
+            'timestamp': timestamp
+        }
+
+
+class OnlineHedgeRatio(ABC):
+    
+    def __init__(self, window: int = 20):
+        # Regression runs on prices relative to the first observation to keep the
+        # [x, 1] design well conditioned at crypto price levels
+        self._x0 = None
+        self._y0 = None
+        self.theta = np.zeros(2)
+        self.n_updates = 0
+        self.last_timestamp = None
+        self.spread = np.nan
+        # Windowed moments of the spread at each update's hedge ratio
+        self.moments = RollingMoments(window)
+    
+    @property
+    def beta(self) -> float:
+        return float(self.theta[0])
+    
+    @property
+    def alpha(self) -> float:
+        if self._x0 is None:
+            return 0.0
+        return float(self.theta[1] + self._y0 - self.theta[0] * self._x0)
+    
+    @property
+    def z_score(self) -> float:
+        return self.moments.z_score
+    
+    @abstractmethod
+    def _step(self, phi: np.ndarray, y: float):
+        pass
+    
+    def update(self, y: float, x: float, timestamp=None) -> Dict[str, float]:
+        if self._x0 is None:
+            self._x0, self._y0 = x, y
+        
+        self._step(np.array([x - self._x0, 1.0]), y - self._y0)
+        self.n_updates += 1
+        self.last_timestamp = timestamp
+        
+        self.spread = y - self.beta * x
+        self.moments.update(self.spread, timestamp)
+        
+        return self.get_state()
+    
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'beta': self.beta,
+            'alpha': self.alpha,
+            'spread': float(self.spread),
+            'z_score': self.z_score,
+            'updates': self.n_updates,
+            'timestamp': self.last_timestamp
+        }
+
+
+class RecursiveLeastSquares(OnlineHedgeRatio):
+    
+    def __init__(self, forgetting_factor: float = 0.999, initial_covariance: float = 1e6, window: int = 20):
+        super().__init__(window)
+        self.forgetting_factor = forgetting_factor
+        self.P = np.eye(2) * initial_covariance
+    
+    def _step(self, phi: np.ndarray, y: float):
+        P_phi = self.P @ phi
+        gain = P_phi / (self.forgetting_factor + phi @ P_phi)
+        self.theta = self.theta + gain * (y - phi @ self.theta)
+        self.P = (self.P - np.outer(gain, P_phi)) / self.forgetting_factor
+
+
+class KalmanHedgeRatio(OnlineHedgeRatio):
+    
+    def __init__(self, delta: float = 1e-4, observation_var: Optional[float] = None, window: int = 20):
+        super().__init__(window)
+        # Random-walk state noise for [beta, alpha]; observation noise is tracked from
+        # the innovations unless given explicitly
+        self.state_cov = np.eye(2) * delta / (1 - delta)
+        self.observation_var = observation_var
+        self._innovation_var = None
+        self.P = np.eye(2)
+    
+    def _step(self, phi: np.ndarray, y: float):
+        R = self.P + self.state_cov
+        error = y - phi @ self.theta
+        
+        if self.observation_var is not None:
+            obs_var = self.observation_var
+        elif self._innovation_var is None:
+            obs_var = max(error * error, 1e-12)
+        else:
+            obs_var = max(self._innovation_var, 1e-12)
+        
+        R_phi = R @ phi
+        Q = phi @ R_phi + obs_var
+        gain = R_phi / Q
+        self.theta = self.theta + gain * error
+        self.P = R - np.outer(gain, R_phi)
+        
+        if self.observation_var is None:
+            if self._innovation_var is None:
+                self._innovation_var = error * error
+            else:
+                self._innovation_var = 0.95 * self._innovation_var + 0.05 * error * error
+
+
+ONLINE_ESTIMATORS = {
+    'kalman': KalmanHedgeRatio,
+    'rls': RecursiveLeastSquares
+}
+
+
+def create_online_estimator(method: str, **kwargs) -> OnlineHedgeRatio:
+    if method not in ONLINE_ESTIMATORS:
+        raise ValueError(f"Unsupported online regression type: {method}")
+    return ONLINE_ESTIMATORS[method](**kwargs)
@@ -0,0 +1,208 @@
+import os
+import threading
+import uuid
+import pandas as pd
+from pathlib import Path
+from datetime import datetime
+from typing import List, Optional
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+logger = logging.getLogger(__name__)
+
+TICK_COLUMNS = ['timestamp', 'price', 'size', 'is_buyer_maker']
+# The SQLite row id is archived too: distinct trades can share every other field
+TICK_ARCHIVE_COLUMNS = ['id'] + TICK_COLUMNS
+BAR_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'trade_count']
+
+# Partition rewrites are read-modify-write, so writers of one partition take turns
+_partition_locks = {}
+_partition_locks_guard = threading.Lock()
+
+def _partition_lock(path: Path) -> threading.Lock:
+    with _partition_locks_guard:
+        return _partition_locks.setdefault(str(path), threading.Lock())
+
+class ParquetArchive:
+    
+    # Layout, one file per partition so reads can skip whole files by path:
+    #   <root>/ticks/<symbol>/<YYYY-MM-DD>/<HH>.parquet
+    #   <root>/bars/<timeframe>/<symbol>/<YYYY-MM-DD>.parquet
+    
+    def __init__(self, root: str, row_group_size: int = 65536, compression: str = 'zstd'):
+        if not HAS_PYARROW:
+            raise ImportError("pyarrow is required for the Parquet archive")
+        
+        self.root = Path(root)
+        self.row_group_size = row_group_size
+        self.compression = compression
+    
+    def _tick_dir(self, symbol: str) -> Path:
+        return self.root / 'ticks' / symbol
+    
+    def _bar_dir(self, symbol: str, timeframe: str) -> Path:
+        return self.root / 'bars' / timeframe / symbol
+    
+    def symbols(self) -> List[str]:
+        tick_root = self.root / 'ticks'
+        if not tick_root.exists():
+            return []
+        return sorted(p.name for p in tick_root.iterdir() if p.is_dir())
+    
+    def write_ticks(self, symbol: str, df: pd.DataFrame) -> int:
+        if df.empty:
+            return 0
+        
+        df = df[TICK_ARCHIVE_COLUMNS]
+        written = 0
+        for hour, part in df.groupby(df['timestamp'].dt.floor('h')):
+            path = self._tick_dir(symbol) / hour.strftime('%Y-%m-%d') / f"{hour.hour:02d}.parquet"
+            # Rows re-archived after an interrupted move carry the same id
+            written += self._write_partition(path, part, unique_key='id')
+        return written
+    
+    def write_bars(self, symbol: str, timeframe: str, df: pd.DataFrame) -> int:
+        if df.empty:
+            return 0
+        
+        df = df[BAR_COLUMNS]
+        written = 0
+        for day, part in df.groupby(df['timestamp'].dt.floor('D')):
+            path = self._bar_dir(symbol, timeframe) / f"{day.strftime('%Y-%m-%d')}.parquet"
+            # A bar can be rewritten (e.g. re-uploaded history), keep the latest version
+            written += self._write_partition(path, part, unique_key='timestamp')
+        return written
+    
+    def _write_partition(self, path: Path, df: pd.DataFrame, unique_key: str) -> int:
+        with _partition_lock(path):
+            return self._rewrite_partition(path, df, unique_key)
+    
+    def _rewrite_partition(self, path: Path, df: pd.DataFrame, unique_key: str) -> int:
+        # Parquet files are immutable, so appending to a partition rewrites it
+        if path.exists():
+            existing = pq.read_table(path).to_pandas()
+            df = pd.concat([existing, df], ignore_index=True)
+            if df[unique_key].isna().any():
+                # Tick partitions written before ids were archived: keep their rows as they are
+                df[unique_key] = df[unique_key].astype('Int64')
+                df = df[df[unique_key].isna() | ~df.duplicated(subset=unique_key, keep='last')]
+            else:
+                df = df.drop_duplicates(subset=unique_key, keep='last')
+        
+        df = df.sort_values('timestamp', kind='stable')
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.cast(table.schema.set(
+            table.schema.get_field_index('timestamp'), pa.field('timestamp', pa.timestamp('us'))
+        ))
+        
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # A unique name, so a crashed or concurrent writer never shares the file being replaced
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        pq.write_table(table, tmp_path, row_group_size=self.row_group_size, compression=self.compression)
+        os.replace(tmp_path, path)
+        return len(df)
+    
+    def _tick_files(self, symbol: str, start_time: Optional[datetime], end_time: Optional[datetime]) -> List[Path]:
+        symbol_dir = self._tick_dir(symbol)
+        if not symbol_dir.exists():
+            return []
+        
+        start_hour = pd.Timestamp(start_time).floor('h') if start_time is not None else None
+        end_hour = pd.Timestamp(end_time).floor('h') if end_time is not None else None
+        
+        files = []
+        for day_dir in sorted(symbol_dir.iterdir()):
+            for path in sorted(day_dir.glob('*.parquet')):
+                hour = pd.Timestamp(f"{day_dir.name} {path.stem}:00")
+                if start_hour is not None and hour < start_hour:
+                    continue
+                if end_hour is not None and hour > end_hour:
+                    continue
+                files.append(path)
+        return files
+    
+    def _bar_files(self, symbol: str, timeframe: str, start_time: Optional[datetime], end_time: Optional[datetime]) -> List[Path]:
+        bar_dir = self._bar_dir(symbol, timeframe)
+        if not bar_dir.exists():
+            return []
+        
+        start_day = pd.Timestamp(start_time).floor('D') if start_time is not None else None
+        end_day = pd.Timestamp(end_time).floor('D') if end_time is not None else None
+        
+        files = []
+        for path in sorted(bar_dir.glob('*.parquet')):
+            day = pd.Timestamp(path.stem)
+            if start_day is not None and day < start_day:
+                continue
+            if end_day is not None and day > end_day:
+                continue
+            files.append(path)
+        return files
+    
+    def bar_days(self, symbol: str, timeframe: str, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None) -> List[pd.Timestamp]:
+        return [pd.Timestamp(path.stem) for path in self._bar_files(symbol, timeframe, start_time, end_time)]
+    
+    @staticmethod
+    def _time_filter(start_time: Optional[datetime], end_time: Optional[datetime]):
+        expr = None
+        if start_time is not None:
+            expr = ds.field('timestamp') >= pa.scalar(pd.Timestamp(start_time).to_pydatetime(), pa.timestamp('us'))
+        if end_time is not None:
+            upper = ds.field('timestamp') <= pa.scalar(pd.Timestamp(end_time).to_pydatetime(), pa.timestamp('us'))
+            expr = upper if expr is None else expr & upper
+        return expr
+    
+    def _read(self, files: List[Path], columns: List[str], start_time, end_time, limit: Optional[int]) -> pd.DataFrame:
+        if not files:
+            return pd.DataFrame(columns=columns)
+        
+        # Only the requested columns are decoded and row groups outside the time range
+        # are skipped using their min/max statistics
+        expr = self._time_filter(start_time, end_time)
+        
+        if limit is None:
+            table = ds.dataset([str(f) for f in files], format='parquet').to_table(columns=columns, filter=expr)
+            return table.to_pandas()
+        
+        # Newest rows first: walk partitions backwards until the limit is covered
+        tables = []
+        rows = 0
+        for path in reversed(files):
+            table = ds.dataset(str(path), format='parquet').to_table(columns=columns, filter=expr)
+            if table.num_rows:
+                tables.append(table)
+                rows += table.num_rows
+            if rows >= limit:
+                break
+        
+        if not tables:
+            return pd.DataFrame(columns=columns)
+        
+        df = pa.concat_tables(tables[::-1]).to_pandas()
+        return df.tail(limit).reset_index(drop=True)
+    
+    def read_ticks(self, symbol: str, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, columns: Optional[List[str]] = None, limit: Optional[int] = None) -> pd.DataFrame:
+        columns = [c for c in (columns or TICK_COLUMNS) if c in TICK_ARCHIVE_COLUMNS]
+        if 'timestamp' not in columns:
+            columns = ['timestamp'] + columns
+        files = self._tick_files(symbol, start_time, end_time)
+        return self._read(files, columns, start_time, end_time, limit)
+    
+    def read_bars(self, symbol: str, timeframe: str, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, columns: Optional[List[str]] = None, limit: Optional[int] = None) -> pd.DataFrame:
+        columns = [c for c in (columns or BAR_COLUMNS) if c in BAR_COLUMNS]
+        if 'timestamp' not in columns:
+            columns = ['timestamp'] + columns
+        files = self._bar_files(symbol, timeframe, start_time, end_time)
+        return self._read(files, columns, start_time, end_time, limit)
+    
+    def get_size_bytes(self) -> int:
+        if not self.root.exists():
+            return 0
+        return sum(p.stat().st_size for p in self.root.rglob('*.parquet'))
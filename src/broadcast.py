@@ -0,0 +1,164 @@
+import asyncio
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AnalyticsBroadcaster:
+    
+    SERIES_KEYS = ['timestamps', 'spread', 'z_score', 'rolling_adf', 'rolling_adf_p_value', 'rolling_half_life', 'price_a', 'price_b']
+    BAR_KEYS = ['ohlcv_a', 'ohlcv_b']
+    
+    def __init__(self, compute: Callable[[Any], Awaitable[Optional[dict]]], queue_size: int = 32, resync_every: int = 50):
+        self.compute = compute
+        self.queue_size = queue_size
+        # Deltas only carry new points; a full snapshot is also sent periodically as a
+        # safety net for clients that missed a message
+        self.resync_every = resync_every
+        # key -> {'request', 'subscribers': set of queues, 'last': last result, 'deltas': count}
+        self._subscriptions: Dict[tuple, Dict[str, Any]] = {}
+        self._refreshing = set()
+        self._dirty = set()
+        self._tasks = set()
+        self.computations = 0
+        self.messages_sent = 0
+    
+    @staticmethod
+    def make_key(request) -> tuple:
+        return (
+            request.symbol_a.lower(), request.symbol_b.lower(), request.timeframe,
+            request.window, request.limit, request.regression_type, request.z_score_threshold
+        )
+    
+    async def subscribe(self, request) -> Tuple[tuple, asyncio.Queue]:
+        key = self.make_key(request)
+        subscription = self._subscriptions.get(key)
+        if subscription is None:
+            subscription = {'request': request, 'subscribers': set(), 'last': None, 'deltas': 0}
+            self._subscriptions[key] = subscription
+        
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        subscription['subscribers'].add(queue)
+        
+        if subscription['last'] is None:
+            await self._refresh(key)
+        else:
+            queue.put_nowait(self._snapshot(subscription['last']))
+        
+        return key, queue
+    
+    def unsubscribe(self, key: tuple, queue: asyncio.Queue):
+        subscription = self._subscriptions.get(key)
+        if subscription is None:
+            return
+        
+        subscription['subscribers'].discard(queue)
+        if not subscription['subscribers']:
+            del self._subscriptions[key]
+    
+    def notify(self, timeframe: str, symbols, closed: bool):
+        # Recompute only when a bar closes; partial bar updates are picked up at the next close
+        if not closed:
+            return
+        
+        for key in list(self._subscriptions):
+            if key[2] == timeframe and (key[0] in symbols or key[1] in symbols):
+                task = asyncio.create_task(self._refresh(key))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+    
+    async def _refresh(self, key: tuple):
+        if key in self._refreshing:
+            self._dirty.add(key)
+            return
+        
+        self._refreshing.add(key)
+        try:
+            while True:
+                self._dirty.discard(key)
+                subscription = self._subscriptions.get(key)
+                if subscription is None:
+                    return
+                
+                try:
+                    result = await self.compute(subscription['request'])
+                    self.computations += 1
+                except Exception as e:
+                    logger.error(f"Error computing analytics push for {key}: {e}")
+                    result = None
+                
+                previous = subscription['last']
+                if result is None:
+                    if previous is None:
+                        self._publish(subscription, {'type': 'no_data', 'message': 'Not enough data for analytics'})
+                elif previous is None or subscription['deltas'] >= self.resync_every:
+                    subscription['last'] = result
+                    subscription['deltas'] = 0
+                    self._publish(subscription, self._snapshot(result))
+                else:
+                    subscription['last'] = result
+                    subscription['deltas'] += 1
+                    self._publish(subscription, self.make_delta(previous, result))
+                
+                if key not in self._dirty:
+                    break
+        finally:
+            self._refreshing.discard(key)
+    
+    def _publish(self, subscription: Dict[str, Any], message: dict):
+        for queue in subscription['subscribers']:
+            if queue.full():
+                # Slow consumer: drop what it has not read and resync it with a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                if subscription['last'] is not None:
+                    message_for_queue = self._snapshot(subscription['last'])
+                else:
+                    message_for_queue = message
+                queue.put_nowait(message_for_queue)
+            else:
+                queue.put_nowait(message)
+            self.messages_sent += 1
+    
+    @staticmethod
+    def _snapshot(result: dict) -> dict:
+        return {'type': 'snapshot', 'data': result}
+    
+    def make_delta(self, previous: dict, result: dict) -> dict:
+        previous_timestamps = previous.get('timestamps') or []
+        timestamps = result.get('timestamps') or []
+        if not previous_timestamps or not timestamps or timestamps[0] > previous_timestamps[-1]:
+            return self._snapshot(result)
+        # The spread and everything derived from it is recomputed with the new hedge ratio,
+        # so points the client already holds are stale too
+        if self._hedge_ratio(previous) != self._hedge_ratio(result):
+            return self._snapshot(result)
+        
+        # Resend from the previous last bar onwards since it may have been partial
+        since = previous_timestamps[-1]
+        start = bisect_left(timestamps, since)
+        
+        delta = {'type': 'delta', 'since': since}
+        for key in self.SERIES_KEYS:
+            delta[key] = (result.get(key) or [])[start:]
+        for key in self.BAR_KEYS:
+            delta[key] = [bar for bar in (result.get(key) or []) if bar['time'] >= since]
+        for key, value in result.items():
+            if key not in delta:
+                delta[key] = value
+        
+        return delta
+    
+    @staticmethod
+    def _hedge_ratio(result: dict) -> tuple:
+        hedge_ratio = result.get('hedge_ratio') or {}
+        return hedge_ratio.get('beta'), hedge_ratio.get('alpha')
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'subscriptions': len(self._subscriptions),
+            'subscribers': sum(len(s['subscribers']) for s in self._subscriptions.values()),
+            'computations': self.computations,
+            'messages_sent': self.messages_sent
+        }
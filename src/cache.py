@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AnalyticsCache:
+    
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        # key -> (value, compute_seconds); most recently used entries at the end
+        self._entries: "OrderedDict[tuple, Tuple[Any, float]]" = OrderedDict()
+        # (symbol, timeframe or None) -> generation, bumped on every invalidation so
+        # results computed from data that changed mid-computation are not stored
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.seconds_saved = 0.0
+    
+    @staticmethod
+    def make_key(symbol_a: str, symbol_b: str, timeframe: str, window: int, limit: int, regression_type: str) -> tuple:
+        return (symbol_a.lower(), symbol_b.lower(), timeframe, window, limit, regression_type)
+    
+    def _current_generation(self, key: tuple) -> tuple:
+        return tuple(
+            self._generations.get(gen_key, 0)
+            for gen_key in ((key[0], key[2]), (key[1], key[2]), (key[0], None), (key[1], None))
+        )
+    
+    def generation(self, key: tuple) -> tuple:
+        with self.lock:
+            return self._current_generation(key)
+    
+    def get(self, key: tuple) -> Optional[Any]:
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.seconds_saved += entry[1]
+            return entry[0]
+    
+    def put(self, key: tuple, value: Any, compute_seconds: float = 0.0, generation: Optional[tuple] = None):
+        with self.lock:
+            if generation is not None and generation != self._current_generation(key):
+                return
+            
+            self._entries[key] = (value, compute_seconds)
+            self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, symbol: str, timeframe: Optional[str] = None) -> int:
+        symbol = symbol.lower()
+        
+        with self.lock:
+            gen_key = (symbol, timeframe)
+            self._generations[gen_key] = self._generations.get(gen_key, 0) + 1
+            
+            stale = [
+                key for key in self._entries
+                if symbol in (key[0], key[1]) and (timeframe is None or key[2] == timeframe)
+            ]
+            for key in stale:
+                del self._entries[key]
+            
+            self.invalidations += len(stale)
+            return len(stale)
+    
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'compute_seconds_saved': round(self.seconds_saved, 3)
+            }
@@ -0,0 +1,194 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (shared memory name, shape, dtype) of an input array, all a worker needs to map it
+ArraySpec = Tuple[str, Tuple[int, ...], str]
+
+def _adf_job(series: np.ndarray) -> Dict[str, Any]:
+    from src.analytics import PairsAnalytics
+    return PairsAnalytics().adf_test(pd.Series(series))
+
+def _huber_job(price_a: np.ndarray, price_b: np.ndarray) -> Tuple[float, float, float]:
+    from src.analytics import PairsAnalytics
+    return PairsAnalytics().calculate_hedge_ratio_huber(pd.Series(price_a), pd.Series(price_b))
+
+def _warm_up_job() -> int:
+    # Pays for the analytics and statsmodels imports before the first real request does
+    import statsmodels.api
+    import src.analytics
+    return os.getpid()
+
+JOBS: Dict[str, Callable[..., Any]] = {
+    'adf': _adf_job,
+    'huber': _huber_job,
+    'warm_up': _warm_up_job
+}
+
+def _share_array(array: np.ndarray) -> Tuple[shared_memory.SharedMemory, ArraySpec]:
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+def _call_job(job: str, segments: List[shared_memory.SharedMemory], specs: List[ArraySpec]) -> Any:
+    # Views into the shared segments only live for the duration of this call
+    arrays = [np.ndarray(shape, dtype=dtype, buffer=shm.buf) for shm, (_, shape, dtype) in zip(segments, specs)]
+    return JOBS[job](*arrays)
+
+def _run_job(job: str, specs: List[ArraySpec]) -> Any:
+    # Runs in a worker process: inputs are mapped from shared memory instead of unpickled
+    segments = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        return _call_job(job, segments, specs)
+    finally:
+        for shm in segments:
+            try:
+                shm.close()
+            except BufferError:
+                # A traceback still references a view; the mapping goes with the worker
+                pass
+
+class ComputePool:
+    
+    def __init__(self, max_workers: Optional[int] = None, max_pending: int = 64):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        # Jobs waiting for a worker beyond this make submitters block (or await)
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(self.max_workers + max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {
+            'jobs': 0,
+            'failed_jobs': 0,
+            'running': 0,
+            'backpressure_waits': 0,
+            'shared_bytes': 0
+        }
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Compute pool is closed")
+            if self._executor is None:
+                # Spawned workers do not inherit the server's threads, sockets or locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+    
+    def _reset_executor(self, executor: ProcessPoolExecutor):
+        # A worker that died (e.g. killed for memory) breaks the whole executor; the
+        # next job starts a fresh one
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _start(self, job: str, arrays: Tuple[np.ndarray, ...]) -> Future:
+        # Called with a slot held; the slot is released when the job finishes
+        segments = []
+        try:
+            specs = []
+            for array in arrays:
+                shm, spec = _share_array(array)
+                segments.append(shm)
+                specs.append(spec)
+                self.stats['shared_bytes'] += shm.size
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_run_job, job, specs)
+            except BrokenProcessPool:
+                self._reset_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(_run_job, job, specs)
+        except Exception:
+            self._release(segments)
+            raise
+        
+        self.stats['running'] += 1
+        future.add_done_callback(lambda f: self._finish(f, segments, executor))
+        return future
+    
+    def _release(self, segments: List[shared_memory.SharedMemory]):
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+        self._slots.release()
+    
+    def _finish(self, future: Future, segments: List[shared_memory.SharedMemory], executor: ProcessPoolExecutor):
+        self.stats['running'] -= 1
+        self.stats['jobs'] += 1
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error is not None:
+            self.stats['failed_jobs'] += 1
+        if isinstance(error, BrokenProcessPool):
+            self._reset_executor(executor)
+        self._release(segments)
+    
+    def submit(self, job: str, *arrays: np.ndarray) -> Future:
+        if job not in JOBS:
+            raise ValueError(f"Unknown compute job: {job}")
+        if not self._slots.acquire(blocking=False):
+            self.stats['backpressure_waits'] += 1
+            self._slots.acquire()
+        return self._start(job, arrays)
+    
+    def run(self, job: str, *arrays: np.ndarray, timeout: Optional[float] = None) -> Any:
+        return self.submit(job, *arrays).result(timeout)
+    
+    async def run_async(self, job: str, *arrays: np.ndarray) -> Any:
+        if job not in JOBS:
+            raise ValueError(f"Unknown compute job: {job}")
+        if not self._slots.acquire(blocking=False):
+            # Wait for a free slot off the event loop instead of blocking it
+            self.stats['backpressure_waits'] += 1
+            await asyncio.to_thread(self._slots.acquire)
+        return await asyncio.wrap_future(self._start(job, arrays))
+    
+    def warm_up(self) -> List[Future]:
+        # One job per worker so every process is started and has imported its libraries
+        return [self.submit('warm_up') for _ in range(self.max_workers)]
+    
+    def close(self):
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['max_workers'] = self.max_workers
+        stats['max_pending'] = self.max_pending
+        return stats
+
+_shared_pool: Optional[ComputePool] = None
+_shared_pool_lock = threading.Lock()
+
+def get_compute_pool(max_workers: Optional[int] = None, max_pending: int = 64) -> ComputePool:
+    # One pool per process, created on first use
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ComputePool(max_workers, max_pending)
+        return _shared_pool
+
+def close_compute_pool():
+    global _shared_pool
+    with _shared_pool_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.close()
@@ -1,20 +1,49 @@
 import asyncio
 import json
+import time
 import websockets
-from datetime import datetime
-from typing import List, Callable, Dict, Any
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import List, Callable, Dict, Any, Tuple, Optional
 import logging
 
+try:
+    import orjson
+    _fast_loads = orjson.loads
+except ImportError:
+    _fast_loads = json.loads
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class BinanceWSCollector:
     
-    def __init__(self, symbols: List[str], callback: Callable):
+    def __init__(self, symbols: List[str], callback: Callable, fast_decode: bool = False, batch_size: int = 0, batch_interval: float = 0.05):
         self.symbols = [s.lower() for s in symbols]
         self.callback = callback
         self.tasks = []
         self.running = False
+        # fast_decode: orjson (when installed) and integer epoch-ms timestamps
+        self.fast_decode = fast_decode
+        self._loads = _fast_loads if fast_decode else json.loads
+        self._normalize = self.normalize_tick_fast if fast_decode else self.normalize_tick
+        # batch_size > 0: callback receives lists of up to batch_size ticks, flushed at
+        # least every batch_interval seconds
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._batch = []
+        self._offset_second = None
+        self._utc_offset_ms = 0
+    
+    def _local_utc_offset_ms(self, timestamp_ms: int) -> int:
+        # The local UTC offset in force at the trade, so a DST change moves it like it moves
+        # datetime.fromtimestamp. Ticks of the same second share one lookup
+        second = timestamp_ms // 1000
+        if second != self._offset_second:
+            self._offset_second = second
+            self._utc_offset_ms = time.localtime(second).tm_gmtoff * 1000
+        return self._utc_offset_ms
         
     def normalize_tick(self, raw_data: Dict[str, Any]) -> Dict[str, Any]:
         timestamp = datetime.fromtimestamp(raw_data['T'] / 1000.0)
@@ -27,6 +56,45 @@ class BinanceWSCollector:
             'is_buyer_maker': raw_data['m']
         }
     
+    def normalize_tick_fast(self, raw_data: Dict[str, Any]) -> Dict[str, Any]:
+        # Epoch milliseconds shifted to local wall-clock time, matching normalize_tick's
+        # naive datetimes so both paths produce the same bars and stored timestamps
+        return {
+            'timestamp': raw_data['T'] + self._local_utc_offset_ms(raw_data['T']),
+            'symbol': raw_data['s'].lower(),
+            'price': float(raw_data['p']),
+            'size': float(raw_data['q']),
+            'is_buyer_maker': raw_data['m']
+        }
+    
+    async def _emit(self, tick: Dict[str, Any]):
+        if not self.batch_size:
+            await self.callback(tick)
+            return
+        
+        self._batch.append(tick)
+        if len(self._batch) >= self.batch_size:
+            await self._flush_batch()
+    
+    async def _flush_batch(self):
+        if not self._batch:
+            return
+        
+        batch, self._batch = self._batch, []
+        await self.callback(batch)
+    
+    async def _flush_batches_periodically(self):
+        while self.running:
+            await asyncio.sleep(self.batch_interval)
+            try:
+                await self._flush_batch()
+            except Exception as e:
+                logger.error(f"Error delivering tick batch: {e}")
+    
+    def _start_batch_flusher(self):
+        if self.batch_size:
+            self.tasks.append(asyncio.create_task(self._flush_batches_periodically()))
+    
     async def _subscribe_symbol(self, symbol: str):
         url = f"wss://fstream.binance.com/ws/{symbol}@trade"
         
@@ -40,11 +108,10 @@ class BinanceWSCollector:
                             break
                             
                         try:
-                            data = json.loads(message)
+                            data = self._loads(message)
                             
                             if data.get('e') == 'trade':
-                                normalized = self.normalize_tick(data)
-                                await self.callback(normalized)
+                                await self._emit(self._normalize(data))
                                 
                         except json.JSONDecodeError as e:
                             logger.error(f"JSON decode error for {symbol}: {e}")
@@ -69,6 +136,7 @@ class BinanceWSCollector:
             asyncio.create_task(self._subscribe_symbol(symbol))
             for symbol in self.symbols
         ]
+        self._start_batch_flusher()
         
         await asyncio.gather(*self.tasks, return_exceptions=True)
     
@@ -80,30 +148,392 @@ class BinanceWSCollector:
             task.cancel()
         
         await asyncio.gather(*self.tasks, return_exceptions=True)
+        try:
+            await self._flush_batch()
+        except Exception as e:
+            logger.error(f"Error delivering final tick batch: {e}")
         logger.info("Collector stopped")
 
-class TickBuffer:
+class BinanceCombinedStreamCollector(BinanceWSCollector):
     
-    def __init__(self, max_size: int = 100000):
-        self.buffer = []
-        self.max_size = max_size
+    BASE_URL = "wss://fstream.binance.com"
+    
+    def __init__(self, symbols: List[str], callback: Callable, base_url: str = BASE_URL, **kwargs):
+        super().__init__(symbols, callback, **kwargs)
+        self.base_url = base_url.rstrip('/')
+        self.ws = None
+        self._request_id = 0
+        self.messages_received = 0
+    
+    @staticmethod
+    def _stream_name(symbol: str) -> str:
+        return f"{symbol}@trade"
+    
+    def _url(self, symbols: List[str]) -> str:
+        if not symbols:
+            return f"{self.base_url}/stream"
+        return f"{self.base_url}/stream?streams=" + "/".join(self._stream_name(s) for s in symbols)
+    
+    async def _send_request(self, method: str, symbols: List[str]):
+        if self.ws is None or not symbols:
+            # Not connected: the next (re)connect picks the change up from the URL
+            return
+        
+        self._request_id += 1
+        await self.ws.send(json.dumps({
+            'method': method,
+            'params': [self._stream_name(s) for s in symbols],
+            'id': self._request_id
+        }))
+    
+    async def subscribe(self, symbols: List[str]):
+        new_symbols = [s.lower() for s in symbols if s.lower() not in self.symbols]
+        self.symbols.extend(new_symbols)
+        await self._send_request('SUBSCRIBE', new_symbols)
+    
+    async def unsubscribe(self, symbols: List[str]):
+        removed = [s.lower() for s in symbols if s.lower() in self.symbols]
+        self.symbols = [s for s in self.symbols if s not in removed]
+        await self._send_request('UNSUBSCRIBE', removed)
+    
+    async def _handle_message(self, message):
+        data = self._loads(message)
+        self.messages_received += 1
+        
+        stream = data.get('stream')
+        if stream is None:
+            if data.get('error'):
+                logger.error(f"Stream request {data.get('id')} failed: {data['error']}")
+            return
+        
+        symbol = stream.split('@', 1)[0]
+        payload = data.get('data', {})
+        
+        # Frames can still arrive for a stream between UNSUBSCRIBE and its acknowledgement
+        if symbol not in self.symbols:
+            return
+        
+        if payload.get('e') == 'trade':
+            await self._emit(self._normalize(payload))
+    
+    async def _run(self):
+        while self.running:
+            try:
+                connected = list(self.symbols)
+                async with websockets.connect(self._url(connected)) as ws:
+                    self.ws = ws
+                    logger.info(f"Connected combined stream for {len(connected)} symbols")
+                    
+                    # Subscription changes made during the handshake could not be sent yet
+                    await self._send_request('SUBSCRIBE', [s for s in self.symbols if s not in connected])
+                    await self._send_request('UNSUBSCRIBE', [s for s in connected if s not in self.symbols])
+                    
+                    async for message in ws:
+                        if not self.running:
+                            break
+                        
+                        try:
+                            await self._handle_message(message)
+                        except json.JSONDecodeError as e:
+                            logger.error(f"JSON decode error on combined stream: {e}")
+                        except Exception as e:
+                            logger.error(f"Error processing combined stream message: {e}")
+                            
+            except websockets.exceptions.WebSocketException as e:
+                logger.error(f"Combined stream WebSocket error: {e}")
+                if self.running:
+                    logger.info("Reconnecting combined stream in 5 seconds...")
+                    await asyncio.sleep(5)
+            except Exception as e:
+                logger.error(f"Unexpected combined stream error: {e}")
+                if self.running:
+                    await asyncio.sleep(5)
+            finally:
+                self.ws = None
+    
+    async def start(self):
+        self.running = True
+        logger.info(f"Starting combined stream collection for symbols: {self.symbols}")
+        
+        self.tasks = [asyncio.create_task(self._run())]
+        self._start_batch_flusher()
+        
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+class CollectorRegistry:
+    
+    def __init__(self, collector_factory: Optional[Callable] = None, multiplexed: bool = False, collector_options: Optional[Dict[str, Any]] = None):
+        # multiplexed: one combined-stream connection shared by every symbol,
+        # otherwise one collector (and connection) per symbol
+        self.multiplexed = multiplexed
+        if collector_factory is None:
+            collector_factory = BinanceCombinedStreamCollector if multiplexed else BinanceWSCollector
+        self.collector_factory = collector_factory
+        self.collector_options = collector_options or {}
+        # symbol -> subscriber callbacks; the first subscriber owns persistence for the symbol.
+        # Subscribers are always called with a list of ticks.
+        self._subscribers: Dict[str, List[Callable]] = {}
+        # callback -> timeframes it builds bars for; a symbol's bars for a timeframe belong to
+        # the first subscriber that builds that timeframe
+        self._bar_timeframes: Dict[Callable, set] = {}
+        self._collectors: Dict[str, BinanceWSCollector] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._shared_collector = None
+        self._shared_task = None
         self.lock = asyncio.Lock()
+        self.ticks_received = 0
+        self.ticks_delivered = 0
     
-    async def add(self, tick: Dict[str, Any]):
+    def _create_collector(self, symbols: List[str]) -> BinanceWSCollector:
+        callback = self._dispatch_batch if self.collector_options.get('batch_size') else self._dispatch
+        return self.collector_factory(symbols=symbols, callback=callback, **self.collector_options)
+    
+    async def _dispatch(self, tick: Dict[str, Any]):
+        await self._dispatch_batch([tick])
+    
+    async def _dispatch_batch(self, ticks: List[Dict[str, Any]]):
+        self.ticks_received += len(ticks)
+        
+        deliveries = {}
+        for tick in ticks:
+            for callback in self._subscribers.get(tick['symbol'], ()):
+                deliveries.setdefault(callback, []).append(tick)
+        
+        for callback, batch in deliveries.items():
+            try:
+                await callback(batch)
+                self.ticks_delivered += len(batch)
+            except Exception as e:
+                logger.error(f"Subscriber error for {len(batch)} ticks: {e}")
+    
+    async def acquire(self, symbols: List[str], callback: Callable, timeframes: Optional[List[str]] = None):
         async with self.lock:
-            self.buffer.append(tick)
+            if timeframes is not None:
+                self._bar_timeframes[callback] = set(timeframes)
+            new_symbols = []
+            for symbol in [s.lower() for s in symbols]:
+                if symbol not in self._subscribers:
+                    new_symbols.append(symbol)
+                self._subscribers.setdefault(symbol, []).append(callback)
+            
+            if not new_symbols:
+                return
             
-            if len(self.buffer) > self.max_size:
-                self.buffer = self.buffer[-self.max_size:]
+            if self.multiplexed:
+                if self._shared_collector is None:
+                    self._shared_collector = self._create_collector(new_symbols)
+                    self._shared_task = asyncio.create_task(self._shared_collector.start())
+                else:
+                    await self._shared_collector.subscribe(new_symbols)
+                logger.info(f"Subscribed shared stream to {new_symbols}")
+                return
+            
+            for symbol in new_symbols:
+                collector = self._create_collector([symbol])
+                self._collectors[symbol] = collector
+                self._tasks[symbol] = asyncio.create_task(collector.start())
+                logger.info(f"Started shared collector for {symbol}")
     
-    async def get_all(self) -> List[Dict[str, Any]]:
+    def detach(self, symbols: List[str], callback: Callable) -> List[str]:
+        unused = []
+        
+        for symbol in [s.lower() for s in symbols]:
+            subscribers = self._subscribers.get(symbol, [])
+            if callback in subscribers:
+                subscribers.remove(callback)
+            
+            if not subscribers and symbol in self._subscribers:
+                del self._subscribers[symbol]
+                unused.append(symbol)
+                
+                collector = self._collectors.get(symbol)
+                if collector is not None:
+                    collector.running = False
+        
+        if not any(callback in subscribers for subscribers in self._subscribers.values()):
+            self._bar_timeframes.pop(callback, None)
+        
+        if self.multiplexed and self._shared_collector is not None and not self._subscribers:
+            # The stopped collector cannot be reused; the next acquire starts a new one
+            self._shared_collector.running = False
+            self._shared_collector = None
+            self._shared_task = None
+        
+        return unused
+    
+    async def release(self, symbols: List[str], callback: Callable):
         async with self.lock:
-            return self.buffer.copy()
+            # detach drops the shared collector once nothing uses it; it still has to be stopped
+            collector = self._shared_collector
+            unused = self.detach(symbols, callback)
+            if not unused:
+                return
+            
+            if self.multiplexed:
+                if self._subscribers:
+                    await self._shared_collector.unsubscribe(unused)
+                    logger.info(f"Unsubscribed shared stream from {unused}")
+                elif collector is not None:
+                    await collector.stop()
+                    logger.info("Stopped shared stream")
+                return
+            
+            for symbol in unused:
+                collector = self._collectors.pop(symbol)
+                self._tasks.pop(symbol, None)
+                await collector.stop()
+                logger.info(f"Stopped shared collector for {symbol}")
+    
+    def is_owner(self, symbol: str, callback: Callable) -> bool:
+        subscribers = self._subscribers.get(symbol.lower())
+        return bool(subscribers) and subscribers[0] == callback
+    
+    def is_bar_owner(self, symbol: str, timeframe: str, callback: Callable) -> bool:
+        # Subscribers that did not declare timeframes are taken to build all of them
+        for subscriber in self._subscribers.get(symbol.lower(), ()):
+            timeframes = self._bar_timeframes.get(subscriber)
+            if timeframes is None or timeframe in timeframes:
+                return subscriber == callback
+        return False
+    
+    def refcount(self, symbol: str) -> int:
+        return len(self._subscribers.get(symbol.lower(), ()))
+    
+    def get_status(self) -> Dict[str, Any]:
+        if self.multiplexed:
+            connections = 1 if self._shared_collector is not None else 0
+        else:
+            connections = len(self._collectors)
+        
+        return {
+            'symbols': {symbol: len(subs) for symbol, subs in self._subscribers.items()},
+            'multiplexed': self.multiplexed,
+            'connections': connections,
+            'ticks_received': self.ticks_received,
+            'ticks_delivered': self.ticks_delivered
+        }
+
+
+collector_registry = CollectorRegistry(multiplexed=True, collector_options={'fast_decode': True, 'batch_size': 256})
+
+
+class TickBuffer:
+    
+    _EPOCH = datetime(1970, 1, 1)
+    _ONE_US = timedelta(microseconds=1)
+    
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        # Preallocated ring of columns; timestamps are nanoseconds since the (naive) epoch
+        self.timestamps = np.zeros(max_size, dtype=np.int64)
+        self.prices = np.zeros(max_size, dtype=np.float64)
+        self.sizes = np.zeros(max_size, dtype=np.float64)
+        self.sides = np.zeros(max_size, dtype=np.bool_)
+        self.symbol_ids = np.zeros(max_size, dtype=np.int32)
+        self.symbols: List[str] = []
+        self._symbol_index: Dict[str, int] = {}
+        # Sequence number that the next added tick will receive
+        self.next_seq = 0
+        self._start_seq = 0
+    
+    def _to_nanos(self, timestamp: Any) -> int:
+        if isinstance(timestamp, (int, np.integer)):
+            # Integer timestamps are epoch milliseconds (see normalize_tick_fast)
+            return int(timestamp) * 1_000_000
+        if isinstance(timestamp, pd.Timestamp):
+            return timestamp.value
+        if isinstance(timestamp, datetime):
+            return (timestamp - self._EPOCH) // self._ONE_US * 1000
+        return pd.Timestamp(timestamp).value
+    
+    def _symbol_id(self, symbol: str) -> int:
+        symbol_id = self._symbol_index.get(symbol)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.symbols.append(symbol)
+            self._symbol_index[symbol] = symbol_id
+        return symbol_id
+    
+    async def add(self, tick: Dict[str, Any]):
+        i = self.next_seq % self.max_size
+        self.timestamps[i] = self._to_nanos(tick['timestamp'])
+        self.prices[i] = tick['price']
+        self.sizes[i] = tick['size']
+        self.sides[i] = tick.get('is_buyer_maker', False)
+        self.symbol_ids[i] = self._symbol_id(tick['symbol'])
+        self.next_seq += 1
+    
+    async def add_batch(self, ticks: List[Dict[str, Any]]):
+        if not ticks:
+            return
+        
+        if len(ticks) > self.max_size:
+            self.next_seq += len(ticks) - self.max_size
+            ticks = ticks[-self.max_size:]
+        
+        timestamps = [t['timestamp'] for t in ticks]
+        if isinstance(timestamps[0], int):
+            nanos = np.array(timestamps, dtype=np.int64) * 1_000_000
+        else:
+            nanos = np.array([self._to_nanos(t) for t in timestamps], dtype=np.int64)
+        
+        columns = (
+            (self.timestamps, nanos),
+            (self.prices, np.array([t['price'] for t in ticks], dtype=np.float64)),
+            (self.sizes, np.array([t['size'] for t in ticks], dtype=np.float64)),
+            (self.sides, np.array([t.get('is_buyer_maker', False) for t in ticks], dtype=np.bool_)),
+            (self.symbol_ids, np.array([self._symbol_id(t['symbol']) for t in ticks], dtype=np.int32))
+        )
+        
+        start = self.next_seq % self.max_size
+        first = min(len(ticks), self.max_size - start)
+        for arr, values in columns:
+            arr[start:start + first] = values[:first]
+            arr[:len(ticks) - first] = values[first:]
+        
+        self.next_seq += len(ticks)
+    
+    def _oldest_seq(self) -> int:
+        return max(self.next_seq - self.max_size, self._start_seq)
+    
+    def get_columns(self, start_seq: int, end_seq: int) -> Dict[str, np.ndarray]:
+        # Views into the ring when the range does not wrap, otherwise one copy per column
+        start = start_seq % self.max_size
+        count = end_seq - start_seq
+        columns = {}
+        
+        for name, arr in (('timestamp', self.timestamps), ('price', self.prices), ('size', self.sizes),
+                          ('is_buyer_maker', self.sides), ('symbol_id', self.symbol_ids)):
+            if start + count <= self.max_size:
+                columns[name] = arr[start:start + count]
+            else:
+                columns[name] = np.concatenate([arr[start:], arr[:start + count - self.max_size]])
+        
+        return columns
+    
+    def to_frame(self, start_seq: int, end_seq: int) -> pd.DataFrame:
+        columns = self.get_columns(start_seq, end_seq)
+        
+        return pd.DataFrame({
+            'timestamp': columns['timestamp'].view('datetime64[ns]'),
+            'symbol': pd.Categorical.from_codes(columns['symbol_id'], categories=self.symbols or ['']),
+            'price': columns['price'],
+            'size': columns['size'],
+            'is_buyer_maker': columns['is_buyer_maker']
+        }, copy=False)
+    
+    async def get_all(self) -> pd.DataFrame:
+        return self.to_frame(self._oldest_seq(), self.next_seq)
+    
+    async def get_since(self, seq: int) -> Tuple[pd.DataFrame, int, int]:
+        # Returns (ticks, start_seq, next_seq); start_seq > seq means older ticks were evicted unread
+        start_seq = min(max(seq, self._oldest_seq()), self.next_seq)
+        return self.to_frame(start_seq, self.next_seq), start_seq, self.next_seq
     
     async def clear(self):
-        async with self.lock:
-            self.buffer.clear()
+        # Drop buffered ticks without rewinding the sequence so existing cursors stay valid
+        self._start_seq = self.next_seq
     
     async def size(self) -> int:
-        async with self.lock:
-            return len(self.buffer)
+        return self.next_seq - self._oldest_seq()
@@ -0,0 +1,152 @@
+import io
+import numpy as np
+import pandas as pd
+from typing import Iterable, Iterator, Tuple
+import logging
+
+from src.archive import HAS_PYARROW
+from src.analytics import PairsAnalytics, create_online_estimator
+
+if HAS_PYARROW:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ['timestamp', 'price_a', 'price_b', 'spread', 'z_score']
+
+def estimate_hedge_ratio(chunks: Iterable[pd.DataFrame]) -> Tuple[float, float, int]:
+    # OLS of leg a on leg b from running sums, so the range never has to fit in memory.
+    # Sums are taken around the first prices to avoid cancellation on large levels
+    n = 0
+    shift_a = shift_b = None
+    sum_a = sum_b = sum_ab = sum_bb = 0.0
+    
+    for chunk in chunks:
+        a = chunk['close_a'].to_numpy(dtype=np.float64)
+        b = chunk['close_b'].to_numpy(dtype=np.float64)
+        if len(a) == 0:
+            continue
+        if shift_a is None:
+            shift_a, shift_b = a[0], b[0]
+        
+        da = a - shift_a
+        db = b - shift_b
+        n += len(a)
+        sum_a += da.sum()
+        sum_b += db.sum()
+        sum_ab += (da * db).sum()
+        sum_bb += (db * db).sum()
+    
+    if n < 2:
+        return 0.0, 0.0, n
+    
+    var_b = sum_bb - sum_b * sum_b / n
+    if var_b <= 0:
+        return 0.0, 0.0, n
+    
+    beta = (sum_ab - sum_a * sum_b / n) / var_b
+    alpha = (shift_a + sum_a / n) - beta * (shift_b + sum_b / n)
+    return beta, alpha, n
+
+def estimate_online_hedge_ratio(chunks: Iterable[pd.DataFrame], method: str) -> Tuple[float, float, int]:
+    # Kalman and RLS are O(1) per bar, so the range streams through them the same way
+    # calculate_hedge_ratio_online walks a loaded frame; the final state is the hedge ratio
+    estimator = create_online_estimator(method)
+    n = 0
+    
+    for chunk in chunks:
+        pairs = chunk[['close_a', 'close_b']].dropna()
+        for y, x in zip(pairs['close_a'].to_numpy(dtype=np.float64), pairs['close_b'].to_numpy(dtype=np.float64)):
+            estimator.update(y, x)
+        n += len(pairs)
+    
+    if n < 2:
+        return 0.0, 0.0, n
+    return estimator.beta, estimator.alpha, n
+
+def iter_spread_frames(chunks: Iterable[pd.DataFrame], beta: float, window: int, analytics: PairsAnalytics) -> Iterator[pd.DataFrame]:
+    # The last window-1 spread values are carried into the next chunk so the rolling
+    # z-score matches a computation over the whole range
+    tail = pd.Series(dtype=np.float64)
+    offset = 0
+    
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        
+        spread = chunk['close_a'] - beta * chunk['close_b']
+        extended = pd.concat([tail, spread]) if len(tail) else spread
+        z_score = analytics.calculate_z_score(extended, window).iloc[len(tail):]
+        tail = extended.iloc[-(window - 1):] if window > 1 else tail
+        
+        yield pd.DataFrame({
+            'timestamp': chunk.index,
+            'price_a': chunk['close_a'].to_numpy(),
+            'price_b': chunk['close_b'].to_numpy(),
+            'spread': spread.to_numpy(),
+            'z_score': z_score.to_numpy()
+        }, index=pd.RangeIndex(offset, offset + len(chunk)))
+        offset += len(chunk)
+
+def split_frame(df: pd.DataFrame, chunk_size: int) -> Iterator[pd.DataFrame]:
+    for offset in range(0, len(df), chunk_size):
+        yield df.iloc[offset:offset + chunk_size]
+
+def iter_csv(frames: Iterable[pd.DataFrame]) -> Iterator[str]:
+    header = True
+    for frame in frames:
+        yield frame.to_csv(header=header)
+        header = False
+    
+    if header:
+        yield pd.DataFrame(columns=EXPORT_COLUMNS).to_csv()
+
+class _StreamSink(io.RawIOBase):
+    
+    # Collects what the Parquet writer emits so it can be sent as it is produced
+    
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_parquet(frames: Iterable[pd.DataFrame]) -> Iterator[bytes]:
+    if not HAS_PYARROW:
+        raise ImportError("pyarrow is required for Parquet export")
+    
+    schema = pa.schema([
+        ('timestamp', pa.timestamp('ns')),
+        ('price_a', pa.float64()),
+        ('price_b', pa.float64()),
+        ('spread', pa.float64()),
+        ('z_score', pa.float64())
+    ])
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    
+    # Each chunk becomes one row group that is flushed to the client straight away
+    for frame in frames:
+        writer.write_table(pa.Table.from_pandas(frame[EXPORT_COLUMNS], schema=schema, preserve_index=False))
+        data = sink.drain()
+        if data:
+            yield data
+    
+    writer.close()
+    yield sink.drain()
@@ -1,90 +1,401 @@
 import asyncio
+import threading
 import pandas as pd
-from typing import List, Optional
+import numpy as np
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import logging
 
-from src.data_ingestion import BinanceWSCollector, TickBuffer
-from src.storage import DataStore
-from src.resampler import DataResampler
-from src.analytics import PairsAnalytics
+from src.data_ingestion import TickBuffer, CollectorRegistry, collector_registry
+from src.storage import DataStore, PAIR_BAR_FIELDS, tick_payload_bytes
+from src.resampler import DataResampler, StreamingBarBuilder
+from src.analytics import PairsAnalytics, RollingPairMoments, ONLINE_ESTIMATORS, create_online_estimator
+from src.compute import ComputePool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Rolling ADF / half-life window as a multiple of the z-score window
+ROLLING_STAT_WINDOW_FACTOR = 5
+
+# Hedge ratio methods a pipeline can alert on; online ones come from ONLINE_ESTIMATORS
+BATCH_REGRESSION_TYPES = ('ols', 'huber')
+
+# Extra z-score windows kept per timeframe for analytics requests, beyond the pipeline's own
+MAX_REQUESTED_WINDOWS = 8
+
 class MarketDataPipeline:
     
-    def __init__(self, symbols: List[str], db_path: str = "market_data.db", buffer_size: int = 100000):
+    def __init__(self, symbols: List[str], db_path: str = "market_data.db", buffer_size: int = 100000, registry: Optional[CollectorRegistry] = None, data_store: Optional[DataStore] = None, compute_pool: Optional[ComputePool] = None, z_score_window: int = 20, z_score_threshold: Optional[float] = 2.0, regression_type: str = 'ols', hedge_window: int = 200):
+        if regression_type not in BATCH_REGRESSION_TYPES and regression_type not in ONLINE_ESTIMATORS:
+            raise ValueError(f"Unsupported regression type: {regression_type}")
         self.symbols = symbols
         self.tick_buffer = TickBuffer(max_size=buffer_size)
-        self.data_store = DataStore(db_path=db_path)
+        # A shared store is owned by whoever created it and is not closed with the pipeline
+        self._owns_store = data_store is None
+        self.data_store = data_store or DataStore(db_path=db_path, async_writes=True)
         self.resampler = DataResampler()
-        self.analytics = PairsAnalytics()
-        self.collector = None
+        self.bar_builder = None
+        self.analytics = PairsAnalytics(compute_pool)
+        # (timeframe, method) -> OnlineHedgeRatio, fed with closed bars of the pair; each
+        # keeps its spread's mean, std and z-score over the last z_score_window bars
+        self.online_estimators = {}
+        self._pending_closes = {}
+        self.z_score_window = z_score_window
+        # (timeframe, window) -> RollingPairMoments of the pair's closes. The z-score and hedge
+        # windows are always kept; windows asked for by analytics requests are added on demand.
+        # Requests read them from worker threads, hence the lock
+        self.pair_moments = {}
+        self._moments_lock = threading.Lock()
+        self._last_close = {}
+        # Z-SCORE alerts fire at the bar close where |z| first crosses the threshold, with the
+        # spread hedged by regression_type over the last hedge_window closes
+        self.z_score_threshold = z_score_threshold
+        self.regression_type = regression_type
+        self.hedge_window = hedge_window
+        self._huber_beta = {}
+        self._z_alerts_active = set()
+        self.registry = registry or collector_registry
+        # Called as listener(timeframe, symbols, closed) after bars are written
+        self.bar_listeners = []
         self.running = False
         self.persist_task = None
         self.resample_task = None
+        self._persist_cursor = 0
+        self.persist_stats = {
+            'cycles': 0,
+            'rows_written': 0,
+            'bytes_written': 0,
+            'last_rows': 0,
+            'last_bytes': 0,
+            'dropped_ticks': 0
+        }
     
     async def _tick_callback(self, tick: dict):
-        await self.tick_buffer.add(tick)
+        await self._ticks_callback([tick])
+    
+    async def _ticks_callback(self, ticks: List[dict]):
+        await self.tick_buffer.add_batch(ticks)
+        if self.bar_builder:
+            for tick in ticks:
+                self.bar_builder.update(tick)
+    
+    def _owned_symbols(self) -> List[str]:
+        # Ticks of symbols shared with other pipelines are persisted only by their first subscriber
+        return [
+            s for s in self.symbols
+            if self.registry.refcount(s) == 0 or self.registry.is_owner(s, self._ticks_callback)
+        ]
+    
+    def _owned_bar_symbols(self, timeframe: str) -> List[str]:
+        # Bars are owned per timeframe, so a pipeline always stores the timeframes only it builds
+        return [
+            s for s in self.symbols
+            if self.registry.refcount(s) == 0 or self.registry.is_bar_owner(s, timeframe, self._ticks_callback)
+        ]
+    
+    async def _persist_new_ticks(self, symbols: Optional[List[str]] = None) -> int:
+        ticks, start_seq, next_seq = await self.tick_buffer.get_since(self._persist_cursor)
+        
+        if symbols is None:
+            symbols = self._owned_symbols()
+        if len(symbols) < len(self.symbols):
+            ticks = ticks[ticks['symbol'].isin(symbols)]
+        
+        if start_seq > self._persist_cursor:
+            dropped = start_seq - self._persist_cursor
+            self.persist_stats['dropped_ticks'] += dropped
+            logger.warning(f"{dropped} ticks were evicted from the buffer before being persisted")
+        
+        if ticks.empty:
+            self._persist_cursor = next_seq
+            return 0
+        
+        rows = await self.data_store.insert_ticks_batch_async(ticks)
+        if rows == 0:
+            # Leave the cursor where it is so the same ticks are retried next cycle
+            self._persist_cursor = start_seq
+            return 0
+        
+        # Encoded row payload rather than file growth, which reads zero whenever freed pages are reused
+        bytes_written = tick_payload_bytes(ticks)
+        self._persist_cursor = next_seq
+        
+        self.persist_stats['cycles'] += 1
+        self.persist_stats['rows_written'] += rows
+        self.persist_stats['bytes_written'] += bytes_written
+        self.persist_stats['last_rows'] = rows
+        self.persist_stats['last_bytes'] = bytes_written
+        
+        logger.info(f"Persisted {rows} new ticks to database (+{bytes_written} bytes)")
+        return rows
     
     async def _persist_ticks_periodically(self, interval: int = 10):
         while self.running:
             try:
                 await asyncio.sleep(interval)
-                ticks = await self.tick_buffer.get_all()
-                if ticks:
-                    self.data_store.insert_ticks_batch(ticks)
-                    logger.info(f"Persisted {len(ticks)} ticks to database")
+                await self._persist_new_ticks()
             except Exception as e:
                 logger.error(f"Error persisting ticks: {e}")
     
-    async def _resample_periodically(self, timeframes: List[str], interval: int = 5):
+    def get_persist_stats(self) -> dict:
+        stats = dict(self.persist_stats, cursor=self._persist_cursor)
+        if self.data_store.writer is not None:
+            stats['writer'] = self.data_store.writer.get_stats()
+        return stats
+    
+    async def _flush_bars(self, owned_bars: Optional[Dict[str, List[str]]] = None) -> int:
+        # owned_bars: timeframe -> symbols whose bars this pipeline writes, default the current owners
+        bars = self.bar_builder.drain()
+        written = 0
+        
+        for timeframe, df in bars.items():
+            try:
+                if owned_bars is None:
+                    symbols = self._owned_bar_symbols(timeframe)
+                else:
+                    symbols = owned_bars.get(timeframe, [])
+                owned = df[df['symbol'].isin(symbols)]
+                if not owned.empty and await self._write_bars(timeframe, owned):
+                    written += len(owned)
+                    logger.debug(f"Wrote {len(owned)} {timeframe} bars ({int(owned['is_closed'].sum())} closed)")
+                    self._notify_bar_listeners(timeframe, owned)
+            except Exception as e:
+                logger.error(f"Error writing {timeframe} bars: {e}")
+            
+            try:
+                if self._on_bars_closed(timeframe, df[df['is_closed']]) and self.regression_type == 'huber':
+                    await asyncio.to_thread(self._refit_huber, timeframe)
+                    self._check_z_score_alert(timeframe)
+            except Exception as e:
+                logger.error(f"Error updating online analytics for {timeframe}: {e}")
+        
+        return written
+    
+    async def _write_bars(self, timeframe: str, bars: pd.DataFrame) -> int:
+        source = self.bar_builder.sources[timeframe]
+        if source is None:
+            return await self.data_store.insert_resampled_async(bars, timeframe)
+        
+        # Coarser bars are rebuilt from the source bars just written, so a bar that was
+        # open across a restart keeps the part stored before it. Source bars written by another
+        # pipeline may not be flushed yet, so those symbols are stored as built
+        written = 0
+        rolled = bars['symbol'].isin(self._owned_bar_symbols(source))
+        if not rolled.all():
+            written += await self.data_store.insert_resampled_async(bars[~rolled], timeframe)
+        for symbol, symbol_bars in bars[rolled].groupby('symbol'):
+            written += await self.data_store.rollup_resampled_async(
+                symbol, source, timeframe, symbol_bars['timestamp'].min(), symbol_bars['timestamp'].max()
+            )
+        return written
+    
+    def add_bar_listener(self, listener):
+        if listener not in self.bar_listeners:
+            self.bar_listeners.append(listener)
+    
+    def _notify_bar_listeners(self, timeframe: str, bars: pd.DataFrame):
+        symbols = bars['symbol'].unique().tolist()
+        closed = bool(bars['is_closed'].any())
+        for listener in self.bar_listeners:
+            try:
+                listener(timeframe, symbols, closed)
+            except Exception as e:
+                logger.error(f"Bar listener error: {e}")
+    
+    def _init_online_estimators(self, timeframes: List[str], warmup_bars: int = 500):
+        if len(self.symbols) != 2:
+            return
+        
+        symbol_a, symbol_b = self.symbols
+        for timeframe in timeframes:
+            self._pending_closes[timeframe] = {}
+            for method in ONLINE_ESTIMATORS:
+                self.online_estimators[(timeframe, method)] = create_online_estimator(method, window=self.z_score_window)
+            for window in (self.z_score_window, self.hedge_window):
+                self.pair_moments[(timeframe, window)] = RollingPairMoments(window)
+            
+            # Warm start from stored bars so the estimate is usable immediately
+            try:
+                bars = self.data_store.get_pair_bars(symbol_a, symbol_b, timeframe, max(warmup_bars, self.hedge_window + 1))
+                if bars.empty:
+                    continue
+                # The newest stored bar may still be open; live closes will supersede it
+                closes = zip(bars.index[:-1], bars['close_a'].to_numpy()[:-1], bars['close_b'].to_numpy()[:-1])
+                for timestamp, close_a, close_b in closes:
+                    self._update_online_estimators(timeframe, timestamp, close_a, close_b)
+            except Exception as e:
+                logger.error(f"Error warming up online estimators for {timeframe}: {e}")
+    
+    def _update_online_estimators(self, timeframe: str, timestamp, close_a: float, close_b: float):
+        for method in ONLINE_ESTIMATORS:
+            estimator = self.online_estimators.get((timeframe, method))
+            if estimator is None:
+                continue
+            if estimator.last_timestamp is not None and timestamp <= estimator.last_timestamp:
+                continue
+            estimator.update(close_a, close_b, timestamp)
+        
+        with self._moments_lock:
+            for (moments_timeframe, _), moments in self.pair_moments.items():
+                if moments_timeframe != timeframe:
+                    continue
+                if moments.last_timestamp is not None and timestamp <= moments.last_timestamp:
+                    continue
+                moments.update(close_a, close_b, timestamp)
+            self._last_close[timeframe] = max(timestamp, self._last_close.get(timeframe, timestamp))
+    
+    def _hedge_beta(self, timeframe: str) -> float:
+        if self.regression_type in ONLINE_ESTIMATORS:
+            estimator = self.online_estimators.get((timeframe, self.regression_type))
+            return estimator.beta if estimator is not None and estimator.n_updates else np.nan
+        if self.regression_type == 'huber' and timeframe in self._huber_beta:
+            return self._huber_beta[timeframe]
+        # OLS over the hedge window comes straight from its co-moments
+        return self.pair_moments[(timeframe, self.hedge_window)].beta
+    
+    def _refit_huber(self, timeframe: str):
+        with self._moments_lock:
+            values = self.pair_moments[(timeframe, self.hedge_window)].values()
+        if len(values) >= 2:
+            beta, _, _ = self.analytics.calculate_hedge_ratio_huber(pd.Series(values[:, 0]), pd.Series(values[:, 1]))
+            self._huber_beta[timeframe] = beta
+    
+    def _check_z_score_alert(self, timeframe: str):
+        if self.z_score_threshold is None:
+            return
+        
+        state = self.get_spread_state(timeframe)
+        z_score = state['z_score'] if state is not None else np.nan
+        if not abs(z_score) > self.z_score_threshold:
+            self._z_alerts_active.discard(timeframe)
+            return
+        if timeframe in self._z_alerts_active:
+            return
+        
+        self._z_alerts_active.add(timeframe)
+        pair = "-".join(self.symbols)
+        self.data_store.log_alert(
+            alert_type="Z-SCORE",
+            message=f"Z-Score Alert: {pair} {timeframe} bar close z-score = {z_score:.2f} (threshold: {self.z_score_threshold})",
+            symbol=pair,
+            value=z_score,
+            threshold=self.z_score_threshold
+        )
+    
+    def _on_bars_closed(self, timeframe: str, closed: pd.DataFrame) -> int:
+        # Returns the number of pair closes applied
+        pending = self._pending_closes.get(timeframe)
+        if pending is None or closed.empty:
+            return 0
+        
+        symbol_a, symbol_b = self.symbols
+        for timestamp, symbol, close in zip(closed['timestamp'], closed['symbol'], closed['close']):
+            pending.setdefault(timestamp, {})[symbol] = close
+        
+        # Update in bar order once both legs have closed; bars older than a matched
+        # timestamp can no longer be paired and are dropped
+        applied = 0
+        for timestamp in sorted(pending):
+            closes = pending[timestamp]
+            if symbol_a in closes and symbol_b in closes:
+                self._update_online_estimators(timeframe, timestamp, closes[symbol_a], closes[symbol_b])
+                applied += 1
+                # Huber is refit off the event loop after the batch and checked then
+                if self.regression_type != 'huber':
+                    self._check_z_score_alert(timeframe)
+                for stale in [t for t in pending if t <= timestamp]:
+                    del pending[stale]
+        return applied
+    
+    def get_online_state(self, timeframe: str, method: str) -> Optional[dict]:
+        estimator = self.online_estimators.get((timeframe, method))
+        if estimator is None or estimator.n_updates == 0:
+            return None
+        return estimator.get_state()
+    
+    def get_spread_state(self, timeframe: str) -> Optional[dict]:
+        # The alerting spread's mean, std and z-score as of the last closed bar, without touching the store
+        moments = self.pair_moments.get((timeframe, self.z_score_window))
+        if moments is None or moments.count == 0:
+            return None
+        beta = self._hedge_beta(timeframe)
+        with self._moments_lock:
+            return dict(moments.spread_state(beta), beta=beta)
+    
+    def get_spread_states(self) -> Dict[str, Optional[dict]]:
+        return {timeframe: self.get_spread_state(timeframe) for timeframe in self._pending_closes}
+    
+    def _requested_spread_state(self, timeframe: str, window: int, df: pd.DataFrame, beta: float, tracked: bool) -> dict:
+        # Latest spread mean, std and z-score for an analytics request. Tracked windows answer in
+        # O(1); an untracked window of a running pair starts being tracked from the loaded bars
+        latest_timestamp = df.index[-1]
+        with self._moments_lock:
+            moments = self.pair_moments.get((timeframe, window)) if tracked else None
+            last_close = self._last_close.get(timeframe) if tracked else None
+            if moments is None and last_close is not None and last_close in df.index:
+                moments = RollingPairMoments(window)
+                closed = df.loc[:last_close].tail(window)
+                for timestamp, close_a, close_b in zip(closed.index, closed['a'].to_numpy(), closed['b'].to_numpy()):
+                    moments.update(close_a, close_b, timestamp)
+                requested = [key for key in self.pair_moments if key[0] == timeframe and key[1] not in (self.z_score_window, self.hedge_window)]
+                if len(requested) >= MAX_REQUESTED_WINDOWS:
+                    del self.pair_moments[requested[0]]
+                self.pair_moments[(timeframe, window)] = moments
+            
+            if moments is not None and moments.last_timestamp is not None:
+                latest = None
+                if latest_timestamp > moments.last_timestamp:
+                    latest = (df['a'].iloc[-1], df['b'].iloc[-1])
+                return moments.spread_state(beta, latest, latest_timestamp)
+        
+        # Pairs without a pipeline: one pass over the last window of loaded bars
+        moments = RollingPairMoments(window)
+        tail = df.tail(window)
+        for timestamp, close_a, close_b in zip(tail.index, tail['a'].to_numpy(), tail['b'].to_numpy()):
+            moments.update(close_a, close_b, timestamp)
+        return moments.spread_state(beta)
+    
+    async def _flush_bars_periodically(self, interval: int = 5):
         while self.running:
             try:
                 await asyncio.sleep(interval)
-                ticks = await self.tick_buffer.get_all()
-                if not ticks:
-                    continue
-                
-                df = pd.DataFrame(ticks)
-                
-                for symbol in self.symbols:
-                    for timeframe in timeframes:
-                        try:
-                            resampled = self.resampler.resample_ticks(df, timeframe, symbol)
-                            if not resampled.empty:
-                                self.data_store.insert_resampled(resampled, timeframe)
-                                logger.debug(f"Resampled {symbol} to {timeframe}")
-                        except Exception as e:
-                            logger.error(f"Error resampling {symbol} {timeframe}: {e}")
+                await self._flush_bars()
             except Exception as e:
                 logger.error(f"Error in resampling task: {e}")
     
     async def start(self, timeframes: List[str] = ['1s', '1m', '5m']):
         self.running = True
-        self.collector = BinanceWSCollector(symbols=self.symbols, callback=self._tick_callback)
-        collector_task = asyncio.create_task(self.collector.start())
+        self.bar_builder = StreamingBarBuilder(timeframes)
+        self._init_online_estimators(timeframes)
+        await self.registry.acquire(self.symbols, self._ticks_callback, self.bar_builder.timeframes)
         self.persist_task = asyncio.create_task(self._persist_ticks_periodically())
-        self.resample_task = asyncio.create_task(self._resample_periodically(timeframes))
+        self.resample_task = asyncio.create_task(self._flush_bars_periodically())
         logger.info(f"Pipeline started for symbols: {self.symbols}")
     
     async def stop(self):
         logger.info("Stopping pipeline...")
         self.running = False
-        if self.collector:
-            await self.collector.stop()
+        # Ownership passes to the next subscriber on release, so capture it first and
+        # write out everything received up to that point
+        owned = self._owned_symbols()
+        owned_bars = {}
+        if self.bar_builder:
+            owned_bars = {tf: self._owned_bar_symbols(tf) for tf in self.bar_builder.timeframes}
+        await self.registry.release(self.symbols, self._ticks_callback)
         if self.persist_task:
             self.persist_task.cancel()
         if self.resample_task:
             self.resample_task.cancel()
+        if self.bar_builder:
+            await self._flush_bars(owned_bars)
+        await self._persist_new_ticks(owned)
         logger.info("Pipeline stopped")
     
     def stop_sync(self):
         logger.info("Stopping pipeline (sync)...")
         self.running = False
-        if self.collector:
-            self.collector.running = False
+        self.registry.detach(self.symbols, self._ticks_callback)
         if self.persist_task:
             self.persist_task.cancel()
         if self.resample_task:
@@ -97,30 +408,41 @@ class MarketDataPipeline:
     def get_resampled_data(self, symbol: str, timeframe: str, limit: int = 500) -> pd.DataFrame:
         return self.data_store.get_resampled(symbol, timeframe, limit=limit)
     
-    def calculate_pairs_analytics(self, symbol_a: str, symbol_b: str, timeframe: str, window: int = 20, limit: int = 500, regression_type: str = 'ols') -> dict:
-        data_a = self.get_resampled_data(symbol_a, timeframe, limit)
-        data_b = self.get_resampled_data(symbol_b, timeframe, limit)
+    def calculate_pairs_analytics(self, symbol_a: str, symbol_b: str, timeframe: str, window: int = 20, limit: int = 500, regression_type: str = 'ols', stat_window: Optional[int] = None) -> dict:
+        # One joined query returns both legs already aligned on timestamp
+        bars = self.data_store.get_pair_bars(symbol_a, symbol_b, timeframe, limit)
         
-        if data_a.empty or data_b.empty:
+        if bars.empty or len(bars) < window:
             return {}
         
-        price_a = data_a['close']
-        price_b = data_b['close']
-        
-        df = pd.DataFrame({'a': price_a, 'b': price_b}).dropna()
+        data_a = bars[[f"{c}_a" for c in PAIR_BAR_FIELDS]].set_axis(PAIR_BAR_FIELDS, axis=1)
+        data_b = bars[[f"{c}_b" for c in PAIR_BAR_FIELDS]].set_axis(PAIR_BAR_FIELDS, axis=1)
+        df = pd.DataFrame({'a': bars['close_a'], 'b': bars['close_b']})
         
-        if len(df) < window:
-            return {}
-        
-        beta, alpha, r_squared = self.analytics.calculate_hedge_ratio(df['a'], df['b'], method=regression_type)
+        online_state = None
+        if [symbol_a, symbol_b] == self.symbols:
+            online_state = self.get_online_state(timeframe, regression_type)
+        if online_state is not None:
+            beta, alpha = online_state['beta'], online_state['alpha']
+            r_squared = self.analytics.calculate_r_squared(df['a'], df['b'], beta, alpha)
+        else:
+            beta, alpha, r_squared = self.analytics.calculate_hedge_ratio(df['a'], df['b'], method=regression_type)
         spread = self.analytics.calculate_spread(df['a'], df['b'], beta)
+        # The rolling series is chart history; the latest values come from the pair's moments
         z_score = self.analytics.calculate_z_score(spread, window)
+        live_spread = self._requested_spread_state(timeframe, window, df, beta, [symbol_a, symbol_b] == self.symbols)
         correlation = self.analytics.calculate_correlation(df['a'], df['b'])
         rolling_corr = self.analytics.calculate_rolling_correlation(df['a'], df['b'], window)
         stats_a = self.analytics.calculate_price_statistics(df['a'], window)
         stats_b = self.analytics.calculate_price_statistics(df['b'], window)
         half_life = self.analytics.calculate_half_life(spread)
         
+        # Stationarity tests need more points than a z-score, so the rolling ADF and
+        # half-life use a longer window by default
+        stat_window = stat_window or ROLLING_STAT_WINDOW_FACTOR * window
+        rolling_adf = self.analytics.calculate_rolling_adf(spread, stat_window)
+        rolling_half_life = self.analytics.calculate_rolling_half_life(spread, stat_window)
+        
         return {
             'hedge_ratio': {'beta': beta, 'alpha': alpha, 'r_squared': r_squared},
             'spread': spread,
@@ -134,6 +456,11 @@ class MarketDataPipeline:
             'stats_a': stats_a,
             'stats_b': stats_b,
             'half_life': half_life,
+            'rolling_adf': rolling_adf['adf_statistic'],
+            'rolling_adf_p_value': rolling_adf['p_value'],
+            'rolling_half_life': rolling_half_life,
+            'online': online_state,
+            'live_spread': live_spread,
             'timestamps': df.index
         }
     
@@ -141,4 +468,5 @@ class MarketDataPipeline:
         return self.analytics.adf_test(spread)
     
     def close(self):
-        self.data_store.close()
+        if self._owns_store:
+            self.data_store.close()
@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
 import logging
 
@@ -13,12 +13,30 @@ class DataResampler:
         '1m': '1min',
         '5m': '5min',
         '15m': '15min',
-        '1h': '1h'
+        '1h': '1h',
+        '4h': '4h',
+        '1d': '1D'
     }
     
     def __init__(self):
         pass
     
+    @classmethod
+    def timeframe_ns(cls, timeframe: str) -> int:
+        if timeframe not in cls.SUPPORTED_TIMEFRAMES:
+            raise ValueError(f"Unsupported timeframe: {timeframe}")
+        return pd.Timedelta(cls.SUPPORTED_TIMEFRAMES[timeframe]).value
+    
+    @classmethod
+    def rollup_source(cls, timeframe: str, timeframes: List[str]) -> Optional[str]:
+        # The coarsest of the given timeframes whose bars tile this one exactly
+        step = cls.timeframe_ns(timeframe)
+        sources = [
+            tf for tf in timeframes
+            if cls.timeframe_ns(tf) < step and step % cls.timeframe_ns(tf) == 0
+        ]
+        return max(sources, key=cls.timeframe_ns) if sources else None
+    
     def resample_ticks(self, df: pd.DataFrame, timeframe: str, symbol: Optional[str] = None) -> pd.DataFrame:
         if df.empty:
             return pd.DataFrame()
@@ -62,6 +80,42 @@ class DataResampler:
         
         return resampled
     
+    def rollup_bars(self, bars: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+        # Merges finer OHLCV bars into a coarser timeframe: first open, highest high,
+        # lowest low, last close, summed volume and trade count
+        if bars.empty:
+            return pd.DataFrame()
+        
+        if 'timestamp' not in bars.columns:
+            bars = bars.reset_index()
+        bars = bars.sort_values('timestamp', kind='stable')
+        
+        keys = [bars['timestamp'].dt.floor(self.SUPPORTED_TIMEFRAMES[timeframe]).rename('timestamp')]
+        if 'symbol' in bars.columns:
+            keys.insert(0, bars['symbol'])
+        
+        agg = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+        if 'trade_count' in bars.columns:
+            agg['trade_count'] = 'sum'
+        
+        rolled = bars.groupby(keys, sort=True)[list(agg)].agg(agg).reset_index()
+        if 'symbol' in rolled.columns:
+            rolled = rolled[[c for c in rolled.columns if c != 'symbol'] + ['symbol']]
+        
+        return rolled.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    
+    def resample_hierarchy(self, df: pd.DataFrame, timeframes: List[str], symbol: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+        # Ticks are resampled once, to the finest timeframe; every coarser one is rolled
+        # up from the finest already built timeframe that divides it
+        result = {}
+        for timeframe in sorted(timeframes, key=self.timeframe_ns):
+            source = self.rollup_source(timeframe, list(result))
+            if source is None:
+                result[timeframe] = self.resample_ticks(df, timeframe, symbol)
+            else:
+                result[timeframe] = self.rollup_bars(result[source], timeframe)
+        return result
+    
     def resample_multiple_symbols(self, df: pd.DataFrame, timeframe: str, symbols: List[str]) -> Dict[str, pd.DataFrame]:
         result = {}
         
@@ -139,3 +193,155 @@ class RollingCalculator:
     @staticmethod
     def rolling_covariance(series_a: pd.Series, series_b: pd.Series, window: int) -> pd.Series:
         return series_a.rolling(window=window).cov(series_b)
+
+
+class StreamingBarBuilder:
+    
+    BAR_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'trade_count', 'symbol', 'is_closed']
+    
+    _EPOCH = datetime(1970, 1, 1)
+    _ONE_US = timedelta(microseconds=1)
+    
+    def __init__(self, timeframes: List[str]):
+        for timeframe in timeframes:
+            if timeframe not in DataResampler.SUPPORTED_TIMEFRAMES:
+                raise ValueError(f"Unsupported timeframe: {timeframe}")
+        
+        self.timeframes = sorted(timeframes, key=DataResampler.timeframe_ns)
+        self._steps = {tf: DataResampler.timeframe_ns(tf) // 1000 for tf in self.timeframes}
+        # Only timeframes with no finer divisor are fed ticks; the others are merged
+        # from closed bars of their source, so a tick costs the same however many there are
+        self.sources = {tf: DataResampler.rollup_source(tf, self.timeframes) for tf in self.timeframes}
+        self._children = {tf: [t for t in self.timeframes if self.sources[t] == tf] for tf in self.timeframes}
+        self._tick_timeframes = [tf for tf in self.timeframes if self.sources[tf] is None]
+        # (symbol, timeframe) -> [bucket_us, open, high, low, close, volume, trade_count]
+        self._open_bars: Dict[tuple, list] = {}
+        self._closed: Dict[str, list] = {tf: [] for tf in self.timeframes}
+        self._dirty = set()
+        self.late_ticks = 0
+    
+    def _to_micros(self, timestamp: Any) -> int:
+        if isinstance(timestamp, (int, np.integer)):
+            # Integer timestamps are epoch milliseconds, including NumPy ints from TickBuffer
+            return int(timestamp) * 1000
+        if isinstance(timestamp, pd.Timestamp):
+            return timestamp.value // 1000
+        return (timestamp - self._EPOCH) // self._ONE_US
+    
+    @staticmethod
+    def _merge(target: list, bar: list):
+        if bar[2] > target[2]:
+            target[2] = bar[2]
+        if bar[3] < target[3]:
+            target[3] = bar[3]
+        target[4] = bar[4]
+        target[5] += bar[5]
+        target[6] += bar[6]
+    
+    def _close(self, symbol: str, timeframe: str, bar: list):
+        self._closed[timeframe].append((symbol, bar))
+        for child in self._children[timeframe]:
+            step = self._steps[child]
+            bucket = bar[0] - bar[0] % step
+            key = (symbol, child)
+            parent = self._open_bars.get(key)
+            
+            if parent is None or bucket > parent[0]:
+                if parent is not None:
+                    self._close(symbol, child, parent)
+                self._open_bars[key] = [bucket] + bar[1:]
+            else:
+                self._merge(parent, bar)
+    
+    def _advance(self, symbol: str, timeframe: str, bucket: int):
+        # A new bar has opened at bucket, so coarser bars that end before it are complete
+        for child in self._children[timeframe]:
+            key = (symbol, child)
+            parent = self._open_bars.get(key)
+            if parent is not None and parent[0] + self._steps[child] <= bucket:
+                del self._open_bars[key]
+                self._close(symbol, child, parent)
+            self._advance(symbol, child, bucket)
+    
+    def update(self, tick: Dict[str, Any]):
+        ts_us = self._to_micros(tick['timestamp'])
+        symbol = tick['symbol']
+        price = tick['price']
+        size = tick['size']
+        
+        for timeframe in self._tick_timeframes:
+            step = self._steps[timeframe]
+            bucket = ts_us - ts_us % step
+            key = (symbol, timeframe)
+            bar = self._open_bars.get(key)
+            
+            if bar is None or bucket > bar[0]:
+                if bar is not None:
+                    self._close(symbol, timeframe, bar)
+                self._open_bars[key] = [bucket, price, price, price, price, size, 1]
+                self._advance(symbol, timeframe, bucket)
+            elif bucket == bar[0]:
+                if price > bar[2]:
+                    bar[2] = price
+                if price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += size
+                bar[6] += 1
+            else:
+                # Tick belongs to a bar that has already been closed and emitted
+                self.late_ticks += 1
+                continue
+            
+            self._dirty.add(symbol)
+    
+    def _open_view(self, symbol: str, timeframe: str, views: Dict[tuple, Optional[list]]) -> Optional[list]:
+        # The open bar as it stands: closed source bars so far plus the open source bar
+        key = (symbol, timeframe)
+        if key in views:
+            return views[key]
+        
+        bar = self._open_bars.get(key)
+        view = list(bar) if bar is not None else None
+        source = self.sources[timeframe]
+        if source is not None:
+            partial = self._open_view(symbol, source, views)
+            if partial is not None:
+                bucket = partial[0] - partial[0] % self._steps[timeframe]
+                if view is None or bucket > view[0]:
+                    view = [bucket] + partial[1:]
+                else:
+                    self._merge(view, partial)
+        
+        views[key] = view
+        return view
+    
+    def drain(self) -> Dict[str, pd.DataFrame]:
+        result = {}
+        views = {}
+        
+        for timeframe in self.timeframes:
+            rows = [(symbol, bar, True) for symbol, bar in self._closed[timeframe]]
+            self._closed[timeframe] = []
+            
+            for symbol in self._dirty:
+                bar = self._open_view(symbol, timeframe, views)
+                if bar is not None:
+                    rows.append((symbol, bar, False))
+            
+            if not rows:
+                continue
+            
+            df = pd.DataFrame(
+                [bar + [symbol, is_closed] for symbol, bar, is_closed in rows],
+                columns=self.BAR_COLUMNS
+            )
+            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='us')
+            result[timeframe] = df
+        
+        self._dirty.clear()
+        
+        return result
+    
+    def pending_count(self) -> int:
+        return sum(len(bars) for bars in self._closed.values())
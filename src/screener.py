@@ -0,0 +1,126 @@
+import time
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional
+import logging
+
+from src.analytics import PairsAnalytics
+from src.storage import DataStore
+
+logger = logging.getLogger(__name__)
+
+SCREENER_COLUMNS = [
+    'symbol_a', 'symbol_b', 'correlation', 'beta', 'alpha', 'half_life', 'z_score',
+    'adf_statistic', 'p_value', 'is_stationary'
+]
+
+def load_closes(data_store: DataStore, symbols: List[str], timeframe: str, limit: int = 1000, min_bars: int = 30) -> pd.DataFrame:
+    # One timestamp-aligned matrix of closes, a column per symbol, read in a single query.
+    # Symbols with too little history are left out rather than shrinking the common range
+    # for everyone
+    closes = data_store.get_closes(symbols, timeframe, limit=limit)
+    if closes.empty:
+        return pd.DataFrame()
+    
+    counts = closes.count()
+    for symbol in counts[counts < min_bars].index:
+        logger.debug(f"Screener skipped {symbol}: {counts[symbol]} {timeframe} bars")
+    closes = closes.loc[:, counts >= min_bars]
+    
+    if closes.shape[1] < 2:
+        return pd.DataFrame()
+    
+    closes.columns.name = None
+    return closes.dropna()
+
+def pair_statistics(closes: np.ndarray) -> Dict[str, np.ndarray]:
+    # Correlations and OLS fits of every column on every other from one covariance matrix:
+    # beta[i, j] is the hedge ratio of symbol i on symbol j
+    means = closes.mean(axis=0)
+    centered = closes - means
+    cov = centered.T @ centered / (len(closes) - 1)
+    var = np.diag(cov)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = cov / np.sqrt(np.outer(var, var))
+        beta = cov / var[np.newaxis, :]
+    alpha = means[:, np.newaxis] - beta * means[np.newaxis, :]
+    
+    return {'correlation': correlation, 'beta': beta, 'alpha': alpha}
+
+def spread_half_lives(spreads: np.ndarray) -> np.ndarray:
+    # Same no-intercept regression of the spread change on the lagged spread as
+    # PairsAnalytics.calculate_half_life, solved for all spreads at once
+    lagged = spreads[:-1]
+    diff = np.diff(spreads, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lam = (lagged * diff).sum(axis=0) / (lagged * lagged).sum(axis=0)
+        half_life = -np.log(2) / lam
+    return np.where(lam < 0, half_life, np.nan)
+
+def latest_z_scores(spreads: np.ndarray, window: int) -> np.ndarray:
+    recent = spreads[-window:]
+    std = recent.std(axis=0, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(std > 0, (recent[-1] - recent.mean(axis=0)) / std, np.nan)
+
+def screen_pairs(closes: pd.DataFrame, min_correlation: float = 0.7, max_candidates: Optional[int] = 200, window: int = 20, analytics: Optional[PairsAnalytics] = None) -> pd.DataFrame:
+    if closes.shape[1] < 2 or len(closes) < max(window, 10):
+        return pd.DataFrame(columns=SCREENER_COLUMNS)
+    
+    analytics = analytics or PairsAnalytics()
+    symbols = list(closes.columns)
+    values = closes.to_numpy(dtype=np.float64)
+    stats = pair_statistics(values)
+    
+    # Each unordered pair once, leg a on leg b in universe order, strongest correlation first
+    rows, cols = np.triu_indices(len(symbols), k=1)
+    correlation = stats['correlation'][rows, cols]
+    keep = np.abs(correlation) >= min_correlation
+    rows, cols, correlation = rows[keep], cols[keep], correlation[keep]
+    order = np.argsort(-np.abs(correlation), kind='stable')[:max_candidates]
+    rows, cols, correlation = rows[order], cols[order], correlation[order]
+    
+    if len(rows) == 0:
+        return pd.DataFrame(columns=SCREENER_COLUMNS)
+    
+    beta = stats['beta'][rows, cols]
+    spreads = values[:, rows] - beta * values[:, cols]
+    
+    result = pd.DataFrame({
+        'symbol_a': [symbols[i] for i in rows],
+        'symbol_b': [symbols[j] for j in cols],
+        'correlation': correlation,
+        'beta': beta,
+        'alpha': stats['alpha'][rows, cols],
+        'half_life': spread_half_lives(spreads),
+        'z_score': latest_z_scores(spreads, window)
+    })
+    
+    # The ADF test is the expensive step, so it only runs on pairs that passed the filter
+    adf = analytics.adf_test_many([pd.Series(spreads[:, k]) for k in range(spreads.shape[1])])
+    result['adf_statistic'] = [r['adf_statistic'] for r in adf]
+    result['p_value'] = [r['p_value'] for r in adf]
+    result['is_stationary'] = [r['is_stationary'] for r in adf]
+    
+    return result.sort_values(['p_value', 'half_life'], na_position='last', kind='stable').reset_index(drop=True)
+
+def run_screener(data_store: DataStore, symbols: List[str], timeframe: str = '1m', limit: int = 1000, min_correlation: float = 0.7, max_candidates: Optional[int] = 200, window: int = 20, top: Optional[int] = 20, analytics: Optional[PairsAnalytics] = None) -> Dict[str, Any]:
+    start = time.perf_counter()
+    closes = load_closes(data_store, symbols, timeframe, limit)
+    loaded = time.perf_counter()
+    
+    ranked = screen_pairs(closes, min_correlation, max_candidates, window, analytics)
+    n_symbols = closes.shape[1]
+    logger.info(f"Screened {n_symbols} symbols, {len(ranked)} candidate pairs in {time.perf_counter() - start:.2f}s")
+    
+    return {
+        'timeframe': timeframe,
+        'symbols': list(closes.columns),
+        'bars': len(closes),
+        'pairs_total': n_symbols * (n_symbols - 1) // 2,
+        'pairs_tested': len(ranked),
+        'load_seconds': loaded - start,
+        'seconds': time.perf_counter() - start,
+        'pairs': (ranked.head(top) if top else ranked).to_dict(orient='records')
+    }
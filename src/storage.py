@@ -1,32 +1,187 @@
 import sqlite3
+import queue
+import threading
+import time
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Union
 import logging
 from pathlib import Path
+from itertools import repeat
+from contextlib import contextmanager
+
+from src.archive import ParquetArchive, HAS_PYARROW
+from src.resampler import DataResampler
+from src.writer import DatabaseWriter, WriteOp
 
 logger = logging.getLogger(__name__)
 
+SCHEMA_VERSION = 2
+TICK_FIELDS = ['timestamp', 'symbol', 'price', 'size', 'is_buyer_maker']
+BAR_FIELDS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'trade_count']
+PAIR_BAR_FIELDS = ['open', 'high', 'low', 'close', 'volume', 'trade_count']
+
+TICK_INSERT = """
+    INSERT INTO ticks (timestamp, symbol, price, size, is_buyer_maker)
+    VALUES (?, ?, ?, ?, ?)
+"""
+RESAMPLED_UPSERT = """
+    INSERT OR REPLACE INTO resampled 
+    (timestamp, symbol, timeframe, open, high, low, close, volume, trade_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+ALERT_INSERT = """
+    INSERT INTO alerts (timestamp, alert_type, symbol, message, value, threshold)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+# Folds a range of stored bars into a coarser timeframe: open and close come from the
+# first and last source bar of each bucket, looked up by primary key
+RESAMPLED_ROLLUP = """
+    INSERT OR {conflict} INTO resampled
+    (symbol, timeframe, timestamp, open, high, low, close, volume, trade_count)
+    SELECT g.symbol, ?, g.bucket,
+           (SELECT o.open FROM resampled o WHERE o.symbol = g.symbol AND o.timeframe = g.timeframe AND o.timestamp = g.first_ts),
+           g.high, g.low,
+           (SELECT c.close FROM resampled c WHERE c.symbol = g.symbol AND c.timeframe = g.timeframe AND c.timestamp = g.last_ts),
+           g.volume, g.trade_count
+    FROM (
+        SELECT symbol, timeframe, timestamp - timestamp % ? AS bucket,
+               MIN(timestamp) AS first_ts, MAX(timestamp) AS last_ts,
+               MAX(high) AS high, MIN(low) AS low, SUM(volume) AS volume, SUM(trade_count) AS trade_count
+        FROM resampled
+        WHERE symbol = ? AND timeframe = ? AND timestamp >= ? AND timestamp < ?
+        GROUP BY bucket
+    ) g
+"""
+
+def to_epoch_ns(value: Any) -> int:
+    # Integer timestamps are epoch milliseconds, as in TickBuffer and StreamingBarBuilder
+    # (see normalize_tick_fast)
+    if isinstance(value, (int, np.integer)):
+        return int(value) * 1_000_000
+    return pd.Timestamp(value).value
+
+def timestamps_to_ns(values: pd.Series) -> np.ndarray:
+    if pd.api.types.is_integer_dtype(values):
+        return values.to_numpy(dtype=np.int64) * 1_000_000
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.to_datetime(values, format='ISO8601')
+    if values.dt.tz is not None:
+        # Same instant as to_epoch_ns gives for an aware Timestamp
+        values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+    return values.dt.as_unit('ns').to_numpy().view(np.int64)
+
+def tick_payload_bytes(ticks: pd.DataFrame) -> int:
+    # Size of the SQLite records the rows encode to: a 7-byte header (length plus one serial
+    # type per column, the rowid alias stored as NULL), 8-byte timestamp, price and size, the
+    # symbol text, and is_buyer_maker as a 0/1 constant that takes no body bytes
+    if ticks.empty:
+        return 0
+    return int(len(ticks) * 31 + ticks['symbol'].astype(str).str.len().sum())
+
+class RetentionPolicy:
+    
+    def __init__(self, tick_hours: int = 24, bar_days: Optional[Dict[str, int]] = None, rollup: Optional[Dict[str, str]] = None, batch_size: int = 20000, vacuum_pages: int = 1000, archive_bar_days: Optional[int] = 7):
+        # Raw ticks older than this leave SQLite: into the archive when there is one, otherwise deleted
+        self.tick_hours = tick_hours
+        # Days of bars kept per timeframe; timeframes not listed are kept forever
+        self.bar_days = {'1s': 3} if bar_days is None else bar_days
+        # Expiring bars are first folded into a coarser timeframe that is kept
+        self.rollup = {'1s': '1m'} if rollup is None else rollup
+        # Rows per delete transaction, so live writes are never blocked for long
+        self.batch_size = batch_size
+        # Free pages returned to the filesystem per incremental vacuum step
+        self.vacuum_pages = vacuum_pages
+        # With an archive, bars older than this many days move to Parquet (None: never)
+        self.archive_bar_days = archive_bar_days
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'tick_hours': self.tick_hours,
+            'bar_days': self.bar_days,
+            'rollup': self.rollup,
+            'batch_size': self.batch_size,
+            'vacuum_pages': self.vacuum_pages,
+            'archive_bar_days': self.archive_bar_days
+        }
+
 class DataStore:
     
-    def __init__(self, db_path: str = "market_data.db"):
+    def __init__(self, db_path: str = "market_data.db", archive_dir: Optional[str] = None, async_writes: bool = False, read_pool_size: int = 4):
         self.db_path = db_path
         self.conn = None
+        # Reads borrow read-only connections so concurrent requests (and threads) never share one
+        self.read_pool_size = read_pool_size
+        self._read_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._read_connections = 0
+        self._read_lock = threading.Lock()
+        # With async_writes every write goes through one background thread that
+        # group-commits, so callers on the event loop never wait on fsync
+        self.writer = DatabaseWriter(self._connect) if async_writes else None
+        self.last_bulk_write = None
+        self.last_retention = None
+        # Cold history lives in Parquet files next to the database, SQLite keeps the hot tail
+        self.archive = None
+        if HAS_PYARROW:
+            if archive_dir is None:
+                path = Path(db_path)
+                archive_dir = str(path.with_name(f"{path.stem}_archive"))
+            self.archive = ParquetArchive(archive_dir)
         self._init_db()
     
-    def _init_db(self):
-        self.conn = sqlite3.connect(
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
             self.db_path, 
             check_same_thread=False,
             timeout=30.0
         )
-        self.conn.execute("PRAGMA journal_mode=WAL;")
-        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        # Lets retention hand deleted pages back to the filesystem. Only takes effect on a
+        # new database (so it must precede the WAL switch) or one rebuilt by VACUUM
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+    
+    def _connect_reader(self) -> sqlite3.Connection:
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=30.0)
+    
+    @contextmanager
+    def _reader(self):
+        try:
+            conn = self._read_pool.get_nowait()
+        except queue.Empty:
+            with self._read_lock:
+                create = self._read_connections < self.read_pool_size
+                if create:
+                    self._read_connections += 1
+            conn = self._connect_reader() if create else self._read_pool.get()
+        
+        try:
+            yield conn
+        finally:
+            self._read_pool.put(conn)
+    
+    def _init_db(self):
+        self.conn = self._connect()
+        
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if version < SCHEMA_VERSION and 'ticks' in tables:
+            self._migrate_to_epoch_ns(tables)
         
-        self.conn.execute("""
+        self._create_tables(self.conn)
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
+        logger.info(f"Database initialized at {self.db_path}")
+    
+    def _create_tables(self, conn: sqlite3.Connection):
+        # Timestamps are nanoseconds since the epoch of the naive wall-clock time
+        conn.execute("""
             CREATE TABLE IF NOT EXISTS ticks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME NOT NULL,
+                id INTEGER PRIMARY KEY,
+                timestamp INTEGER NOT NULL,
                 symbol TEXT NOT NULL,
                 price REAL NOT NULL,
                 size REAL NOT NULL,
@@ -34,33 +189,28 @@ class DataStore:
             )
         """)
         
-        self.conn.execute("""
+        conn.execute("""
             CREATE INDEX IF NOT EXISTS idx_symbol_timestamp 
             ON ticks(symbol, timestamp)
         """)
         
-        self.conn.execute("""
+        # Clustered on the lookup key, so range scans read bars in order with no separate index
+        conn.execute("""
             CREATE TABLE IF NOT EXISTS resampled (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME NOT NULL,
                 symbol TEXT NOT NULL,
                 timeframe TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
                 open REAL NOT NULL,
                 high REAL NOT NULL,
                 low REAL NOT NULL,
                 close REAL NOT NULL,
                 volume REAL NOT NULL,
                 trade_count INTEGER,
-                UNIQUE(symbol, timeframe, timestamp)
-            )
-        """)
-        
-        self.conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_resampled_lookup 
-            ON resampled(symbol, timeframe, timestamp)
+                PRIMARY KEY (symbol, timeframe, timestamp)
+            ) WITHOUT ROWID
         """)
         
-        self.conn.execute("""
+        conn.execute("""
             CREATE TABLE IF NOT EXISTS alerts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 timestamp DATETIME NOT NULL,
@@ -71,48 +221,148 @@ class DataStore:
                 threshold REAL
             )
         """)
+    
+    def _migrate_to_epoch_ns(self, tables: set, chunk_size: int = 200000):
+        # Schema 1 stored TEXT timestamps; rewrite both tables in place, chunk by chunk
+        logger.info(f"Migrating {self.db_path} to integer timestamps (schema {SCHEMA_VERSION})")
+        conn = self.conn
+        try:
+            conn.execute("BEGIN")
+            conn.execute("ALTER TABLE ticks RENAME TO ticks_v1")
+            conn.execute("DROP INDEX IF EXISTS idx_symbol_timestamp")
+            if 'resampled' in tables:
+                conn.execute("ALTER TABLE resampled RENAME TO resampled_v1")
+                conn.execute("DROP INDEX IF EXISTS idx_resampled_lookup")
+            self._create_tables(conn)
+            
+            last_id = 0
+            while True:
+                rows = conn.execute(
+                    "SELECT id, timestamp, symbol, price, size, is_buyer_maker FROM ticks_v1 WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, chunk_size)
+                ).fetchall()
+                if not rows:
+                    break
+                
+                ids, timestamps, symbols, prices, sizes, sides = zip(*rows)
+                ns = timestamps_to_ns(pd.Series(timestamps))
+                conn.executemany("""
+                    INSERT INTO ticks (id, timestamp, symbol, price, size, is_buyer_maker)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, zip(ids, ns.tolist(), symbols, prices, sizes, sides))
+                last_id = ids[-1]
+            conn.execute("DROP TABLE ticks_v1")
+            
+            if 'resampled' in tables:
+                last_id = 0
+                while True:
+                    rows = conn.execute("""
+                        SELECT id, symbol, timeframe, timestamp, open, high, low, close, volume, trade_count
+                        FROM resampled_v1 WHERE id > ? ORDER BY id LIMIT ?
+                    """, (last_id, chunk_size)).fetchall()
+                    if not rows:
+                        break
+                    
+                    columns = list(zip(*rows))
+                    columns[3] = timestamps_to_ns(pd.Series(columns[3])).tolist()
+                    conn.executemany("""
+                        INSERT OR REPLACE INTO resampled
+                        (symbol, timeframe, timestamp, open, high, low, close, volume, trade_count)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, zip(*columns[1:]))
+                    last_id = columns[0][-1]
+                conn.execute("DROP TABLE resampled_v1")
+            
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error migrating database schema: {e}")
+            raise
         
+        conn.execute("VACUUM")
+        logger.info("Migration complete")
+    
+    def _write(self, op: WriteOp, rows: int = 1, wait: bool = True) -> int:
+        if self.writer is not None:
+            future = self.writer.submit(op, rows)
+            return future.result() if wait else 0
+        
+        result = op(self.conn)
         self.conn.commit()
-        logger.info(f"Database initialized at {self.db_path}")
+        return result
+    
+    async def _write_async(self, op: WriteOp, rows: int = 1) -> int:
+        if self.writer is not None:
+            return await self.writer.submit_async(op, rows)
+        return self._write(op, rows)
     
     def insert_tick(self, tick: Dict[str, Any]):
         try:
-            self.conn.execute("""
-                INSERT INTO ticks (timestamp, symbol, price, size, is_buyer_maker)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                tick['timestamp'],
+            row = (
+                to_epoch_ns(tick['timestamp']),
                 tick['symbol'],
                 tick['price'],
                 tick['size'],
                 int(tick.get('is_buyer_maker', 0))
-            ))
-            self.conn.commit()
+            )
+            self._write(lambda conn: conn.execute(TICK_INSERT, row).rowcount, wait=False)
         except Exception as e:
             logger.error(f"Error inserting tick: {e}")
     
-    def insert_ticks_batch(self, ticks: List[Dict[str, Any]]):
-        if not ticks:
-            return
+    def _tick_rows(self, ticks: Union[List[Dict[str, Any]], pd.DataFrame]) -> list:
+        if isinstance(ticks, pd.DataFrame):
+            return list(zip(
+                timestamps_to_ns(ticks['timestamp']).tolist(),
+                ticks['symbol'].astype(str),
+                ticks['price'].tolist(),
+                ticks['size'].tolist(),
+                ticks['is_buyer_maker'].astype(int).tolist()
+            ))
+        return [
+            (to_epoch_ns(t['timestamp']), t['symbol'], t['price'], t['size'], 
+             int(t.get('is_buyer_maker', 0)))
+            for t in ticks
+        ]
+    
+    def insert_ticks_batch(self, ticks: Union[List[Dict[str, Any]], pd.DataFrame]) -> int:
+        if len(ticks) == 0:
+            return 0
         
         try:
-            data = [
-                (t['timestamp'], t['symbol'], t['price'], t['size'], 
-                 int(t.get('is_buyer_maker', 0)))
-                for t in ticks
-            ]
-            
-            self.conn.executemany("""
-                INSERT INTO ticks (timestamp, symbol, price, size, is_buyer_maker)
-                VALUES (?, ?, ?, ?, ?)
-            """, data)
-            self.conn.commit()
-            logger.debug(f"Inserted {len(ticks)} ticks")
+            data = self._tick_rows(ticks)
+            rows = self._write(lambda conn: conn.executemany(TICK_INSERT, data).rowcount, len(data))
+            logger.debug(f"Inserted {rows} ticks")
+            return rows
+        except Exception as e:
+            logger.error(f"Error inserting ticks batch: {e}")
+            return 0
+    
+    async def insert_ticks_batch_async(self, ticks: Union[List[Dict[str, Any]], pd.DataFrame]) -> int:
+        if len(ticks) == 0:
+            return 0
+        
+        try:
+            data = self._tick_rows(ticks)
+            rows = await self._write_async(lambda conn: conn.executemany(TICK_INSERT, data).rowcount, len(data))
+            logger.debug(f"Inserted {rows} ticks")
+            return rows
         except Exception as e:
             logger.error(f"Error inserting ticks batch: {e}")
+            return 0
     
-    def get_ticks(self, symbol: Optional[str] = None, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, limit: Optional[int] = None) -> pd.DataFrame:
-        query = "SELECT timestamp, symbol, price, size, is_buyer_maker FROM ticks WHERE 1=1"
+    def get_size_bytes(self) -> int:
+        with self._reader() as conn:
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+    
+    def get_ticks(self, symbol: Optional[str] = None, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, limit: Optional[int] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        columns = [c for c in (columns or TICK_FIELDS) if c in TICK_FIELDS]
+        if 'timestamp' not in columns:
+            columns = ['timestamp'] + columns
+        
+        query = f"SELECT {', '.join(columns)} FROM ticks WHERE 1=1"
         params = []
         
         if symbol:
@@ -121,59 +371,351 @@ class DataStore:
         
         if start_time:
             query += " AND timestamp >= ?"
-            params.append(start_time)
+            params.append(to_epoch_ns(start_time))
         
         if end_time:
             query += " AND timestamp <= ?"
-            params.append(end_time)
+            params.append(to_epoch_ns(end_time))
         
         query += " ORDER BY timestamp DESC"
         
         if limit:
             query += f" LIMIT {limit}"
         
-        df = pd.read_sql_query(query, self.conn, params=params)
+        with self._reader() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
         
         if not df.empty:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
+            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ns')
+        
+        if self.archive is not None and (not limit or len(df) < limit):
+            archived = self._get_archived_ticks(symbol, start_time, end_time, columns, limit - len(df) if limit else None)
+            if not archived.empty:
+                df = pd.concat([df, archived], ignore_index=True) if not df.empty else archived
+                df = df.sort_values('timestamp', ascending=False, kind='stable').reset_index(drop=True)
+                if limit:
+                    df = df.head(limit)
         
         return df
     
-    def insert_resampled(self, df: pd.DataFrame, timeframe: str):
-        if df.empty:
-            return
+    def _get_archived_ticks(self, symbol: Optional[str], start_time, end_time, columns: List[str], limit: Optional[int]) -> pd.DataFrame:
+        frames = []
+        for archived_symbol in ([symbol] if symbol else self.archive.symbols()):
+            df = self.archive.read_ticks(archived_symbol, start_time, end_time, columns, limit)
+            if not df.empty:
+                df['symbol'] = archived_symbol
+                frames.append(df)
+        
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        
+        df = pd.concat(frames, ignore_index=True)[columns]
+        df = df.sort_values('timestamp', ascending=False, kind='stable').reset_index(drop=True)
+        return df.head(limit) if limit else df
+    
+    def archive_ticks(self, hot_hours: int = 2, symbols: Optional[List[str]] = None, now: Optional[datetime] = None) -> int:
+        if self.archive is None:
+            return 0
+        
+        # Only whole hours are moved so each archive file covers a closed partition
+        cutoff = pd.Timestamp(now or datetime.now()).floor('h') - timedelta(hours=hot_hours)
+        cutoff_ns = cutoff.value
         
+        # Runs off the event loop, so it uses its own connection
+        conn = self._connect()
+        moved = 0
         try:
-            df_copy = df.reset_index()
-            data = []
-            for _, row in df_copy.iterrows():
-                timestamp_str = row['timestamp'].strftime('%Y-%m-%d %H:%M:%S.%f') if hasattr(row['timestamp'], 'strftime') else str(row['timestamp'])
+            if symbols is None:
+                symbols = [row[0] for row in conn.execute("SELECT DISTINCT symbol FROM ticks WHERE timestamp < ?", (cutoff_ns,))]
+            
+            for symbol in symbols:
+                df = pd.read_sql_query("""
+                    SELECT id, timestamp, price, size, is_buyer_maker FROM ticks
+                    WHERE symbol = ? AND timestamp < ?
+                """, conn, params=[symbol, cutoff_ns])
+                if df.empty:
+                    continue
                 
-                data.append((
-                    timestamp_str,
-                    row['symbol'],
-                    timeframe,
-                    float(row['open']),
-                    float(row['high']),
-                    float(row['low']),
-                    float(row['close']),
-                    float(row['volume']),
-                    int(row.get('trade_count', 0))
-                ))
+                df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ns')
+                self.archive.write_ticks(symbol, df)
+                
+                # Bounded by id so late ticks inserted meanwhile are kept for the next run
+                conn.execute(
+                    "DELETE FROM ticks WHERE symbol = ? AND timestamp < ? AND id <= ?",
+                    (symbol, cutoff_ns, int(df['id'].max()))
+                )
+                conn.commit()
+                moved += len(df)
             
-            self.conn.executemany("""
-                INSERT OR REPLACE INTO resampled 
-                (timestamp, symbol, timeframe, open, high, low, close, volume, trade_count)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, data)
-            self.conn.commit()
-            logger.debug(f"Inserted {len(data)} resampled bars for {timeframe}")
+            if moved:
+                logger.info(f"Archived {moved} ticks older than {cutoff} to {self.archive.root}")
+        except Exception as e:
+            logger.error(f"Error archiving ticks: {e}")
+        finally:
+            conn.close()
+        
+        return moved
+    
+    def archive_resampled(self, hot_days: int = 7, symbols: Optional[List[str]] = None, now: Optional[datetime] = None) -> int:
+        if self.archive is None:
+            return 0
+        
+        cutoff = pd.Timestamp(now or datetime.now()).floor('D') - timedelta(days=hot_days)
+        cutoff_ns = cutoff.value
+        
+        conn = self._connect()
+        moved = 0
+        try:
+            series = conn.execute(
+                "SELECT DISTINCT symbol, timeframe FROM resampled WHERE timestamp < ?", (cutoff_ns,)
+            ).fetchall()
+            
+            for symbol, timeframe in series:
+                if symbols is not None and symbol not in symbols:
+                    continue
+                
+                df = pd.read_sql_query("""
+                    SELECT timestamp, open, high, low, close, volume, trade_count FROM resampled
+                    WHERE symbol = ? AND timeframe = ? AND timestamp < ?
+                """, conn, params=[symbol, timeframe, cutoff_ns])
+                if df.empty:
+                    continue
+                
+                df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ns')
+                self.archive.write_bars(symbol, timeframe, df)
+                
+                conn.execute(
+                    "DELETE FROM resampled WHERE symbol = ? AND timeframe = ? AND timestamp <= ?",
+                    (symbol, timeframe, to_epoch_ns(df['timestamp'].max()))
+                )
+                conn.commit()
+                moved += len(df)
+            
+            if moved:
+                logger.info(f"Archived {moved} bars older than {cutoff} to {self.archive.root}")
+        except Exception as e:
+            logger.error(f"Error archiving resampled bars: {e}")
+        finally:
+            conn.close()
+        
+        return moved
+    
+    def _expire_ticks(self, cutoff_ns: int, batch_size: int) -> int:
+        deleted = 0
+        for (symbol,) in self._read_all("SELECT DISTINCT symbol FROM ticks"):
+            while True:
+                # Each batch is its own transaction, walking the (symbol, timestamp) index
+                rows = self._write(lambda conn: conn.execute("""
+                    DELETE FROM ticks WHERE id IN (
+                        SELECT id FROM ticks WHERE symbol = ? AND timestamp < ? LIMIT ?
+                    )
+                """, (symbol, cutoff_ns, batch_size)).rowcount, 0)
+                deleted += rows
+                if rows < batch_size:
+                    break
+        return deleted
+    
+    def _expire_bars(self, timeframe: str, cutoff_ns: int, rollup: Optional[str], batch_size: int) -> Dict[str, int]:
+        counts = {'rolled_up': 0, 'deleted': 0}
+        # Windows hold about batch_size bars and always cover whole rollup buckets
+        bucket = DataResampler.timeframe_ns(rollup) if rollup else DataResampler.timeframe_ns(timeframe)
+        span = -(-DataResampler.timeframe_ns(timeframe) * batch_size // bucket) * bucket
+        
+        series = self._read_all(
+            "SELECT symbol, MIN(timestamp) FROM resampled WHERE timeframe = ? AND timestamp < ? GROUP BY symbol",
+            (timeframe, cutoff_ns)
+        )
+        for symbol, first_ns in series:
+            start = first_ns - first_ns % span
+            while start < cutoff_ns:
+                end = min(start + span, cutoff_ns)
+                
+                # Rollup and delete share a transaction, so a window is never half expired.
+                # Bars already built live take precedence over the rollup
+                rollup_op = self._rollup_op(symbol, timeframe, rollup, start, end, replace=False) if rollup else None
+                
+                # The rollup count is only taken once the write has committed
+                rolled_up = [0]
+                
+                def op(conn: sqlite3.Connection, start=start, end=end, rollup_op=rollup_op, rolled_up=rolled_up) -> int:
+                    rolled_up[0] = rollup_op(conn) if rollup_op else 0
+                    return conn.execute(
+                        "DELETE FROM resampled WHERE symbol = ? AND timeframe = ? AND timestamp >= ? AND timestamp < ?",
+                        (symbol, timeframe, start, end)
+                    ).rowcount
+                
+                counts['deleted'] += self._write(op, 0)
+                counts['rolled_up'] += rolled_up[0]
+                start = end
+        return counts
+    
+    def _compact(self, vacuum_pages: int) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            freed = 0
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                # Small steps, each its own transaction, so the writer can get in between
+                while True:
+                    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                    if free_pages == 0:
+                        break
+                    conn.execute(f"PRAGMA incremental_vacuum({vacuum_pages})").fetchall()
+                    step = free_pages - conn.execute("PRAGMA freelist_count").fetchone()[0]
+                    if step <= 0:
+                        break
+                    freed += step
+            
+            # TRUNCATE resets the WAL file, so it does not stay at its high-water mark
+            wal_path = Path(f"{self.db_path}-wal")
+            wal_bytes = wal_path.stat().st_size if wal_path.exists() else 0
+            busy = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+            
+            return {'wal_busy': bool(busy), 'wal_bytes_truncated': 0 if busy else wal_bytes, 'pages_freed': freed}
+        finally:
+            conn.close()
+    
+    def _read_all(self, query: str, params: tuple = ()) -> list:
+        with self._reader() as conn:
+            return conn.execute(query, params).fetchall()
+    
+    def apply_retention(self, policy: RetentionPolicy, now: Optional[datetime] = None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        now = pd.Timestamp(now or datetime.now())
+        stats = {'ticks_archived': 0, 'ticks_deleted': 0, 'bars_rolled_up': 0, 'bars_deleted': 0, 'bars_archived': 0}
+        
+        try:
+            tick_cutoff = now.floor('h') - timedelta(hours=policy.tick_hours)
+            if self.archive is not None:
+                stats['ticks_archived'] = self.archive_ticks(policy.tick_hours, now=now)
+            else:
+                stats['ticks_deleted'] = self._expire_ticks(tick_cutoff.value, policy.batch_size)
+            
+            for timeframe, days in policy.bar_days.items():
+                bar_cutoff = now.floor('D') - timedelta(days=days)
+                counts = self._expire_bars(timeframe, bar_cutoff.value, policy.rollup.get(timeframe), policy.batch_size)
+                stats['bars_rolled_up'] += counts['rolled_up']
+                stats['bars_deleted'] += counts['deleted']
+            
+            # After expiry, so bars rolled up from an expiring timeframe are archived too
+            if self.archive is not None and policy.archive_bar_days is not None:
+                stats['bars_archived'] = self.archive_resampled(policy.archive_bar_days, now=now)
+            
+            stats.update(self._compact(policy.vacuum_pages))
+            stats['size_bytes'] = self.get_size_bytes()
+        except Exception as e:
+            logger.error(f"Error applying retention: {e}")
+            stats['error'] = str(e)
+        
+        stats['seconds'] = time.perf_counter() - start
+        stats['finished'] = datetime.now().isoformat()
+        self.last_retention = stats
+        logger.info(f"Retention: {stats}")
+        return stats
+    
+    def _rollup_op(self, symbol: str, source: str, timeframe: str, start_ns: int, end_ns: int, replace: bool = True) -> WriteOp:
+        query = RESAMPLED_ROLLUP.format(conflict='REPLACE' if replace else 'IGNORE')
+        params = (timeframe, DataResampler.timeframe_ns(timeframe), symbol, source, start_ns, end_ns)
+        return lambda conn: conn.execute(query, params).rowcount
+    
+    def _rollup_range(self, source: str, timeframe: str, start_time, end_time) -> tuple:
+        source_ns = DataResampler.timeframe_ns(source)
+        step = DataResampler.timeframe_ns(timeframe)
+        if step <= source_ns or step % source_ns:
+            raise ValueError(f"{timeframe} bars cannot be built from {source} bars")
+        
+        # Widened to whole buckets so no rolled-up bar is built from part of its range
+        start_ns = to_epoch_ns(start_time) if start_time is not None else 0
+        end_ns = to_epoch_ns(end_time) if end_time is not None else np.iinfo(np.int64).max - step
+        return start_ns - start_ns % step, end_ns - end_ns % step + step
+    
+    def rollup_resampled(self, symbol: str, source: str, timeframe: str, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None) -> int:
+        # Builds (or rebuilds) timeframe bars from stored source bars, e.g. 4h from 1h,
+        # without going back to ticks
+        try:
+            start_ns, end_ns = self._rollup_range(source, timeframe, start_time, end_time)
+            return self._write(self._rollup_op(symbol, source, timeframe, start_ns, end_ns))
+        except Exception as e:
+            logger.error(f"Error rolling up {source} bars to {timeframe}: {e}")
+            return 0
+    
+    async def rollup_resampled_async(self, symbol: str, source: str, timeframe: str, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None) -> int:
+        try:
+            start_ns, end_ns = self._rollup_range(source, timeframe, start_time, end_time)
+            return await self._write_async(self._rollup_op(symbol, source, timeframe, start_ns, end_ns))
+        except Exception as e:
+            logger.error(f"Error rolling up {source} bars to {timeframe}: {e}")
+            return 0
+    
+    def _resampled_op(self, df: pd.DataFrame, timeframe: str, chunk_size: int) -> WriteOp:
+        if 'timestamp' not in df.columns:
+            df = df.reset_index()
+        
+        # Convert whole columns once, then feed executemany chunk by chunk so
+        # million-row uploads never hold a full list of tuples in memory
+        timestamps = timestamps_to_ns(df['timestamp'])
+        symbols = df['symbol'].astype(str).to_numpy()
+        values = df[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64)
+        if 'trade_count' in df.columns:
+            trade_counts = df['trade_count'].fillna(0).to_numpy(dtype=np.int64)
+        else:
+            trade_counts = np.zeros(len(df), dtype=np.int64)
+        
+        def op(conn: sqlite3.Connection) -> int:
+            for offset in range(0, len(timestamps), chunk_size):
+                chunk = slice(offset, offset + chunk_size)
+                conn.executemany(RESAMPLED_UPSERT, zip(
+                    timestamps[chunk].tolist(),
+                    symbols[chunk].tolist(),
+                    repeat(timeframe),
+                    *values[chunk].T.tolist(),
+                    trade_counts[chunk].tolist()
+                ))
+            return len(timestamps)
+        
+        return op
+    
+    def _record_bulk_write(self, rows: int, timeframe: str, start: float):
+        elapsed = time.perf_counter() - start
+        self.last_bulk_write = {
+            'rows': rows,
+            'seconds': elapsed,
+            'rows_per_sec': rows / elapsed if elapsed > 0 else 0.0
+        }
+        logger.debug(f"Inserted {rows} resampled bars for {timeframe} ({self.last_bulk_write['rows_per_sec']:,.0f} rows/sec)")
+    
+    def insert_resampled(self, df: pd.DataFrame, timeframe: str, chunk_size: int = 50000) -> int:
+        if df.empty:
+            return 0
+        
+        try:
+            start = time.perf_counter()
+            rows = self._write(self._resampled_op(df, timeframe, chunk_size), len(df))
+            self._record_bulk_write(rows, timeframe, start)
+            return rows
         except Exception as e:
             logger.error(f"Error inserting resampled data: {e}")
+            return 0
     
-    def get_resampled(self, symbol: str, timeframe: str, start_time: Optional[datetime] = None, limit: Optional[int] = 1000) -> pd.DataFrame:
-        query = """
-            SELECT timestamp, open, high, low, close, volume, trade_count
+    async def insert_resampled_async(self, df: pd.DataFrame, timeframe: str, chunk_size: int = 50000) -> int:
+        if df.empty:
+            return 0
+        
+        try:
+            start = time.perf_counter()
+            rows = await self._write_async(self._resampled_op(df, timeframe, chunk_size), len(df))
+            self._record_bulk_write(rows, timeframe, start)
+            return rows
+        except Exception as e:
+            logger.error(f"Error inserting resampled data: {e}")
+            return 0
+    
+    def get_resampled(self, symbol: str, timeframe: str, start_time: Optional[datetime] = None, limit: Optional[int] = 1000, columns: Optional[List[str]] = None, end_time: Optional[datetime] = None) -> pd.DataFrame:
+        columns = [c for c in (columns or BAR_FIELDS) if c in BAR_FIELDS]
+        if 'timestamp' not in columns:
+            columns = ['timestamp'] + columns
+        
+        query = f"""
+            SELECT {', '.join(columns)}
             FROM resampled
             WHERE symbol = ? AND timeframe = ?
         """
@@ -181,28 +723,168 @@ class DataStore:
         
         if start_time:
             query += " AND timestamp >= ?"
-            params.append(start_time)
+            params.append(to_epoch_ns(start_time))
+        
+        if end_time:
+            query += " AND timestamp <= ?"
+            params.append(to_epoch_ns(end_time))
         
         query += " ORDER BY timestamp DESC"
         
         if limit:
             query += f" LIMIT {limit}"
         
-        df = pd.read_sql_query(query, self.conn, params=params)
+        with self._reader() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
         
         if not df.empty:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
+            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ns')
             df = df.set_index('timestamp').sort_index()
         
+        if self.archive is not None and (not limit or len(df) < limit):
+            # Same bounds as the query. Archived bars may also be in SQLite (rewritten later), so
+            # the full limit is read and the overlap dropped below
+            archived = self.archive.read_bars(symbol, timeframe, start_time, end_time, columns, limit)
+            if not archived.empty:
+                archived = archived.set_index('timestamp')
+                df = pd.concat([archived, df]) if not df.empty else archived
+                # Bars rewritten after archiving are newer in SQLite
+                df = df[~df.index.duplicated(keep='last')].sort_index()
+                if limit:
+                    df = df.tail(limit)
+        
+        return df
+    
+    def get_closes(self, symbols: List[str], timeframe: str, limit: Optional[int] = 1000) -> pd.DataFrame:
+        # The latest closes of many symbols in one query, pivoted to a column per symbol.
+        # Timestamps missing for a symbol are NaN; each symbol keeps its own limit
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return pd.DataFrame()
+        
+        placeholders = ', '.join('?' for _ in symbols)
+        query = f"""
+            SELECT symbol, timestamp, close FROM (
+                SELECT symbol, timestamp, close,
+                       ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY timestamp DESC) AS rn
+                FROM resampled
+                WHERE timeframe = ? AND symbol IN ({placeholders})
+            )
+        """
+        params = [timeframe] + symbols
+        if limit:
+            query += " WHERE rn <= ?"
+            params.append(limit)
+        
+        with self._reader() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ns')
+        
+        if self.archive is not None:
+            # Symbols short of the limit in SQLite continue into the archive before their
+            # oldest stored bar
+            counts = df['symbol'].value_counts()
+            frames = [df]
+            for symbol in symbols:
+                count = int(counts.get(symbol, 0))
+                if limit and count >= limit:
+                    continue
+                end_time = df.loc[df['symbol'] == symbol, 'timestamp'].min() - pd.Timedelta(1, 'ns') if count else None
+                archived = self.archive.read_bars(symbol, timeframe, end_time=end_time, columns=['close'], limit=limit - count if limit else None)
+                if not archived.empty:
+                    frames.append(archived.assign(symbol=symbol))
+            df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else df
+        
+        return df.pivot(index='timestamp', columns='symbol', values='close').reindex(columns=symbols).sort_index()
+    
+    # Aligns both legs inside SQLite: the join probes the (symbol, timeframe, timestamp)
+    # primary key of leg b for every bar of leg a
+    PAIR_BARS_QUERY = f"""
+        SELECT a.timestamp, {', '.join(f'a.{c}' for c in PAIR_BAR_FIELDS)}, {', '.join(f'b.{c}' for c in PAIR_BAR_FIELDS)}
+        FROM resampled a
+        JOIN resampled b ON b.symbol = ? AND b.timeframe = a.timeframe AND b.timestamp = a.timestamp
+        WHERE a.symbol = ? AND a.timeframe = ?
+    """
+    PAIR_BAR_COLUMNS = [f"{c}_a" for c in PAIR_BAR_FIELDS] + [f"{c}_b" for c in PAIR_BAR_FIELDS]
+    
+    def _pair_frame(self, rows: list) -> pd.DataFrame:
+        df = pd.DataFrame.from_records(rows, columns=['timestamp'] + self.PAIR_BAR_COLUMNS)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ns')
+        return df.set_index('timestamp')
+    
+    def _archived_pair_bars(self, symbol_a: str, symbol_b: str, timeframe: str, start_time=None, end_time=None, limit: Optional[int] = None) -> pd.DataFrame:
+        archived_a = self.archive.read_bars(symbol_a, timeframe, start_time, end_time, limit=limit)
+        archived_b = self.archive.read_bars(symbol_b, timeframe, start_time, end_time, limit=limit)
+        if archived_a.empty or archived_b.empty:
+            return self._pair_frame([])
+        return archived_a.set_index('timestamp').join(
+            archived_b.set_index('timestamp'), how='inner', lsuffix='_a', rsuffix='_b'
+        )[self.PAIR_BAR_COLUMNS]
+    
+    def get_pair_bars(self, symbol_a: str, symbol_b: str, timeframe: str, limit: Optional[int] = 1000) -> pd.DataFrame:
+        query = self.PAIR_BARS_QUERY + " ORDER BY a.timestamp DESC"
+        params = [symbol_b, symbol_a, timeframe]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        with self._reader() as conn:
+            rows = conn.execute(query, params).fetchall()
+        df = self._pair_frame(rows[::-1])
+        
+        if self.archive is not None and (not limit or len(df) < limit):
+            remaining = limit - len(df) if limit else None
+            end_time = df.index[0] - pd.Timedelta(1, 'ns') if not df.empty else None
+            archived = self._archived_pair_bars(symbol_a, symbol_b, timeframe, end_time=end_time, limit=remaining)
+            if not archived.empty:
+                df = pd.concat([archived, df]) if not df.empty else archived
+        
         return df
     
+    def iter_pair_bars(self, symbol_a: str, symbol_b: str, timeframe: str, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, chunk_size: int = 50000):
+        # Yields aligned pair bars oldest first in bounded chunks: archived days, then
+        # SQLite pages using the last timestamp seen as the key for the next page
+        last_ns = to_epoch_ns(start_time) - 1 if start_time is not None else None
+        end_ns = to_epoch_ns(end_time) if end_time is not None else None
+        
+        if self.archive is not None:
+            for day in self.archive.bar_days(symbol_a, timeframe, start_time, end_time):
+                day_start = day if last_ns is None else max(day, pd.Timestamp(last_ns + 1, unit='ns'))
+                day_end = day + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+                if end_time is not None:
+                    day_end = min(day_end, pd.Timestamp(end_time))
+                
+                chunk = self._archived_pair_bars(symbol_a, symbol_b, timeframe, day_start, day_end)
+                if not chunk.empty:
+                    last_ns = to_epoch_ns(chunk.index[-1])
+                    yield chunk
+        
+        while True:
+            query = self.PAIR_BARS_QUERY
+            params = [symbol_b, symbol_a, timeframe]
+            if last_ns is not None:
+                query += " AND a.timestamp > ?"
+                params.append(last_ns)
+            if end_ns is not None:
+                query += " AND a.timestamp <= ?"
+                params.append(end_ns)
+            query += " ORDER BY a.timestamp LIMIT ?"
+            params.append(chunk_size)
+            
+            with self._reader() as conn:
+                rows = conn.execute(query, params).fetchall()
+            if not rows:
+                break
+            
+            last_ns = rows[-1][0]
+            yield self._pair_frame(rows)
+            if len(rows) < chunk_size:
+                break
+    
     def log_alert(self, alert_type: str, message: str, symbol: Optional[str] = None, value: Optional[float] = None, threshold: Optional[float] = None):
         try:
-            self.conn.execute("""
-                INSERT INTO alerts (timestamp, alert_type, symbol, message, value, threshold)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (datetime.now(), alert_type, symbol, message, value, threshold))
-            self.conn.commit()
+            row = (datetime.now(), alert_type, symbol, message, value, threshold)
+            self._write(lambda conn: conn.execute(ALERT_INSERT, row).rowcount, wait=False)
         except Exception as e:
             logger.error(f"Error logging alert: {e}")
     
@@ -214,7 +896,8 @@ class DataStore:
             LIMIT ?
         """
         
-        df = pd.read_sql_query(query, self.conn, params=[limit])
+        with self._reader() as conn:
+            df = pd.read_sql_query(query, conn, params=[limit])
         
         if not df.empty:
             df['timestamp'] = pd.to_datetime(df['timestamp'])
@@ -222,6 +905,34 @@ class DataStore:
         return df
     
     def close(self):
+        if self.writer is not None:
+            # Commits everything still queued before the thread exits
+            self.writer.close()
+        while True:
+            try:
+                self._read_pool.get_nowait().close()
+            except queue.Empty:
+                break
         if self.conn:
             self.conn.close()
             logger.info("Database connection closed")
+
+_shared_stores: Dict[str, DataStore] = {}
+_shared_lock = threading.Lock()
+
+def get_data_store(db_path: str = "market_data.db") -> DataStore:
+    # One store per database per process: tables are set up once, reads share
+    # the connection pool and all writes go through a single writer thread
+    key = str(Path(db_path).resolve())
+    with _shared_lock:
+        store = _shared_stores.get(key)
+        if store is None:
+            store = DataStore(db_path, async_writes=True)
+            _shared_stores[key] = store
+        return store
+
+def close_data_stores():
+    with _shared_lock:
+        for store in _shared_stores.values():
+            store.close()
+        _shared_stores.clear()
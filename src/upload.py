@@ -0,0 +1,129 @@
+import time
+import uuid
+import pandas as pd
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+import logging
+
+from src.archive import HAS_PYARROW
+from src.storage import DataStore
+
+if HAS_PYARROW:
+    import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+class UploadJob:
+    
+    def __init__(self, filename: str, symbol: str, timeframe: str, total_bytes: Optional[int] = None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.filename = filename
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.total_bytes = total_bytes
+        self.status = 'running'
+        self.error = None
+        self.rows_inserted = 0
+        self.rows_rejected = 0
+        self.chunks = 0
+        self.bytes_read = 0
+        self.started = time.time()
+        self.finished = None
+    
+    @property
+    def rows_per_sec(self) -> float:
+        elapsed = (self.finished or time.time()) - self.started
+        return self.rows_inserted / elapsed if elapsed > 0 else 0.0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'filename': self.filename,
+            'symbol': self.symbol,
+            'timeframe': self.timeframe,
+            'status': self.status,
+            'error': self.error,
+            'rows_inserted': self.rows_inserted,
+            'rows_rejected': self.rows_rejected,
+            'chunks': self.chunks,
+            'bytes_read': self.bytes_read,
+            'total_bytes': self.total_bytes,
+            'rows_per_sec': round(self.rows_per_sec)
+        }
+
+def read_ohlc_chunks(fileobj: BinaryIO, filename: str, chunk_size: int = 100000) -> Iterator[pd.DataFrame]:
+    name = filename.lower()
+    compression = None
+    if name.endswith('.gz'):
+        compression = 'gzip'
+        name = name[:-3]
+    
+    if name.endswith('.parquet'):
+        if not HAS_PYARROW:
+            raise ValueError("Parquet upload requires pyarrow")
+        for batch in pq.ParquetFile(fileobj).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif name.endswith('.csv'):
+        with pd.read_csv(fileobj, chunksize=chunk_size, compression=compression) as reader:
+            yield from reader
+    elif name.endswith('.ndjson'):
+        with pd.read_json(fileobj, lines=True, chunksize=chunk_size, compression=compression) as reader:
+            yield from reader
+    elif name.endswith('.json'):
+        # A JSON array can only be parsed whole; use NDJSON for large files
+        df = pd.read_json(fileobj, orient='records', compression=compression)
+        for offset in range(0, len(df), chunk_size):
+            yield df.iloc[offset:offset + chunk_size]
+    else:
+        raise ValueError("Unsupported file format. Use CSV, JSON, NDJSON or Parquet (optionally gzipped).")
+
+def normalize_ohlc_chunk(df: pd.DataFrame, symbol: str) -> Tuple[pd.DataFrame, int]:
+    if not all(col in df.columns for col in REQUIRED_COLUMNS):
+        # Try case-insensitive mapping
+        df.columns = [str(c).lower() for c in df.columns]
+        if not all(col in df.columns for col in REQUIRED_COLUMNS):
+            raise ValueError(f"Missing required columns: {REQUIRED_COLUMNS}")
+    
+    # Offsets are folded into UTC; naive timestamps keep their value
+    bars = pd.DataFrame({'timestamp': pd.to_datetime(df['timestamp'], errors='coerce', utc=True)})
+    for col in PRICE_COLUMNS:
+        bars[col] = pd.to_numeric(df[col], errors='coerce')
+    if 'trade_count' in df.columns:
+        bars['trade_count'] = pd.to_numeric(df['trade_count'], errors='coerce').fillna(0)
+    
+    bars['symbol'] = symbol
+    
+    # Rows with an unparseable timestamp or price are skipped and counted
+    valid = bars[REQUIRED_COLUMNS].notna().all(axis=1)
+    return bars[valid], int((~valid).sum())
+
+def ingest_ohlc_file(data_store: DataStore, fileobj: BinaryIO, job: UploadJob, chunk_size: int = 100000) -> UploadJob:
+    # Runs in a worker thread: parsing, validation and writes never touch the event loop
+    try:
+        for chunk in read_ohlc_chunks(fileobj, job.filename, chunk_size):
+            bars, rejected = normalize_ohlc_chunk(chunk, job.symbol)
+            if not bars.empty:
+                rows = data_store.insert_resampled(bars, job.timeframe)
+                if rows == 0:
+                    raise RuntimeError("Failed to write uploaded bars")
+                job.rows_inserted += rows
+            
+            job.rows_rejected += rejected
+            job.chunks += 1
+            try:
+                job.bytes_read = fileobj.tell()
+            except (OSError, ValueError):
+                pass
+        
+        job.status = 'completed'
+        logger.info(f"Uploaded {job.rows_inserted} {job.timeframe} bars for {job.symbol} ({job.rows_per_sec:,.0f} rows/sec)")
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        raise
+    finally:
+        job.finished = time.time()
+    
+    return job
@@ -0,0 +1,213 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A write operation runs against the writer's connection and returns a row count
+WriteOp = Callable[[sqlite3.Connection], int]
+
+class DatabaseWriter:
+    
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_latency: float = 0.05, max_batch_rows: int = 100000, max_pending_rows: int = 1000000):
+        self.connect = connect
+        # How long the first write of a group may wait for others to share its commit
+        self.max_latency = max_latency
+        self.max_batch_rows = max_batch_rows
+        # Producers block (or await) once this many rows are queued but not committed
+        self.max_pending_rows = max_pending_rows
+        self._queue: "queue.Queue[Optional[Tuple[WriteOp, int, Future]]]" = queue.Queue()
+        self._pending_rows = 0
+        self._pending = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.stats = {
+            'commits': 0,
+            'ops': 0,
+            'rows': 0,
+            'failed_ops': 0,
+            'backpressure_waits': 0,
+            'max_pending_rows': 0,
+            'last_group_ops': 0,
+            'last_commit_ms': 0.0
+        }
+    
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+            self._thread.start()
+    
+    def _try_reserve(self, rows: int) -> bool:
+        with self._pending:
+            # A single oversized write is let through when nothing else is pending
+            if self._pending_rows and self._pending_rows + rows > self.max_pending_rows:
+                return False
+            self._reserve_locked(rows)
+            return True
+    
+    def _reserve(self, rows: int):
+        with self._pending:
+            while self._pending_rows and self._pending_rows + rows > self.max_pending_rows and not self._closed:
+                self._pending.wait()
+            self._reserve_locked(rows)
+    
+    def _reserve_locked(self, rows: int):
+        self._pending_rows += rows
+        self.stats['max_pending_rows'] = max(self.stats['max_pending_rows'], self._pending_rows)
+    
+    def _release(self, rows: int):
+        with self._pending:
+            self._pending_rows -= rows
+            self._pending.notify_all()
+    
+    def _enqueue(self, op: WriteOp, rows: int) -> Future:
+        self.start()
+        future = Future()
+        # Checked under the lock the writer takes when it gives up, so nothing is queued
+        # after its final drain
+        with self._pending:
+            if self._closed:
+                self._pending_rows -= rows
+                raise RuntimeError("Database writer is closed")
+            self._queue.put((op, rows, future))
+        return future
+    
+    def submit(self, op: WriteOp, rows: int = 1) -> Future:
+        if not self._try_reserve(rows):
+            self.stats['backpressure_waits'] += 1
+            self._reserve(rows)
+        return self._enqueue(op, rows)
+    
+    async def submit_async(self, op: WriteOp, rows: int = 1) -> int:
+        if not self._try_reserve(rows):
+            # Wait for the writer to drain off the event loop instead of blocking it
+            self.stats['backpressure_waits'] += 1
+            await asyncio.to_thread(self._reserve, rows)
+        return await asyncio.wrap_future(self._enqueue(op, rows))
+    
+    def _collect_group(self, first: Tuple[WriteOp, int, Future]) -> Tuple[List[Tuple[WriteOp, int, Future]], bool]:
+        group = [first]
+        rows = first[1]
+        deadline = time.monotonic() + self.max_latency
+        
+        while rows < self.max_batch_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                return group, True
+            group.append(item)
+            rows += item[1]
+        
+        return group, False
+    
+    def _commit_group(self, conn: sqlite3.Connection, group: List[Tuple[WriteOp, int, Future]]):
+        start = time.perf_counter()
+        # Each op runs exactly once inside its own savepoint: a failing op is rolled back on
+        # its own and the rest still commit. Re-running ops would repeat their side effects
+        results = []
+        try:
+            conn.execute("BEGIN")
+            for op, _, _ in group:
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append(op(conn))
+                except Exception as e:
+                    if not conn.in_transaction:
+                        # SQLite already rolled back the whole transaction
+                        raise
+                    conn.execute("ROLLBACK TO op")
+                    results.append(e)
+                conn.execute("RELEASE op")
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            logger.error(f"Group commit of {len(group)} writes failed: {e}")
+            self._fail(group, e)
+            return
+        
+        succeeded = [result for result in results if not isinstance(result, Exception)]
+        self.stats['commits'] += 1
+        self.stats['ops'] += len(succeeded)
+        self.stats['rows'] += sum(succeeded)
+        self.stats['last_group_ops'] = len(group)
+        self.stats['last_commit_ms'] = (time.perf_counter() - start) * 1000
+        
+        for (_, rows, future), result in zip(group, results):
+            self._release(rows)
+            if isinstance(result, Exception):
+                self.stats['failed_ops'] += 1
+                logger.error(f"Database write failed: {result}")
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    
+    def _fail(self, group: List[Tuple[WriteOp, int, Future]], error: Exception):
+        for _, rows, future in group:
+            self.stats['failed_ops'] += 1
+            self._release(rows)
+            future.set_exception(error)
+    
+    def _run(self):
+        try:
+            conn = self.connect()
+        except Exception as e:
+            # Without a connection nothing can be written: refuse new writes and fail
+            # everything queued so callers waiting on a result do not hang
+            logger.error(f"Database writer could not connect: {e}")
+            with self._pending:
+                self._closed = True
+                queued = []
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        queued.append(item)
+                self._pending.notify_all()
+            self._fail(queued, e)
+            return
+        
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is None:
+                    break
+                group, stopping = self._collect_group(item)
+                self._commit_group(conn, group)
+        finally:
+            conn.close()
+    
+    def flush(self, timeout: Optional[float] = None):
+        # Queue a no-op and wait for it, so everything submitted before has been committed
+        if self._thread is not None and not self._closed:
+            self.submit(lambda conn: 0, rows=0).result(timeout)
+    
+    def close(self, timeout: float = 30.0):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+        with self._pending:
+            self._pending.notify_all()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['pending_rows'] = self._pending_rows
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_group_ops'] = stats['ops'] / stats['commits'] if stats['commits'] else 0.0
+        return stats
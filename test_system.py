@@ -11,11 +11,11 @@ print("Quant Pairs Trading Analytics - System Test")
 print("=" * 60)
 
 # Test 1: Import all modules
-print("\n[1/6] Testing imports...")
+print("\n[1/22] Testing imports...")
 try:
     from src.data_ingestion import BinanceWSCollector, TickBuffer
     from src.storage import DataStore
-    from src.resampler import DataResampler
+    from src.resampler import DataResampler, StreamingBarBuilder
     from src.analytics import PairsAnalytics
     from src.pipeline import MarketDataPipeline
     print("✅ All modules imported successfully")
@@ -24,8 +24,9 @@ except Exception as e:
     sys.exit(1)
 
 # Test 2: Database initialization
-print("\n[2/6] Testing database...")
+print("\n[2/22] Testing database...")
 try:
+    import pandas as pd
     db = DataStore(db_path="test_market_data.db")
     print("✅ Database initialized successfully")
     
@@ -44,13 +45,34 @@ try:
     ticks = db.get_ticks(symbol='btcusdt', limit=10)
     print(f"✅ Retrieved {len(ticks)} ticks")
     
+    stored = db.conn.execute("SELECT typeof(timestamp) FROM ticks LIMIT 1").fetchone()[0]
+    assert stored == 'integer' and db.conn.execute("PRAGMA user_version").fetchone()[0] == 2
+    assert ticks['timestamp'].iloc[0] == pd.Timestamp(test_tick['timestamp'])
+    
+    # Fast-path ticks carry integer epoch milliseconds
+    fast_time = pd.Timestamp('2024-01-01 00:00:00.123')
+    db.insert_ticks_batch([dict(test_tick, symbol='fastusdt', timestamp=fast_time.value // 1_000_000)])
+    assert db.get_ticks(symbol='fastusdt')['timestamp'].iloc[0] == fast_time
+    
+    # Pair bars are aligned in SQL: a bar missing on one leg drops out of the result
+    bar_times = pd.date_range('2024-01-01', periods=5, freq='1min')
+    for pair_symbol, closes in (('pair_a', [1, 2, 3, 4, 5]), ('pair_b', [10, 20, 30, 40, 50])):
+        bars = pd.DataFrame({'timestamp': bar_times, 'open': closes, 'high': closes, 'low': closes,
+                             'close': closes, 'volume': 1.0, 'symbol': pair_symbol})
+        if pair_symbol == 'pair_b':
+            bars = bars.drop(index=2)
+        db.insert_resampled(bars, '1m')
+    pair = db.get_pair_bars('pair_a', 'pair_b', '1m', limit=3)
+    assert list(pair['close_a']) == [2, 4, 5] and list(pair['close_b']) == [20, 40, 50]
+    print(f"✅ Pair bars aligned: {len(pair)} bars")
+    
     db.close()
 except Exception as e:
     print(f"❌ Database test failed: {e}")
     sys.exit(1)
 
 # Test 3: Resampler
-print("\n[3/6] Testing resampler...")
+print("\n[3/22] Testing resampler...")
 try:
     import pandas as pd
     import numpy as np
@@ -72,7 +94,7 @@ except Exception as e:
     sys.exit(1)
 
 # Test 4: Analytics
-print("\n[4/6] Testing analytics...")
+print("\n[4/22] Testing analytics...")
 try:
     analytics = PairsAnalytics()
     
@@ -96,12 +118,28 @@ try:
     corr = analytics.calculate_correlation(price_a, price_b)
     print(f"✅ Correlation calculated: {corr:.4f}")
     
+    # Test rolling hedge ratio against a direct fit of the last window
+    rolling = analytics.calculate_rolling_hedge_ratio(price_a, price_b, window=20)
+    last_beta, last_alpha, last_r2 = analytics.calculate_hedge_ratio_ols(price_a.iloc[-20:], price_b.iloc[-20:])
+    assert len(rolling) == len(price_a) - 19
+    assert np.allclose(rolling.iloc[-1].values, [last_beta, last_alpha, last_r2])
+    print(f"✅ Rolling hedge ratio calculated: {len(rolling)} windows")
+    
+    # Test online estimators: RLS without forgetting converges to the batch OLS fit
+    from src.analytics import RecursiveLeastSquares
+    rls = RecursiveLeastSquares(forgetting_factor=1.0)
+    for y, x in zip(price_a, price_b):
+        state = rls.update(y, x)
+    assert np.isclose(state['beta'], beta) and np.isclose(state['alpha'], alpha)
+    kalman_beta, _, _ = analytics.calculate_hedge_ratio(price_a, price_b, method='kalman')
+    print(f"✅ Online hedge ratio calculated: RLS β={state['beta']:.4f}, Kalman β={kalman_beta:.4f}")
+
 except Exception as e:
     print(f"❌ Analytics test failed: {e}")
     sys.exit(1)
 
 # Test 5: TickBuffer
-print("\n[5/6] Testing tick buffer...")
+print("\n[5/22] Testing tick buffer...")
 try:
     async def test_buffer():
         buffer = TickBuffer(max_size=1000)
@@ -118,6 +156,28 @@ try:
         size = await buffer.size()
         print(f"✅ Buffer test passed: {size} ticks stored")
         
+        ticks, start_seq, next_seq = await buffer.get_since(4)
+        assert (start_seq, next_seq) == (4, 10)
+        assert ticks['price'].tolist() == [43004 + i for i in range(6)]
+        ticks, _, _ = await buffer.get_since(next_seq)
+        assert ticks.empty
+        print(f"✅ Buffer cursor works: {len(ticks)} new ticks after cursor {next_seq}")
+        
+        ring = TickBuffer(max_size=8)
+        for i in range(13):
+            await ring.add({'timestamp': datetime.now(), 'symbol': 'ethusdt' if i % 2 else 'btcusdt', 'price': float(i), 'size': 1.0})
+        frame = await ring.get_all()
+        assert frame['price'].tolist() == [float(i) for i in range(5, 13)]
+        assert frame['symbol'].tolist()[:2] == ['ethusdt', 'btcusdt']
+        await ring.add_batch([
+            {'timestamp': 1704067200000 + i, 'symbol': 'btcusdt', 'price': float(100 + i), 'size': 1.0}
+            for i in range(5)
+        ])
+        frame = await ring.get_all()
+        assert frame['price'].tolist() == [10.0, 11.0, 12.0, 100.0, 101.0, 102.0, 103.0, 104.0]
+        assert frame['timestamp'].iloc[-1] == pd.Timestamp(1704067200004, unit='ms')
+        print(f"✅ Ring buffer wraps: kept last {len(frame)} of 18 ticks")
+        
         await buffer.clear()
         size_after = await buffer.size()
         print(f"✅ Buffer clear works: {size_after} ticks after clear")
@@ -128,7 +188,7 @@ except Exception as e:
     sys.exit(1)
 
 # Test 6: Pipeline initialization
-print("\n[6/6] Testing pipeline...")
+print("\n[6/22] Testing pipeline...")
 try:
     pipeline = MarketDataPipeline(
         symbols=['btcusdt', 'ethusdt'],
@@ -141,6 +201,741 @@ except Exception as e:
     print(f"❌ Pipeline test failed: {e}")
     sys.exit(1)
 
+# Test 7: Streaming bar builder
+print("\n[7/22] Testing streaming bar builder...")
+try:
+    ticks = pd.DataFrame({
+        'timestamp': pd.date_range(start='2024-01-01', periods=600, freq='250ms'),
+        'symbol': 'btcusdt',
+        'price': 43000 + np.random.randn(600).cumsum(),
+        'size': np.random.rand(600)
+    })
+    
+    builder = StreamingBarBuilder(['1s', '1m', '5m'])
+    for tick in ticks.to_dict(orient='records'):
+        builder.update(tick)
+    bars = builder.drain()
+    
+    for timeframe in ['1s', '1m', '5m']:
+        expected = resampler.resample_ticks(ticks, timeframe, 'btcusdt')
+        streamed = bars[timeframe].sort_values('timestamp').reset_index(drop=True)
+        assert len(streamed) == len(expected)
+        assert (streamed['timestamp'].values == expected['timestamp'].values).all()
+        for col in ['open', 'high', 'low', 'close', 'volume', 'trade_count']:
+            assert np.allclose(streamed[col].values, expected[col].values)
+    
+    assert builder.drain() == {}
+    
+    # Epoch-ms timestamps as NumPy ints (as read back from TickBuffer) build the same bars
+    ms_builder = StreamingBarBuilder(['1s', '1m', '5m'])
+    epoch_ms = ticks['timestamp'].values.astype('datetime64[ms]').astype(np.int64)
+    for tick, ts in zip(ticks.to_dict(orient='records'), epoch_ms):
+        ms_builder.update({**tick, 'timestamp': ts})
+    ms_bars = ms_builder.drain()
+    for timeframe in ['1s', '1m', '5m']:
+        assert (ms_bars[timeframe]['timestamp'].values == bars[timeframe]['timestamp'].values).all()
+    print(f"✅ Streaming bars match resampled bars ({len(bars['1s'])} x 1s, {len(bars['1m'])} x 1m)")
+except Exception as e:
+    print(f"❌ Streaming bar builder test failed: {e}")
+    sys.exit(1)
+
+# Test 8: Shared collector registry
+print("\n[8/22] Testing shared collector registry...")
+try:
+    from src.data_ingestion import CollectorRegistry
+    
+    class StubCollector:
+        def __init__(self, symbols, callback):
+            self.symbols = symbols
+            self.running = False
+        
+        async def start(self):
+            self.running = True
+        
+        async def stop(self):
+            self.running = False
+    
+    async def test_registry():
+        registry = CollectorRegistry(collector_factory=StubCollector)
+        received = {'a': [], 'b': []}
+        
+        async def callback_a(ticks):
+            received['a'].extend(t['symbol'] for t in ticks)
+        
+        async def callback_b(ticks):
+            received['b'].extend(t['symbol'] for t in ticks)
+        
+        await registry.acquire(['btcusdt', 'ethusdt'], callback_a, ['1s', '1m', '5m'])
+        await registry.acquire(['btcusdt', 'solusdt'], callback_b, ['1m', '1h'])
+        assert registry.get_status()['connections'] == 3
+        assert registry.refcount('btcusdt') == 2
+        
+        for symbol in ['btcusdt', 'ethusdt', 'solusdt']:
+            await registry._dispatch({'symbol': symbol})
+        assert received == {'a': ['btcusdt', 'ethusdt'], 'b': ['btcusdt', 'solusdt']}
+        
+        assert registry.is_owner('btcusdt', callback_a)
+        # Bars are owned per timeframe: only b builds btcusdt 1h, so b stores it
+        assert registry.is_bar_owner('btcusdt', '1m', callback_a)
+        assert registry.is_bar_owner('btcusdt', '1h', callback_b)
+        assert not registry.is_bar_owner('btcusdt', '1m', callback_b)
+        await registry.release(['btcusdt', 'ethusdt'], callback_a)
+        assert registry.is_owner('btcusdt', callback_b)
+        assert registry.is_bar_owner('btcusdt', '1m', callback_b)
+        assert registry.get_status()['connections'] == 2
+        
+        # A detached shared stream is replaced, not resubscribed, on the next acquire
+        shared = CollectorRegistry(collector_factory=StubCollector, multiplexed=True)
+        await shared.acquire(['btcusdt'], callback_a)
+        first = shared._shared_collector
+        shared.detach(['btcusdt'], callback_a)
+        await shared.acquire(['btcusdt'], callback_b)
+        assert shared._shared_collector is not first and shared.get_status()['connections'] == 1
+        print(f"✅ Shared symbols ingested once and fanned out: {registry.get_status()['symbols']}")
+    
+    asyncio.run(test_registry())
+except Exception as e:
+    print(f"❌ Collector registry test failed: {e}")
+    sys.exit(1)
+
+# Test 9: Combined-stream collector against a local replay server
+print("\n[9/22] Testing combined-stream collector...")
+try:
+    import os
+    import json
+    import time
+    import websockets
+    from datetime import timedelta
+    from urllib.parse import urlparse, parse_qs
+    from src.data_ingestion import BinanceCombinedStreamCollector
+    
+    def recorded_frame(symbol, price, trade_time):
+        return json.dumps({
+            'stream': f'{symbol}@trade',
+            'data': {'e': 'trade', 'E': trade_time, 'T': trade_time, 's': symbol.upper(),
+                     't': trade_time, 'p': str(price), 'q': '0.010', 'X': 'MARKET', 'm': True}
+        })
+    
+    async def replay_server(ws):
+        query = parse_qs(urlparse(ws.request.path).query)
+        streams = query.get('streams', [''])[0].split('/')
+        for i, stream in enumerate(streams):
+            await ws.send(recorded_frame(stream.split('@')[0], 100 + i, 1704067200000 + i))
+        
+        try:
+            async for message in ws:
+                request = json.loads(message)
+                await ws.send(json.dumps({'result': None, 'id': request['id']}))
+                if request['method'] == 'SUBSCRIBE':
+                    for stream in request['params']:
+                        await ws.send(recorded_frame(stream.split('@')[0], 200, 1704067201000))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+    
+    async def test_combined_stream():
+        received = []
+        
+        async def on_tick(tick):
+            received.append((tick['symbol'], tick['price']))
+        
+        async with websockets.serve(replay_server, '127.0.0.1', 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            collector = BinanceCombinedStreamCollector(['btcusdt', 'ethusdt'], on_tick, base_url=f'ws://127.0.0.1:{port}')
+            task = asyncio.create_task(collector.start())
+            
+            for _ in range(100):
+                if len(received) >= 2 and collector.ws is not None:
+                    break
+                await asyncio.sleep(0.02)
+            await collector.subscribe(['solusdt'])
+            for _ in range(100):
+                if len(received) >= 3:
+                    break
+                await asyncio.sleep(0.02)
+            
+            await collector.stop()
+            await task
+            
+            # A symbol added while the handshake is in flight is subscribed once connected
+            late = []
+            async def on_late_tick(tick):
+                late.append(tick['symbol'])
+            
+            collector = BinanceCombinedStreamCollector(['btcusdt'], on_late_tick, base_url=f'ws://127.0.0.1:{port}')
+            task = asyncio.create_task(collector.start())
+            await asyncio.sleep(0)
+            await collector.subscribe(['solusdt'])
+            for _ in range(100):
+                if len(late) >= 2:
+                    break
+                await asyncio.sleep(0.02)
+            await collector.stop()
+            await task
+        
+        assert late == ['btcusdt', 'solusdt']
+        assert received == [('btcusdt', 100.0), ('ethusdt', 101.0), ('solusdt', 200.0)]
+        print(f"✅ Combined stream routed {len(received)} ticks over one connection")
+    
+    asyncio.run(test_combined_stream())
+    
+    # Fast-decode timestamps follow the local UTC offset across a DST change like
+    # normalize_tick's datetimes do
+    previous_tz = os.environ.get('TZ')
+    os.environ['TZ'] = 'America/New_York'
+    time.tzset()
+    try:
+        dst_collector = BinanceCombinedStreamCollector(['btcusdt'], None)
+        epoch = datetime(1970, 1, 1)
+        # 2024-03-10 07:00 UTC: clocks in New York go from 02:00 EST to 03:00 EDT
+        for trade_time in (1710053999000, 1710054000000, 1710057600000):
+            raw = {'T': trade_time, 's': 'BTCUSDT', 'p': '1', 'q': '1', 'm': True}
+            expected = (dst_collector.normalize_tick(raw)['timestamp'] - epoch) // timedelta(milliseconds=1)
+            assert dst_collector.normalize_tick_fast(raw)['timestamp'] == expected
+    finally:
+        if previous_tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = previous_tz
+        time.tzset()
+except Exception as e:
+    print(f"❌ Combined-stream collector test failed: {e}")
+    sys.exit(1)
+
+# Test 10: Analytics cache
+print("\n[10/22] Testing analytics cache...")
+try:
+    from src.cache import AnalyticsCache
+    
+    cache = AnalyticsCache(max_entries=2)
+    key_1m = AnalyticsCache.make_key('BTCUSDT', 'ethusdt', '1m', 20, 200, 'ols')
+    key_5m = AnalyticsCache.make_key('btcusdt', 'ethusdt', '5m', 20, 200, 'ols')
+    key_sol = AnalyticsCache.make_key('btcusdt', 'solusdt', '1m', 20, 200, 'ols')
+    
+    assert cache.get(key_1m) is None
+    cache.put(key_1m, {'beta': 1.0}, compute_seconds=0.5)
+    cache.put(key_5m, {'beta': 2.0})
+    assert cache.get(key_1m) == {'beta': 1.0}
+    cache.put(key_sol, {'beta': 3.0})
+    assert cache.get(key_5m) is None
+    
+    stale_generation = cache.generation(key_1m)
+    assert cache.invalidate('ethusdt', '1m') == 1
+    assert cache.get(key_sol) == {'beta': 3.0}
+    cache.put(key_1m, {'beta': 1.5}, generation=stale_generation)
+    assert cache.get(key_1m) is None
+    
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (2, 3, 1)
+    print(f"✅ Cache LRU and invalidation work: hit rate {stats['hit_rate']:.0%}")
+except Exception as e:
+    print(f"❌ Analytics cache test failed: {e}")
+    sys.exit(1)
+
+print("\n[11/22] Testing analytics push broadcaster...")
+try:
+    import asyncio
+    from types import SimpleNamespace
+    from src.broadcast import AnalyticsBroadcaster
+    
+    hedge_ratio = {'beta': 1.0, 'alpha': 0.5, 'r_squared': 0.9}
+    results = [
+        {'timestamps': ['t0', 't1'], 'z_score': [0.1, 0.2], 'ohlcv_a': [{'time': 't0'}, {'time': 't1'}], 'hedge_ratio': hedge_ratio, 'half_life': 10.0},
+        {'timestamps': ['t0', 't1', 't2'], 'z_score': [0.1, 0.3, 0.4], 'ohlcv_a': [{'time': 't0'}, {'time': 't1'}, {'time': 't2'}], 'hedge_ratio': dict(hedge_ratio), 'half_life': 11.0}
+    ]
+    
+    async def compute(request):
+        return results[min(broadcaster.computations, len(results) - 1)]
+    
+    async def run_broadcast():
+        request = SimpleNamespace(symbol_a='BTCUSDT', symbol_b='ETHUSDT', timeframe='1m', window=20,
+                                  limit=200, regression_type='ols', z_score_threshold=2.0)
+        key, queue = await broadcaster.subscribe(request)
+        snapshot = await queue.get()
+        broadcaster.notify('1m', ['btcusdt'], closed=False)
+        broadcaster.notify('1m', ['btcusdt'], closed=True)
+        delta = await asyncio.wait_for(queue.get(), timeout=1)
+        broadcaster.unsubscribe(key, queue)
+        return snapshot, delta
+    
+    broadcaster = AnalyticsBroadcaster(compute)
+    snapshot, delta = asyncio.run(run_broadcast())
+    assert snapshot['type'] == 'snapshot' and snapshot['data']['half_life'] == 10.0
+    assert delta['type'] == 'delta' and delta['since'] == 't1'
+    assert delta['z_score'] == [0.3, 0.4] and len(delta['ohlcv_a']) == 2 and delta['half_life'] == 11.0
+    assert broadcaster.get_stats()['subscriptions'] == 0
+    
+    # A new hedge ratio changes every spread point, so the client gets a full snapshot
+    rehedged = dict(results[1], timestamps=['t0', 't1', 't2', 't3'], z_score=[0.2, 0.4, 0.5, 0.6],
+                    hedge_ratio={'beta': 1.1, 'alpha': 0.5, 'r_squared': 0.9})
+    resync = broadcaster.make_delta(results[1], rehedged)
+    assert resync['type'] == 'snapshot' and resync['data']['z_score'] == [0.2, 0.4, 0.5, 0.6]
+    print(f"✅ Broadcaster pushes snapshot then delta since {delta['since']}")
+except Exception as e:
+    print(f"❌ Broadcaster test failed: {e}")
+    sys.exit(1)
+
+print("\n[12/22] Testing Parquet tick archive...")
+try:
+    import os
+    import shutil
+    import tempfile
+    from src.archive import HAS_PYARROW
+    
+    if not HAS_PYARROW:
+        print("⚠️  pyarrow not installed, skipping archive test")
+    else:
+        archive_root = tempfile.mkdtemp()
+        ds = DataStore(os.path.join(archive_root, "archive_test.db"))
+        
+        ts = pd.date_range('2024-01-01', periods=3 * 3600, freq='1s')
+        ticks = pd.DataFrame({
+            'timestamp': ts, 'symbol': 'btcusdt', 'price': np.arange(len(ts), dtype=float),
+            'size': 1.0, 'is_buyer_maker': False
+        })
+        # One taker order filling two makers at the same price gives two identical trades
+        ticks = pd.concat([ticks, ticks.iloc[:1]], ignore_index=True)
+        ds.insert_ticks_batch(ticks)
+        recent = ds.get_ticks('btcusdt', limit=5000)
+        
+        moved = ds.archive_ticks(hot_hours=1, now=datetime(2024, 1, 1, 3, 30))
+        assert moved == 2 * 3600 + 1
+        assert ds.conn.execute("SELECT COUNT(*) FROM ticks").fetchone()[0] == 3600
+        assert ds.get_ticks('btcusdt', limit=5000).equals(recent)
+        
+        window = ds.get_ticks('btcusdt', start_time=datetime(2024, 1, 1, 0, 10), end_time=datetime(2024, 1, 1, 0, 10, 59), columns=['price'])
+        assert list(window.columns) == ['timestamp', 'price'] and len(window) == 60
+        
+        # Re-archiving rows after an interrupted move does not duplicate them
+        from src.archive import TICK_ARCHIVE_COLUMNS
+        first_hour = ds.archive.read_ticks('btcusdt', end_time=datetime(2024, 1, 1, 0, 59, 59), columns=TICK_ARCHIVE_COLUMNS)
+        assert len(first_hour) == 3601
+        ds.archive.write_ticks('btcusdt', first_hour)
+        assert len(ds.archive.read_ticks('btcusdt', end_time=datetime(2024, 1, 1, 0, 59, 59))) == 3601
+        
+        # Retention moves old bars to the archive; ranged reads stay inside their bounds
+        from src.storage import RetentionPolicy
+        days = pd.date_range('2024-01-01', periods=20, freq='1D')
+        ds.insert_resampled(pd.DataFrame({'timestamp': days, 'symbol': 'btcusdt', 'open': 1.0, 'high': 1.0,
+                                          'low': 1.0, 'close': np.arange(20.0), 'volume': 1.0}), '1d')
+        retention = ds.apply_retention(RetentionPolicy(bar_days={}, archive_bar_days=7), now=datetime(2024, 1, 20, 12))
+        assert retention['bars_archived'] == 12
+        ranged = ds.get_resampled('btcusdt', '1d', start_time=datetime(2024, 1, 3), end_time=datetime(2024, 1, 5), limit=10)
+        assert ranged['close'].tolist() == [2.0, 3.0, 4.0]
+        assert len(ds.get_resampled('btcusdt', '1d', limit=None)) == 20
+        
+        ds.close()
+        shutil.rmtree(archive_root)
+        print(f"✅ Archived {moved} ticks to Parquet, reads combine archive and SQLite")
+except Exception as e:
+    print(f"❌ Archive test failed: {e}")
+    sys.exit(1)
+
+print("\n[13/22] Testing group-commit writer...")
+try:
+    import os
+    import tempfile
+    from datetime import timedelta
+    
+    writer_dir = tempfile.mkdtemp()
+    writer_db = os.path.join(writer_dir, "writer_test.db")
+    
+    async def run_writer():
+        ds = DataStore(writer_db, async_writes=True)
+        start = datetime(2024, 1, 1)
+        batches = [
+            [{'timestamp': start + timedelta(seconds=k, microseconds=i), 'symbol': 'btcusdt',
+              'price': 100.0, 'size': 1.0, 'is_buyer_maker': False} for i in range(50)]
+            for k in range(40)
+        ]
+        rows = await asyncio.gather(*[ds.insert_ticks_batch_async(b) for b in batches])
+        failed = await asyncio.gather(
+            ds._write_async(lambda conn: conn.execute("INSERT INTO missing_table VALUES (1)").rowcount),
+            return_exceptions=True
+        )
+        ds.log_alert('test', 'queued alert')
+        stats = ds.writer.get_stats()
+        ds.close()
+        return sum(rows), failed[0], stats
+    
+    total_rows, failure, writer_stats = asyncio.run(run_writer())
+    assert total_rows == 2000 and isinstance(failure, Exception)
+    assert writer_stats['commits'] < writer_stats['ops']
+    
+    # A failing write in a group is rolled back alone; every other write runs exactly once
+    import sqlite3
+    from src.writer import DatabaseWriter
+    
+    def group_connect():
+        conn = sqlite3.connect(os.path.join(writer_dir, "group_test.db"), check_same_thread=False)
+        conn.execute("CREATE TABLE IF NOT EXISTS t (x INTEGER)")
+        conn.commit()
+        return conn
+    
+    calls = []
+    def counted_insert(conn, value):
+        calls.append(value)
+        return conn.execute("INSERT INTO t VALUES (?)", (value,)).rowcount
+    
+    group_writer = DatabaseWriter(group_connect, max_latency=0.2)
+    futures = [group_writer.submit(lambda conn, v=v: counted_insert(conn, v)) for v in range(3)]
+    futures.insert(1, group_writer.submit(lambda conn: conn.execute("INSERT INTO missing_table VALUES (1)").rowcount))
+    futures += [group_writer.submit(lambda conn, v=v: counted_insert(conn, v)) for v in range(3, 5)]
+    assert [f.exception(timeout=5) is not None for f in futures] == [False, True, False, False, False, False]
+    assert sorted(calls) == [0, 1, 2, 3, 4] and group_writer.get_stats()['failed_ops'] == 1
+    group_writer.close()
+    assert group_connect().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 5
+    
+    # A writer that cannot connect fails its writes instead of leaving them waiting
+    def broken_connect():
+        raise sqlite3.OperationalError("unable to open database file")
+    broken_writer = DatabaseWriter(broken_connect)
+    try:
+        broken_writer.submit(lambda conn: 0).result(timeout=5)
+        assert False, "write on a broken writer succeeded"
+    except (sqlite3.OperationalError, RuntimeError):
+        pass
+    broken_writer.flush(timeout=5)
+    
+    from src.storage import get_data_store, close_data_stores
+    ds = get_data_store(writer_db)
+    assert get_data_store(writer_db) is ds
+    assert ds.conn.execute("SELECT COUNT(*) FROM ticks").fetchone()[0] == 2000
+    assert len(ds.get_alerts()) == 1 and len(ds.get_ticks(limit=10)) == 10
+    assert ds._read_connections == 1
+    close_data_stores()
+    print(f"✅ Writer group-committed {writer_stats['ops']} writes in {writer_stats['commits']} commits")
+except Exception as e:
+    print(f"❌ Writer test failed: {e}")
+    sys.exit(1)
+
+print("\n[14/22] Testing streaming export...")
+try:
+    from src.analytics import PairsAnalytics
+    from src.export import estimate_hedge_ratio, estimate_online_hedge_ratio, iter_spread_frames, iter_csv, split_frame
+    
+    np.random.seed(7)
+    idx = pd.date_range('2024-01-01', periods=1000, freq='1s')
+    close_b = pd.Series(2000 + np.cumsum(np.random.randn(1000)), index=idx)
+    close_a = 40000 + 15 * close_b + pd.Series(np.random.randn(1000) * 5, index=idx)
+    bars = pd.DataFrame({'close_a': close_a, 'close_b': close_b})
+    
+    analytics = PairsAnalytics()
+    beta, alpha, rows = estimate_hedge_ratio(split_frame(bars, 130))
+    ols_beta, ols_alpha, _ = analytics.calculate_hedge_ratio_ols(close_a, close_b)
+    assert rows == 1000 and np.isclose(beta, ols_beta) and np.isclose(alpha, ols_alpha)
+    
+    for method in ('kalman', 'rls'):
+        online_beta, online_alpha, online_rows = estimate_online_hedge_ratio(split_frame(bars, 130), method)
+        loaded_beta, loaded_alpha, _ = analytics.calculate_hedge_ratio_online(close_a, close_b, method)
+        assert online_rows == 1000 and np.isclose(online_beta, loaded_beta) and np.isclose(online_alpha, loaded_alpha)
+    
+    frames = list(iter_spread_frames(split_frame(bars, 130), beta, 20, analytics))
+    full_z = analytics.calculate_z_score(analytics.calculate_spread(close_a, close_b, beta), 20)
+    streamed_z = pd.concat(frames)['z_score']
+    assert len(frames) == 8 and np.allclose(streamed_z.values, full_z.values, equal_nan=True)
+    
+    csv_text = ''.join(iter_csv(frames))
+    assert csv_text.count('\n') == 1001
+    print(f"✅ Streamed {rows} rows in {len(frames)} chunks, z-score matches full computation")
+except Exception as e:
+    print(f"❌ Export test failed: {e}")
+    sys.exit(1)
+
+print("\n[15/22] Testing chunked upload ingestion...")
+try:
+    import io
+    import gzip
+    import tempfile
+    from src.upload import UploadJob, ingest_ohlc_file
+    
+    upload_dir = tempfile.mkdtemp()
+    upload_store = DataStore(os.path.join(upload_dir, "upload_test.db"))
+    
+    lines = ["Timestamp,Open,High,Low,Close,Volume"]
+    lines += [f"2024-01-01 00:{i // 60:02d}:{i % 60:02d},1,2,0.5,{100 + i},5" for i in range(250)]
+    lines.append("not-a-date,1,2,0.5,1,5")
+    payload = io.BytesIO(gzip.compress("\n".join(lines).encode()))
+    
+    job = UploadJob("history.csv.gz", "btcusdt", "1s")
+    ingest_ohlc_file(upload_store, payload, job, chunk_size=100)
+    assert (job.status, job.rows_inserted, job.rows_rejected, job.chunks) == ('completed', 250, 1, 3)
+    assert len(upload_store.get_resampled('btcusdt', '1s', limit=None)) == 250
+    
+    # ISO timestamps with an offset are stored as the same UTC instant
+    aware_lines = ["timestamp,open,high,low,close,volume"]
+    aware_lines += [f"2024-01-02T00:00:0{i}Z,1,2,0.5,{100 + i},5" for i in range(5)]
+    aware_lines.append("2024-01-02T01:00:05+01:00,1,2,0.5,105,5")
+    aware_job = UploadJob("aware.csv", "ethusdt", "1s")
+    ingest_ohlc_file(upload_store, io.BytesIO("\n".join(aware_lines).encode()), aware_job)
+    aware_bars = upload_store.get_resampled('ethusdt', '1s', limit=None)
+    assert (aware_job.status, aware_job.rows_inserted) == ('completed', 6)
+    assert aware_bars.index.min() == pd.Timestamp('2024-01-02 00:00:00')
+    assert aware_bars.index.max() == pd.Timestamp('2024-01-02 00:00:05')
+    upload_store.close()
+    print(f"✅ Uploaded {job.rows_inserted} bars in {job.chunks} chunks, {job.rows_rejected} rejected")
+except Exception as e:
+    print(f"❌ Upload test failed: {e}")
+    sys.exit(1)
+
+print("\n[16/22] Testing retention and compaction...")
+try:
+    from src.storage import RetentionPolicy
+    
+    retention_dir = tempfile.mkdtemp()
+    retention_store = DataStore(os.path.join(retention_dir, "retention_test.db"))
+    retention_store.archive = None
+    
+    idx = pd.date_range('2024-01-01', '2024-01-05', freq='1s', inclusive='left')
+    closes = 100 + np.arange(len(idx)) * 0.001
+    second_bars = pd.DataFrame({
+        'timestamp': idx, 'symbol': 'btcusdt', 'open': closes, 'high': closes + 0.5,
+        'low': closes - 0.5, 'close': closes + 0.1, 'volume': 1.0, 'trade_count': 2
+    })
+    retention_store.insert_resampled(second_bars, '1s')
+    retention_store.insert_ticks_batch(pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-04', '2024-01-05', freq='10s', inclusive='left'),
+        'symbol': 'btcusdt', 'price': 100.0, 'size': 1.0, 'is_buyer_maker': False
+    }))
+    
+    policy = RetentionPolicy(tick_hours=6, bar_days={'1s': 2}, batch_size=5000)
+    stats = retention_store.apply_retention(policy, now=datetime(2024, 1, 4, 23, 30))
+    assert stats['bars_deleted'] == 86400 and stats['bars_rolled_up'] == 1440
+    assert stats['ticks_deleted'] == 17 * 360 and stats['pages_freed'] > 0
+    
+    minute_bars = retention_store.get_resampled('btcusdt', '1m', limit=None)
+    expected = second_bars.set_index('timestamp').loc[:pd.Timestamp('2024-01-01 23:59:59')].resample('1min').agg(
+        {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+    )
+    assert np.allclose(minute_bars[expected.columns].to_numpy(), expected.to_numpy())
+    assert retention_store.get_resampled('btcusdt', '1s', limit=None).index[0] == pd.Timestamp('2024-01-02')
+    retention_store.close()
+    print(f"✅ Rolled up {stats['bars_rolled_up']} minutes, freed {stats['pages_freed']} pages")
+except Exception as e:
+    print(f"❌ Retention test failed: {e}")
+    sys.exit(1)
+
+print("\n[17/22] Testing hierarchical rollups...")
+try:
+    rollup_dir = tempfile.mkdtemp()
+    rollup_store = DataStore(os.path.join(rollup_dir, "rollup_test.db"))
+    rollup_store.archive = None
+    
+    idx = pd.date_range('2024-01-01', '2024-01-03', freq='1min', inclusive='left')
+    closes = 100 + np.random.randn(len(idx)).cumsum()
+    minute_bars = pd.DataFrame({
+        'timestamp': idx, 'symbol': 'ethusdt', 'open': closes, 'high': closes + np.random.rand(len(idx)),
+        'low': closes - np.random.rand(len(idx)), 'close': closes + 0.1, 'volume': np.random.rand(len(idx)), 'trade_count': 3
+    })
+    rollup_store.insert_resampled(minute_bars, '1m')
+    
+    assert DataResampler.rollup_source('4h', ['1s', '1m', '5m', '1h']) == '1h'
+    for timeframe, source in [('1h', '1m'), ('4h', '1h'), ('1d', '4h')]:
+        rollup_store.rollup_resampled('ethusdt', source, timeframe)
+        stored = rollup_store.get_resampled('ethusdt', timeframe, limit=None)
+        expected = resampler.rollup_bars(minute_bars, timeframe).set_index('timestamp')
+        assert len(stored) == len(expected)
+        for col in ['open', 'high', 'low', 'close', 'volume', 'trade_count']:
+            assert np.allclose(stored[col].values, expected[col].values)
+    
+    # A partial rebuild only touches the buckets it covers
+    assert rollup_store.rollup_resampled('ethusdt', '1m', '1h', datetime(2024, 1, 2, 5, 10), datetime(2024, 1, 2, 6, 20)) == 2
+    rollup_store.close()
+    print(f"✅ 1m -> 1h -> 4h -> 1d rollups match, {len(stored)} daily bars")
+except Exception as e:
+    print(f"❌ Rollup test failed: {e}")
+    sys.exit(1)
+
+print("\n[18/22] Testing pair screener...")
+try:
+    from src.screener import load_closes, screen_pairs
+    
+    screener_dir = tempfile.mkdtemp()
+    screener_store = DataStore(os.path.join(screener_dir, "screener_test.db"))
+    screener_store.archive = None
+    
+    idx = pd.date_range('2024-01-01', periods=400, freq='1min')
+    trend = np.random.randn(400).cumsum()
+    universe = {
+        'aaausdt': 100 + 2 * trend + np.random.randn(400) * 0.2,
+        'bbbusdt': 50 + trend + np.random.randn(400) * 0.2,
+        'cccusdt': 80 + np.random.randn(400).cumsum(),
+        'dddusdt': 20 + np.random.randn(400).cumsum()
+    }
+    for symbol, closes in universe.items():
+        screener_store.insert_resampled(pd.DataFrame({
+            'timestamp': idx, 'symbol': symbol, 'open': closes, 'high': closes, 'low': closes, 'close': closes, 'volume': 1.0
+        }), '1m')
+    
+    short = pd.Series(np.arange(10.0) + 1, index=idx[-10:])
+    screener_store.insert_resampled(pd.DataFrame({
+        'timestamp': short.index, 'symbol': 'eeeusdt', 'open': short.values, 'high': short.values, 'low': short.values, 'close': short.values, 'volume': 1.0
+    }), '1m')
+    
+    matrix = screener_store.get_closes(list(universe) + ['eeeusdt', 'zzzusdt'], '1m', limit=300)
+    assert list(matrix.columns) == list(universe) + ['eeeusdt', 'zzzusdt'] and len(matrix) == 300
+    assert np.allclose(matrix['aaausdt'].values, screener_store.get_resampled('aaausdt', '1m', limit=300)['close'].values)
+    assert matrix['eeeusdt'].count() == 10 and matrix['zzzusdt'].isna().all()
+    
+    closes = load_closes(screener_store, list(universe) + ['eeeusdt', 'zzzusdt'], '1m')
+    ranked = screen_pairs(closes, min_correlation=0.0)
+    assert closes.shape == (400, 4) and list(closes.columns) == list(universe) and len(ranked) == 6
+    
+    best = ranked.iloc[0]
+    ols_beta, _, _ = analytics.calculate_hedge_ratio_ols(closes['aaausdt'], closes['bbbusdt'])
+    assert (best['symbol_a'], best['symbol_b']) == ('aaausdt', 'bbbusdt') and best['is_stationary']
+    assert np.isclose(best['beta'], ols_beta)
+    screener_store.close()
+    print(f"✅ Screened {len(ranked)} pairs, best {best['symbol_a']}/{best['symbol_b']} (p={best['p_value']:.4f})")
+except Exception as e:
+    print(f"❌ Screener test failed: {e}")
+    sys.exit(1)
+
+print("\n[19/22] Testing compute pool jobs...")
+try:
+    from src.compute import ComputePool, _share_array, _run_job
+    
+    # Workers are spawned processes that re-import the main script, so this runs the
+    # worker side in-process: inputs round-trip through shared memory
+    spread = pd.Series(np.random.randn(300).cumsum() * 0.1 + np.random.randn(300))
+    shm, spec = _share_array(spread.to_numpy())
+    try:
+        shared_result = _run_job('adf', [spec])
+    finally:
+        shm.close()
+        shm.unlink()
+    local_result = analytics.adf_test(spread)
+    assert np.isclose(shared_result['adf_statistic'], local_result['adf_statistic'])
+    
+    # A pool that cannot take jobs falls back to computing locally
+    from src.analytics import ADF_POOL_MIN_BATCH
+    closed_pool = ComputePool(max_workers=2)
+    closed_pool.close()
+    pooled = PairsAnalytics(closed_pool)
+    batch = pooled.adf_test_many([spread] * ADF_POOL_MIN_BATCH)
+    assert len(batch) == ADF_POOL_MIN_BATCH and np.isclose(batch[-1]['p_value'], local_result['p_value'])
+    assert closed_pool.get_stats()['jobs'] == 0
+    print(f"✅ Shared-memory ADF job matches local result (stat={local_result['adf_statistic']:.3f})")
+except Exception as e:
+    print(f"❌ Compute pool test failed: {e}")
+    sys.exit(1)
+
+print("\n[20/22] Testing NumPy ADF engine...")
+try:
+    from statsmodels.tsa.stattools import adfuller
+    from src.adf import adf
+    
+    series = np.random.randn(500).cumsum() * 0.1 + np.random.randn(500)
+    expected = adfuller(series, autolag='AIC')
+    result = adf(series)
+    assert result['used_lag'] == expected[2] and result['nobs'] == expected[3]
+    assert np.isclose(result['adf_statistic'], expected[0])
+    assert np.isclose(result['p_value'], expected[1])
+    assert all(np.isclose(result['critical_values'][k], expected[4][k]) for k in expected[4])
+    
+    # Fixed-lag mode skips the search and uses exactly the given lag
+    expected_fixed = adfuller(series, maxlag=2, autolag=None)
+    fixed = adf(series, max_lag=2, autolag=False)
+    assert fixed['used_lag'] == 2 and np.isclose(fixed['adf_statistic'], expected_fixed[0])
+    assert 'error' in analytics.adf_test(pd.Series(np.ones(50)))
+    print(f"✅ ADF engine matches statsmodels (stat={result['adf_statistic']:.3f}, lag={result['used_lag']})")
+except Exception as e:
+    print(f"❌ ADF engine test failed: {e}")
+    sys.exit(1)
+
+print("\n[21/22] Testing rolling ADF and half-life...")
+try:
+    index = pd.date_range('2024-01-01', periods=300, freq='1min')
+    spread = pd.Series(50 + np.random.randn(300).cumsum() * 0.2 + np.random.randn(300), index=index)
+    rolling = analytics.calculate_rolling_adf(spread, 60)
+    half_lives = analytics.calculate_rolling_half_life(spread, 60)
+    assert rolling.index.equals(index) and half_lives.index.equals(index)
+    assert rolling['adf_statistic'].iloc[:59].isna().all()
+    
+    # Every window agrees with the one-off tests on the same slice
+    for end in (59, 150, 299):
+        window_slice = spread.iloc[end - 59:end + 1]
+        single = analytics.adf_test(window_slice, max_lag=1, autolag=False)
+        assert np.isclose(rolling['adf_statistic'].iloc[end], single['adf_statistic'])
+        assert np.isclose(rolling['p_value'].iloc[end], single['p_value'])
+        expected_half_life = analytics.calculate_half_life(window_slice)
+        assert np.isclose(half_lives.iloc[end], expected_half_life, equal_nan=True)
+    
+    # Windows too short for calculate_half_life give no rolling half-life either
+    assert analytics.calculate_rolling_half_life(spread, 9).isna().all()
+    assert np.isnan(analytics.calculate_half_life(spread.iloc[:9]))
+    print(f"✅ Rolling ADF matches per-window tests (last stat={rolling['adf_statistic'].iloc[-1]:.3f})")
+except Exception as e:
+    print(f"❌ Rolling ADF test failed: {e}")
+    sys.exit(1)
+
+print("\n[22/22] Testing incremental spread moments and bar-close alerts...")
+try:
+    from src.analytics import RollingMoments, RollingPairMoments
+    from src.pipeline import MarketDataPipeline
+    
+    values = 30000 + np.random.randn(200).cumsum() * 5
+    moments = RollingMoments(20)
+    live_z = [moments.update(v)['z_score'] for v in values]
+    rolling = pd.Series(values).rolling(20)
+    expected_z = ((pd.Series(values) - rolling.mean()) / rolling.std()).to_numpy()
+    assert np.allclose(live_z, expected_z, equal_nan=True)
+    
+    # Pair moments give the rolling z-score of a - beta * b for any beta, including an open bar
+    pair_b = 30000 + np.random.randn(120).cumsum() * 20
+    pair_a = 2 * pair_b + np.random.randn(120) * 5
+    pair_moments = RollingPairMoments(20)
+    for i in range(119):
+        pair_moments.update(pair_a[i], pair_b[i], i)
+    pair_spread = pd.Series(pair_a - 1.98 * pair_b)
+    expected_z = (pair_spread - pair_spread.rolling(20).mean()) / pair_spread.rolling(20).std()
+    assert np.isclose(pair_moments.spread_state(1.98)['z_score'], expected_z.iloc[118])
+    assert np.isclose(pair_moments.spread_state(1.98, (pair_a[119], pair_b[119]))['z_score'], expected_z.iloc[119])
+    assert np.isclose(pair_moments.beta, np.polyfit(pair_b[99:119], pair_a[99:119], 1)[0])
+    
+    store = DataStore(os.path.join(tempfile.mkdtemp(), "x.db"))
+    store.archive = None
+    live = MarketDataPipeline(['aaausdt', 'bbbusdt'], data_store=store, z_score_window=20, z_score_threshold=3.0, hedge_window=40)
+    live._init_online_estimators(['1m'])
+    
+    # A jump in one leg pushes |z| over the threshold; an alert fires on each crossing,
+    # not on every bar that stays above it
+    close_b = 100 + np.random.randn(60).cumsum() * 0.1
+    close_a = 2 * close_b + np.random.randn(60) * 0.01
+    close_a[-3:] += 5
+    timestamps = pd.date_range('2024-01-01', periods=60, freq='1min')
+    above = []
+    for i, ts in enumerate(timestamps):
+        live._on_bars_closed('1m', pd.DataFrame({
+            'timestamp': [ts, ts],
+            'symbol': ['aaausdt', 'bbbusdt'],
+            'close': [close_a[i], close_b[i]]
+        }))
+        above.append(abs(live.get_spread_state('1m')['z_score']) > 3.0)
+    
+    state = live.get_spread_state('1m')
+    crossings = sum(1 for i, flag in enumerate(above) if flag and (i == 0 or not above[i - 1]))
+    alerts = store.get_alerts()
+    assert state['count'] == 20 and above[-3] and crossings >= 1
+    assert len(alerts) == crossings and (alerts['alert_type'] == 'Z-SCORE').all()
+    assert np.isclose(state['beta'], np.polyfit(close_b[-40:], close_a[-40:], 1)[0])
+    
+    # Analytics serve the latest z-score from the moments and agree with the chart series
+    bars = []
+    for symbol, closes in (('aaausdt', close_a), ('bbbusdt', close_b)):
+        bars.append(pd.DataFrame({'timestamp': timestamps, 'symbol': symbol, 'open': closes, 'high': closes,
+                                  'low': closes, 'close': closes, 'volume': 1.0}))
+    for frame in bars:
+        store.insert_resampled(frame, '1m')
+    for window in (20, 15):
+        result = live.calculate_pairs_analytics('aaausdt', 'bbbusdt', '1m', window=window, limit=60)
+        assert np.isclose(result['live_spread']['z_score'], result['z_score'].iloc[-1])
+    assert ('1m', 15) in live.pair_moments
+    store.close()
+    print(f"✅ Live z-score matches rolling z-score, {crossings} bar-close alert(s)")
+except Exception as e:
+    print(f"❌ Spread moments test failed: {e}")
+    sys.exit(1)
+
 print("\n" + "=" * 60)
 print("🎉 All tests passed! System is ready.")
 print("=" * 60)